@@ -1,40 +1,113 @@
-
 import asyncio
 import json
 import sys
 import os
+from concurrent.futures import ThreadPoolExecutor
 
-# Startup diagnostics to help debug environment issues when spawned by Node
-print(json.dumps({
-    'startup': True,
-    'executable': sys.executable,
-    'python_version': sys.version.split('\n')[0],
-    'argv': sys.argv
-}))
-
+ANDROIDTVREMOTE2_IMPORT_ERROR = None
 try:
-    from androidtvremote2 import AndroidTVRemote
+    from androidtvremote2 import AndroidTVRemote, CannotConnect, ConnectionClosed, InvalidAuth
     from androidtvremote2.certificate_generator import generate_selfsigned_cert
-    try:
-        # Print module path for clarity
-        import androidtvremote2 as _atr_mod
-        print(json.dumps({ 'androidtvremote2': getattr(_atr_mod, '__file__', 'built-in or package without __file__') }))
-    except Exception:
-        pass
 except ImportError as e:
-    print(json.dumps({ 'error': 'missing_dependency', 'module': 'androidtvremote2', 'message': str(e) }))
-    sys.exit(2)
+    ANDROIDTVREMOTE2_IMPORT_ERROR = e
 
-try:
-    from androidtv.setup import setup
-    from androidtv.constants import KEYS as ADB_KEYS
-    ANDROIDTV_AVAILABLE = True
-except ImportError:
-    ANDROIDTV_AVAILABLE = False
+# The ADB stack (androidtv, adb_shell, cryptography) is only needed for
+# older TVs, so it is imported on first use instead of at startup.
+_adb_modules = None
+
+def load_adb():
+    """Return (setup, KEYS) from the androidtv package, or None when it is not installed."""
+    global _adb_modules
+    if _adb_modules is None:
+        try:
+            from androidtv import setup
+            from androidtv.constants import KEYS
+            _adb_modules = (setup, KEYS)
+        except ImportError:
+            _adb_modules = False
+    return _adb_modules or None
+
+_adb_signer = None
+
+def load_adb_signer():
+    """(path, signer) for ~/.android/adbkey, read once per process; None without a key."""
+    global _adb_signer
+    if _adb_signer is None:
+        path = os.path.expanduser('~/.android/adbkey')
+        signer = False
+        if os.path.exists(path):
+            from androidtv.adb_manager.adb_manager_sync import ADBPythonSync
+            signer = (path, ADBPythonSync.load_adbkey(path))
+        _adb_signer = signer
+    return _adb_signer or None
+
+from bridge_host import run_single
+from ipc import log, write_message
+from key_hold import KeyHold, repeat_key
+from macros import handle_macro_command
+from metrics import SessionMetrics
+from paths import data_path
+from supervisor import (AuthRequired, ConnectionLost, DeviceError, NotConnected, ReconnectSupervisor,
+                        classify)
 
 # The path to the configuration file
-CERT_FILE = os.path.join(os.path.dirname(__file__), '../androidtv-cert.pem')
-KEY_FILE = os.path.join(os.path.dirname(__file__), '../androidtv-key.pem')
+CERT_FILE = data_path('androidtv-cert.pem')
+KEY_FILE = data_path('androidtv-key.pem')
+
+# ADB state refresh: fast right after a command (the state is likely to
+# change), stretching out while nothing changes.
+ADB_POLL_MIN = 3.0
+ADB_POLL_MAX = 30.0
+
+# Volume needs `dumpsys audio`, the heaviest read; only do it every Nth
+# refresh unless a volume key was just sent.
+ADB_VOLUME_EVERY = 4
+
+# Android KeyEvent codes for the key names below that androidtv's KEYS
+# table spells differently (UP, CENTER, MUTE) or lacks (media keys)
+ADB_KEYCODES = {
+    'DPAD_UP': 19, 'DPAD_DOWN': 20, 'DPAD_LEFT': 21, 'DPAD_RIGHT': 22, 'DPAD_CENTER': 23,
+    'POWER': 26, 'MUTE_VOLUME': 164,
+    'MEDIA_PLAY': 126, 'MEDIA_PAUSE': 127, 'MEDIA_STOP': 86, 'MEDIA_NEXT': 87,
+    'MEDIA_PREVIOUS': 88, 'MEDIA_REWIND': 89, 'MEDIA_FAST_FORWARD': 90,
+}
+
+# First connect timeout for androidtvremote2; later ones follow measured latency
+REMOTE_CONNECT_TIMEOUT = 5.0
+
+# How long pairing waits for the PIN shown on the TV before giving up
+PIN_TIMEOUT = 120.0
+
+# Common commands -> Android TV key names
+KEY_MAP = {
+    'up': 'DPAD_UP',
+    'down': 'DPAD_DOWN',
+    'left': 'DPAD_LEFT',
+    'right': 'DPAD_RIGHT',
+    'select': 'DPAD_CENTER',
+    'enter': 'DPAD_CENTER',
+    'back': 'BACK',
+    'home': 'HOME',
+    'menu': 'MENU',
+    'volume_up': 'VOLUME_UP',
+    'volume_down': 'VOLUME_DOWN',
+    'mute': 'MUTE_VOLUME',
+    'play': 'MEDIA_PLAY',
+    'pause': 'MEDIA_PAUSE',
+    'stop': 'MEDIA_STOP',
+    'next': 'MEDIA_NEXT',
+    'previous': 'MEDIA_PREVIOUS',
+    'rewind': 'MEDIA_REWIND',
+    'fast_forward': 'MEDIA_FAST_FORWARD',
+    'turn_off': 'POWER',
+    'turn_on': 'POWER',
+    'toggle': 'POWER'
+}
+
+
+def key_name(command):
+    return KEY_MAP.get(command.lower(), command.upper())
+
 
 def ensure_certificates():
     if not os.path.exists(CERT_FILE) or not os.path.exists(KEY_FILE):
@@ -46,16 +119,49 @@ def ensure_certificates():
             f.write(key_pem)
     return CERT_FILE, KEY_FILE
 
+def remote_error_types():
+    """androidtvremote2 exception classes -> typed device errors, for ``classify``."""
+    return (
+        ((ConnectionClosed,), ConnectionLost),
+        ((CannotConnect,), NotConnected),
+        ((InvalidAuth,), AuthRequired),
+    )
+
 class AndroidTVManager:
-    def __init__(self, ip):
+    # Bursts of the same key arrive as one request with a repeat count
+    accepts_repeat = True
+
+    def __init__(self, ip, emit):
         self.ip = ip
+        self.emit = emit
         self.remote = None
         self.protocol = None
         self.cert_path, self.key_path = ensure_certificates()
+        self.last_status = None
+        self.volume = 0
+        self.adb_executor = None
+        self.adb_keys = {}
+        self.adb_task = None
+        self.adb_wake = asyncio.Event()
+        self.adb_volume_due = True
+        self.adb_batch = []
+        self.adb_flusher = None
+        self.adb_repeat = None
+        self.pair_task = None
+        self.pin_future = None
+        self.hold = KeyHold(self.hold_press, self.hold_release)
+        # androidtvremote2 re-establishes dropped links itself; the supervisor
+        # retries the initial connect (and ADB) while commands are waiting.
+        self.metrics = SessionMetrics()
+        self.supervisor = ReconnectSupervisor(self.connect, emit, persistent=False, metrics=self.metrics,
+                                              timeouts={'connect': (REMOTE_CONNECT_TIMEOUT, 2.0, 15.0)})
 
     async def connect(self):
-        """Connect to the Android TV."""
-        print(json.dumps({"status": "debug", "message": f"Connecting to {self.ip}..."}), flush=True)
+        """Connect to the Android TV. Returns True once a protocol is up."""
+        if self.pairing():
+            # The pairing remote stays in use until the PIN arrives (or times out)
+            raise AuthRequired("Waiting for the pairing PIN shown on the TV")
+        self.emit({"status": "debug", "message": f"Connecting to {self.ip}..."})
         
         # Try AndroidTVRemote2 first (Google TV)
         try:
@@ -66,188 +172,380 @@ class AndroidTVManager:
                 host=self.ip
             )
             
-            # Add timeout to connection attempt
-            await asyncio.wait_for(self.remote.async_connect(), timeout=5.0)
+            await self.supervisor.timed(self.remote.async_connect(), 'connect')
             self.protocol = 'androidtvremote2'
-            print(json.dumps({"status": "connected", "protocol": "androidtvremote2"}), flush=True)
-            return
-        except (asyncio.TimeoutError, OSError, Exception) as e:
-            # Only catch pairing errors if we want to trigger pairing flow
-            if isinstance(e, Exception) and ("Need to pair" in str(e) or "InvalidAuth" in str(e)):
-                 print(json.dumps({"status": "pairing_required"}), flush=True)
-                 await self.pair()
-                 return
-
-            print(json.dumps({"status": "debug", "message": f"AndroidTVRemote2 failed: {e}. Trying ADB..."}), flush=True)
+            self.emit({"status": "connected", "protocol": "androidtvremote2"})
+            self.subscribe_remote()
+            return True
+        except Exception as e:
+            # An unpaired TV rejects the certificate. Pair in the background:
+            # waiting for a person must not hold up the supervisor's backoff.
+            if isinstance(e, InvalidAuth):
+                 self.emit({"status": "pairing_required"})
+                 self.start_pairing()
+                 raise AuthRequired("TV is not paired; enter the PIN shown on the TV") from e
+
+            self.emit({"status": "debug", "message": f"AndroidTVRemote2 failed: {e}. Trying ADB..."})
             self.remote = None
 
         # Try ADB (Older Android TV)
-        if ANDROIDTV_AVAILABLE:
+        adb = await asyncio.get_running_loop().run_in_executor(None, load_adb)
+        if adb:
+            setup, self.adb_keys = adb
             try:
-                # Run setup in executor as it might be blocking
                 loop = asyncio.get_running_loop()
-                # Use adbkey from home dir if exists, else let it generate/use default
-                adbkey = os.path.expanduser('~/.android/adbkey')
-                
-                self.remote = await loop.run_in_executor(None, lambda: setup(self.ip, port=5555, device_class='androidtv', adbkey=adbkey if os.path.exists(adbkey) else None))
-                
-                if await loop.run_in_executor(None, self.remote.adb_connect):
+                # ADB connections are not thread safe; every call for this
+                # device goes through one dedicated worker thread.
+                if self.adb_executor is None:
+                    self.adb_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'adb-{self.ip}')
+                # The key file is parsed once and the signer shared by every TV
+                adbkey, signer = (await loop.run_in_executor(self.adb_executor, load_adb_signer)) or (None, None)
+                self.remote = await loop.run_in_executor(self.adb_executor, lambda: setup(
+                    self.ip, port=5555, device_class='androidtv', adbkey=adbkey, signer=signer))
+
+                if await loop.run_in_executor(self.adb_executor, self.remote.adb_connect):
                     self.protocol = 'adb'
-                    print(json.dumps({"status": "connected", "protocol": "adb"}), flush=True)
-                    return
+                    self.emit({"status": "connected", "protocol": "adb"})
+                    self.adb_task = asyncio.create_task(self.adb_poll_loop())
+                    return True
                 else:
-                    print(json.dumps({"status": "failed", "error": "ADB connection failed"}), flush=True)
+                    self.emit({"status": "failed", "error": "ADB connection failed"})
             except Exception as e:
-                print(json.dumps({"status": "failed", "error": f"ADB error: {e}"}), flush=True)
+                self.emit({"status": "failed", "error": f"ADB error: {e}"})
         else:
-             print(json.dumps({"status": "failed", "error": "Connection failed and androidtv library not available"}), flush=True)
+             self.emit({"status": "failed", "error": "Connection failed and androidtv library not available"})
+        return False
+
 
+    def pairing(self):
+        return self.pair_task is not None and not self.pair_task.done()
+
+    def start_pairing(self):
+        if not self.pairing():
+            self.pair_task = asyncio.create_task(self.pair())
 
     async def pair(self):
         """Pair with the Android TV (AndroidTVRemote2 only)."""
         try:
             await self.remote.async_start_pairing()
-            print(json.dumps({"status": "waiting_for_pin"}), flush=True)
+            self.emit({"status": "waiting_for_pin"})
             
             self.pin_future = asyncio.get_running_loop().create_future()
-            pin = await self.pin_future
+            try:
+                pin = await asyncio.wait_for(self.pin_future, timeout=PIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise TimeoutError("No PIN entered") from None
             
             await self.remote.async_finish_pairing(pin)
-            print(json.dumps({"status": "paired"}), flush=True)
+            self.emit({"status": "paired"})
             
-            print(json.dumps({"status": "debug", "message": "Re-connecting after pairing..."}), flush=True)
+            self.emit({"status": "debug", "message": "Re-connecting after pairing..."})
             await self.remote.async_connect()
             self.protocol = 'androidtvremote2'
-            print(json.dumps({"status": "connected"}), flush=True)
+            self.emit({"status": "connected"})
+            self.subscribe_remote()
+            self.supervisor.mark_up()
             
         except Exception as e:
-            print(json.dumps({"status": "pairing_failed", "error": str(e)}), flush=True)
+            self.emit({"status": "pairing_failed", "error": str(e)})
+            # Drop the half-open pairing link; the next connect starts fresh
+            if self.remote and self.protocol is None:
+                remote, self.remote = self.remote, None
+                try:
+                    remote.disconnect()
+                except Exception:
+                    pass
+
+    def subscribe_remote(self):
+        """Have androidtvremote2 push power, app and volume changes to us."""
+        remote = self.remote
+        remote.add_is_on_updated_callback(lambda is_on: self.publish_status())
+        remote.add_current_app_updated_callback(lambda app: self.publish_status())
+        remote.add_volume_info_updated_callback(lambda info: self.publish_status())
+        remote.add_is_available_updated_callback(self.availability_changed)
+        # Let the library re-establish the link (and re-fire the callbacks) after drops
+        remote.keep_reconnecting()
+        self.publish_status()
+
+    def availability_changed(self, available):
+        if not available:
+            self.emit({"type": "connection_lost", "reason": "unavailable"})
+        self.publish_status()
+
+    def remote_state(self):
+        remote = self.remote
+        info = remote.volume_info or {}
+        if info.get('max'):
+            self.volume = round(info.get('level', 0) * 100 / info['max'])
+        return bool(remote.is_on), remote.current_app or '', 'unknown'
+
+    def adb_state(self):
+        """Cheap property reads on the ADB worker thread (no full update())."""
+        remote = self.remote
+        screen_on, awake, _ = remote.screen_on_awake_wake_lock_size()
+        on = bool(screen_on and awake)
+        app = remote.current_app() if on else None
+        if on and self.adb_volume_due:
+            self.adb_volume_due = False
+            _, _, _, level = remote.stream_music_properties()
+            if level is not None:
+                self.volume = round(level * 100)
+        return on, app or '', 'unknown' if on else 'stopped'
+
+    def build_status(self, on, app, playing_state):
+        """Same payload the Apple TV service produces."""
+        return {
+            'on': on,
+            'volume': self.volume,
+            'playing_state': playing_state,
+            'title': '',
+            'artist': '',
+            'album': '',
+            'app': app,
+            'artwork': None
+        }
+
+    def publish_status(self, state=None):
+        """Emit a status event if the state changed since the last one."""
+        if state is None:
+            if self.protocol != 'androidtvremote2' or not self.remote:
+                return False
+            state = self.remote_state()
+        status = self.build_status(*state)
+        if status == self.last_status:
+            return False
+        self.last_status = status
+        self.emit({"type": "status", "data": status})
+        return True
+
+    async def adb_poll_loop(self):
+        loop = asyncio.get_running_loop()
+        interval = ADB_POLL_MIN
+        rounds = 0
+        while self.protocol == 'adb':
+            rounds += 1
+            if rounds % ADB_VOLUME_EVERY == 0:
+                self.adb_volume_due = True
+            try:
+                with self.metrics.timer('status_fetch'):
+                    state = await loop.run_in_executor(self.adb_executor, self.adb_state)
+            except Exception as e:
+                self.emit({"status": "debug", "message": f"ADB state read failed: {e}"})
+                state = None
+            if state is not None and self.publish_status(state):
+                interval = ADB_POLL_MIN
+            else:
+                interval = min(interval * 1.5, ADB_POLL_MAX)
+            try:
+                await asyncio.wait_for(self.adb_wake.wait(), timeout=interval)
+                interval = ADB_POLL_MIN
+            except asyncio.TimeoutError:
+                pass
+            self.adb_wake.clear()
 
     async def handle_pin_input(self, pin):
         """Handle PIN input from stdin."""
-        if hasattr(self, 'pin_future') and not self.pin_future.done():
+        if self.pin_future and not self.pin_future.done():
             self.pin_future.set_result(pin)
 
-    async def handle_command(self, line):
-        """Handle a command from stdin."""
+    async def start(self):
+        self.supervisor.start()
+
+    async def close(self):
+        self.hold.close()
+        if self.pair_task:
+            self.pair_task.cancel()
+        if self.adb_repeat:
+            self.adb_repeat.cancel()
+        if self.adb_task:
+            self.adb_task.cancel()
+        if self.adb_flusher:
+            self.adb_flusher.cancel()
+        await self.supervisor.close()
+        if self.protocol == 'androidtvremote2' and self.remote:
+            self.remote.disconnect()
+        elif self.protocol == 'adb' and self.remote:
+            await asyncio.get_running_loop().run_in_executor(self.adb_executor, self.remote.adb_close)
+        if self.adb_executor:
+            self.adb_executor.shutdown(wait=False)
+        self.remote = None
+        self.protocol = None
+
+    async def handle(self, data):
+        """Handle one decoded request."""
+        # Check if this is a PIN for pairing
+        if data.get('type') == 'pin':
+            await self.handle_pin_input(data.get('pin'))
+            return
+        await self.handle_command(data)
+
+    async def adb_send_keys(self, codes):
+        """Queue key codes for the next batched `input keyevent` call and wait for it.
+
+        Every `input` invocation starts a JVM on the TV, which costs far more
+        than the key itself, so keys queued while one runs go out together in
+        the next call (`input keyevent` takes any number of key codes).
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.adb_batch.append((codes, future))
+        if self.adb_flusher is None or self.adb_flusher.done():
+            self.adb_flusher = asyncio.create_task(self.adb_flush())
+        await future
+
+    async def adb_flush(self):
+        loop = asyncio.get_running_loop()
+        while self.adb_batch:
+            batch, self.adb_batch = self.adb_batch, []
+            codes = ' '.join(str(code) for entry, _ in batch for code in entry)
+            error = None
+            try:
+                if not self.remote.available:
+                    raise ConnectionLost('ADB connection lost')
+                await loop.run_in_executor(self.adb_executor, self.remote.adb_shell, f'input keyevent {codes}')
+            except Exception as e:
+                error = e
+                if not self.remote.available:
+                    self.adb_lost()
+            for _, future in batch:
+                if future.done():
+                    continue
+                if error:
+                    future.set_exception(error)
+                else:
+                    future.set_result(None)
+
+    def adb_lost(self):
+        """The ADB link died; the supervisor reconnects on the next command."""
+        if self.protocol == 'adb':
+            self.protocol = None
+            self.emit({"type": "connection_lost", "reason": "adb"})
+            self.supervisor.link_lost()
+
+    async def send_command(self, command, repeat=1):
+        """Send one command as ``repeat`` key presses. Returns the key sent, raises on failure."""
+        key_to_send = key_name(command)
+
+        if self.protocol == 'androidtvremote2':
+            for _ in range(repeat):
+                if hasattr(self.remote, 'async_send_key_command'):
+                    await self.remote.async_send_key_command(key_to_send)
+                else:
+                    self.remote.send_key_command(key_to_send)
+        elif self.protocol == 'adb':
+            adb_key_code = self.adb_keys.get(key_to_send) or ADB_KEYCODES.get(key_to_send)
+            if not adb_key_code:
+                raise ValueError(f"Unknown key for ADB: {key_to_send}")
+            await self.adb_send_keys([adb_key_code] * repeat)
+            # The state probably just changed; refresh soon
+            if 'VOLUME' in key_to_send:
+                self.adb_volume_due = True
+            self.adb_wake.set()
+
+        return key_to_send
+
+    async def hold_press(self, command):
+        """Key down for a hold: a native long press, or steady repeats over ADB."""
+        await self.ensure_connected()
+        key = key_name(command)
+        if self.protocol == 'androidtvremote2':
+            self.remote.send_key_command(key, 'START_LONG')
+        elif self.protocol == 'adb':
+            code = self.adb_keys.get(key) or ADB_KEYCODES.get(key)
+            if not code:
+                raise ValueError(f"Unknown key for ADB: {key}")
+            self.adb_repeat = asyncio.create_task(repeat_key(lambda _: self.adb_send_keys([code]), key))
+
+    async def hold_release(self, command):
+        if self.adb_repeat:
+            self.adb_repeat.cancel()
+            self.adb_repeat = None
+        elif self.protocol == 'androidtvremote2' and self.remote:
+            try:
+                self.remote.send_key_command(key_name(command), 'END_LONG')
+            except ConnectionClosed:
+                pass
+
+    async def ensure_connected(self):
+        if self.protocol:
+            return
+        if not await self.supervisor.wait_up(self.supervisor.timeout('connect')) or not self.protocol:
+            raise NotConnected(f"Not connected to {self.ip}")
+
+    async def run_step(self, command, value):
+        """One step of a sequence or macro."""
+        await self.send_key(command)
+
+    async def send_key(self, command, repeat=1):
+        """``send_command`` under the adaptive command timeout, with failures typed."""
+        await self.ensure_connected()
+        try:
+            return await self.supervisor.timed(self.send_command(command, repeat), label=command)
+        except (asyncio.CancelledError, DeviceError, ValueError):
+            raise
+        except Exception as e:
+            raise (classify(e, remote_error_types()) or DeviceError(str(e))) from e
+
+    async def handle_command(self, data):
+        """Handle a command request."""
         try:
-            data = json.loads(line)
             command = data.get('command')
             value = data.get('value') # for future use
 
             if command:
                 if command == 'start_pairing':
-                    print(json.dumps({"status": "debug", "message": "Manual pairing requested"}), flush=True)
-                    asyncio.create_task(self.pair())
+                    self.emit({"status": "debug", "message": "Manual pairing requested"})
+                    self.start_pairing()
+                    return
+
+                if await handle_macro_command(self.run_step, self.emit, data):
+                    return
+
+                if await self.hold.handle(data):
+                    self.emit({"status": "ok", "command": command, "key": value, "protocol": self.protocol})
                     return
 
-                # Map common commands to Android TV key codes
-                key_map = {
-                    'up': 'DPAD_UP',
-                    'down': 'DPAD_DOWN',
-                    'left': 'DPAD_LEFT',
-                    'right': 'DPAD_RIGHT',
-                    'select': 'DPAD_CENTER',
-                    'enter': 'DPAD_CENTER',
-                    'back': 'BACK',
-                    'home': 'HOME',
-                    'menu': 'MENU',
-                    'volume_up': 'VOLUME_UP',
-                    'volume_down': 'VOLUME_DOWN',
-                    'mute': 'MUTE_VOLUME',
-                    'play': 'MEDIA_PLAY',
-                    'pause': 'MEDIA_PAUSE',
-                    'stop': 'MEDIA_STOP',
-                    'next': 'MEDIA_NEXT',
-                    'previous': 'MEDIA_PREVIOUS',
-                    'rewind': 'MEDIA_REWIND',
-                    'fast_forward': 'MEDIA_FAST_FORWARD',
-                    'turn_off': 'POWER',
-                    'turn_on': 'POWER',
-                    'toggle': 'POWER'
-                }
-                
-                key_to_send = key_map.get(command.lower(), command.upper())
-                
-                if self.protocol == 'androidtvremote2':
-                    if hasattr(self.remote, 'async_send_key_command'):
-                        await self.remote.async_send_key_command(key_to_send)
-                    else:
-                        self.remote.send_key_command(key_to_send)
-                elif self.protocol == 'adb':
-                    # ADB handling
-                    loop = asyncio.get_running_loop()
-                    adb_key_code = ADB_KEYS.get(key_to_send)
-                    
-                    if adb_key_code:
-                        await loop.run_in_executor(None, self.remote.adb_shell, f'input keyevent {adb_key_code}')
-                    else:
-                        # Fallback for POWER if not in KEYS (it usually is)
-                        if key_to_send == 'POWER':
-                             await loop.run_in_executor(None, self.remote.adb_shell, 'input keyevent 26')
-                        else:
-                             print(json.dumps({"status": "error", "message": f"Unknown key for ADB: {key_to_send}"}), flush=True)
-                             return
-
-                print(json.dumps({"status": "ok", "command": command, "sent": key_to_send, "protocol": self.protocol}), flush=True)
-
-        except json.JSONDecodeError:
-            print(json.dumps({"status": "error", "message": "Invalid JSON"}), flush=True)
+                key_to_send = await self.send_key(command, int(data.get('repeat') or 1))
+                self.emit({"status": "ok", "command": command, "sent": key_to_send, "protocol": self.protocol})
+
+        except DeviceError:
+            # Reported by the session host with its type
+            raise
         except Exception as e:
-            print(json.dumps({"status": "error", "message": str(e)}), flush=True)
+            self.emit({"status": "error", "message": str(e)})
+
 
+def create_session(ip, emit):
+    """Build a session for the bridge. Raises ImportError when androidtvremote2 is missing."""
+    if ANDROIDTVREMOTE2_IMPORT_ERROR:
+        raise ANDROIDTVREMOTE2_IMPORT_ERROR
+    return AndroidTVManager(ip, emit)
 
 
 async def main():
     if len(sys.argv) < 2:
-        print(json.dumps({"status": "error", "message": "IP address argument is required"}), flush=True)
+        write_message({"status": "error", "message": "IP address argument is required"})
         sys.exit(1)
 
     ip = sys.argv[1]
-    print(json.dumps({"status": "debug", "message": f"Starting Android TV Service for {ip}"}), flush=True)
-    manager = AndroidTVManager(ip)
-    
-    # Run the connection logic in a separate task
-    connect_task = asyncio.create_task(manager.connect())
-
-    # Listen for commands from stdin
-    loop = asyncio.get_running_loop()
-    print(json.dumps({"status": "debug", "message": "Entering stdin loop"}), flush=True)
-    while True:
-        try:
-            line = await loop.run_in_executor(None, sys.stdin.readline)
-            if not line:
-                print(json.dumps({"status": "debug", "message": "Stdin closed"}), flush=True)
-                break
-            
-            print(json.dumps({"status": "debug", "message": f"Received line: {line.strip()}"}), flush=True)
+    log('debug', f"Starting Android TV Service for {ip}")
+    await run_single(lambda emit: AndroidTVManager(ip, emit))
 
-            # Check if this is a PIN for pairing
-            try:
-                data = json.loads(line)
-                if data.get('type') == 'pin':
-                    await manager.handle_pin_input(data.get('pin'))
-                    continue
-            except (json.JSONDecodeError, AttributeError):
-                # Not a pin command, treat as regular command
-                pass
 
-            await manager.handle_command(line)
-        except Exception as e:
-            print(json.dumps({"status": "error", "message": f"Loop error: {e}"}), flush=True)
+if __name__ == "__main__":
+    # Startup diagnostics to help debug environment issues when spawned by Node
+    log('info', 'startup', executable=sys.executable, python_version=sys.version.split('\n')[0], argv=sys.argv)
 
-    # Wait for connection task if it's still running (unlikely if we break loop)
-    if not connect_task.done():
-        connect_task.cancel()
-        try:
-            await connect_task
-        except asyncio.CancelledError:
-            pass
+    if ANDROIDTVREMOTE2_IMPORT_ERROR:
+        write_message({ 'error': 'missing_dependency', 'module': 'androidtvremote2', 'message': str(ANDROIDTVREMOTE2_IMPORT_ERROR) })
+        sys.exit(2)
 
+    try:
+        import androidtvremote2 as _atr_mod
+        log('debug', 'androidtvremote2 location', path=getattr(_atr_mod, '__file__', 'built-in or package without __file__'))
+    except Exception:
+        pass
 
-if __name__ == "__main__":
     try:
         asyncio.run(main())
     except KeyboardInterrupt:
         pass
-
@@ -0,0 +1,161 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from paths import data_path
+
+# Pillow is imported on the first thumbnail, not at startup
+_image_module = None
+
+def load_pil():
+    """Return PIL.Image, or None when Pillow is not installed."""
+    global _image_module
+    if _image_module is None:
+        try:
+            from PIL import Image
+            _image_module = Image
+        except ImportError:
+            _image_module = False
+    return _image_module or None
+
+ARTWORK_DIR = data_path('artwork-cache')
+
+# Total bytes kept on disk (originals plus thumbnails) before the least
+# recently used artwork is evicted.
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+
+# Longest edge in pixels for each pre-scaled variant.
+THUMBNAIL_SIZES = {'small': 96, 'medium': 300}
+
+MIME_EXTENSIONS = {
+    'image/jpeg': 'jpg',
+    'image/jpg': 'jpg',
+    'image/png': 'png',
+    'image/gif': 'gif',
+    'image/webp': 'webp',
+}
+
+
+def artwork_key(data):
+    """Content hash used as the cache key and file name."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class ArtworkCache:
+    """Content-addressed on-disk artwork store with thumbnails and LRU eviction.
+
+    Each image is written once as ``<key>.<ext>`` with ``<key>_small.jpg`` and
+    ``<key>_medium.jpg`` next to it (when Pillow is installed). Consumers only
+    ever receive the key and read the files themselves.
+    """
+
+    def __init__(self, directory=ARTWORK_DIR, max_bytes=MAX_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> bytes on disk, oldest first
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        found = {}
+        for name in os.listdir(self.directory):
+            if name.startswith('.') or name.endswith('.tmp'):
+                continue
+            key = name.split('.', 1)[0].split('_', 1)[0]
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            size, mtime = found.get(key, (0, 0))
+            found[key] = (size + st.st_size, max(mtime, st.st_mtime))
+        for key, (size, _) in sorted(found.items(), key=lambda item: item[1][1]):
+            self.entries[key] = size
+            self.total_bytes += size
+
+    def _files(self, key):
+        prefix = key + '.'
+        variants = tuple(f'{key}_{name}.' for name in THUMBNAIL_SIZES)
+        return [os.path.join(self.directory, n) for n in os.listdir(self.directory)
+                if n.startswith(prefix) or n.startswith(variants)]
+
+    def _write(self, name, data):
+        path = os.path.join(self.directory, name)
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return len(data)
+
+    def _thumbnails(self, key, data):
+        Image = load_pil()
+        if Image is None:
+            return 0
+        import io
+        written = 0
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                img = img.convert('RGB')
+                for name, edge in THUMBNAIL_SIZES.items():
+                    thumb = img.copy()
+                    thumb.thumbnail((edge, edge))
+                    out = io.BytesIO()
+                    thumb.save(out, format='JPEG', quality=85)
+                    written += self._write(f'{key}_{name}.jpg', out.getvalue())
+        except Exception:
+            # Undecodable artwork is still served at its original size
+            pass
+        return written
+
+    def _touch(self, key):
+        self.entries.move_to_end(key)
+        for path in self._files(key):
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+
+    def _evict(self):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            for path in self._files(key):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def contains(self, key):
+        with self.lock:
+            if key in self.entries:
+                self._touch(key)
+                return True
+            return False
+
+    def put(self, data, mimetype=None):
+        """Store image bytes (once) and return their cache key."""
+        key = artwork_key(data)
+        with self.lock:
+            if key in self.entries:
+                self._touch(key)
+                return key
+            ext = MIME_EXTENSIONS.get((mimetype or '').lower(), 'jpg')
+            size = self._write(f'{key}.{ext}', data)
+            size += self._thumbnails(key, data)
+            self.entries[key] = size
+            self.total_bytes += size
+            self._evict()
+        return key
+
+
+_cache = None
+
+
+def get_cache():
+    """Process-wide cache shared by every session in the bridge."""
+    global _cache
+    if _cache is None:
+        _cache = ArtworkCache()
+    return _cache
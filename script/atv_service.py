@@ -3,6 +3,8 @@ import sys
 import json
 import os
 import argparse
+import ipaddress
+import time
 import warnings
 import logging
 from contextlib import contextmanager
@@ -21,243 +23,614 @@ def suppress_stderr():
         finally:
             sys.stderr = old_stderr
 
+PYATV_IMPORT_ERROR = None
 try:
     from pyatv import connect, scan
-    from pyatv.const import Protocol, PowerState, DeviceState
+    from pyatv.conf import AppleTV, ManualService
+    from pyatv.const import Protocol, PowerState, DeviceState, FeatureName, FeatureState, InputAction
+    from pyatv import exceptions as pyatv_errors
+except ImportError as e:
+    # Installing packages is Node's job (see installPythonDependency); never pip from here
+    PYATV_IMPORT_ERROR = e
+
+from bridge_host import run_single
+from ipc import write_message
+from key_hold import KeyHold
+from macros import handle_macro_command
+from artwork_cache import get_cache
+from credential_store import get_store
+from metrics import SessionMetrics
+from paths import data_path
+from supervisor import (AuthRequired, ConnectionLost, DeviceError, DeviceTimeout, NotConnected,
+                        NotSupported, ReconnectSupervisor, classify)
+
+try:
+    from discovery_registry import running_registry
 except ImportError:
-    import subprocess
-    print("pyatv module not found. Attempting to install...", file=sys.stderr)
+    def running_registry():
+        return None
+
+# Last scan result per IP, so reconnects can skip the mDNS scan
+SCAN_CACHE_FILE = data_path('appletv-scan-cache.json')
+
+# Cached service configs older than this are still used, but refreshed by a background scan
+SCAN_CACHE_TTL = 24 * 3600
+
+# Safety-net poll intervals (seconds). Devices that push updates are only
+# re-read occasionally; the rest are polled at the old Node-side rate.
+PUSH_FALLBACK_INTERVAL = 60.0
+POLL_INTERVAL = 10.0
+
+# Width requested from the device; thumbnails are derived from this image.
+ARTWORK_WIDTH = 600
+
+# Buttons pyatv can hold down (remote_control method per command; Node calls Home 'top_menu')
+HOLD_BUTTONS = {
+    'up': 'up', 'down': 'down', 'left': 'left', 'right': 'right',
+    'select': 'select', 'menu': 'menu', 'home': 'home', 'top_menu': 'home',
+}
+
+def pyatv_error_types():
+    """pyatv exception classes -> typed device errors, for ``classify``."""
+    return (
+        ((pyatv_errors.ConnectionLostError,), ConnectionLost),
+        ((pyatv_errors.ConnectionFailedError,), NotConnected),
+        ((pyatv_errors.AuthenticationError, pyatv_errors.NoCredentialsError), AuthRequired),
+        ((pyatv_errors.NotSupportedError, pyatv_errors.BlockedStateError), NotSupported),
+    )
+
+def find_device_conf(ip):
+    """Return the stored pairing entry for an IP (or device id), or None."""
+    return get_store('appletv').get(ip)
+
+def load_scan_cache():
+    if not os.path.exists(SCAN_CACHE_FILE):
+        return {}
     try:
-        subprocess.check_call([sys.executable, "-m", "pip", "install", "pyatv", "--break-system-packages" if sys.version_info >= (3, 11) else ""])
-        from pyatv import connect, scan
-        from pyatv.const import Protocol, PowerState, DeviceState
-        print("pyatv installed successfully.", file=sys.stderr)
-    except Exception as e:
-        print(f"Failed to automatically install pyatv: {e}", file=sys.stderr)
-        print("Please install it manually: pip3 install pyatv", file=sys.stderr)
-        sys.exit(1)
+        with open(SCAN_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
 
-CREDENTIALS_FILE = os.path.join(os.path.dirname(__file__), '../appletv-credentials.json')
+def save_scan_result(ip, conf):
+    """Persist the services found by a scan so the next connect can skip it."""
+    cache = load_scan_cache()
+    cache[ip] = {
+        'identifier': conf.identifier,
+        'name': conf.name,
+        'deep_sleep': conf.deep_sleep,
+        'scanned_at': time.time(),
+        'services': [
+            {
+                'identifier': service.identifier,
+                'protocol': service.protocol.name,
+                'port': service.port,
+                'properties': dict(service.properties),
+            }
+            for service in conf.services
+        ],
+    }
+    tmp = SCAN_CACHE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, SCAN_CACHE_FILE)
 
-async def main():
-    parser = argparse.ArgumentParser(description='Persistent Apple TV Control Service')
-    parser.add_argument('ip', help='IP address of the Apple TV to control')
-    args = parser.parse_args()
+def config_from_cache(ip, entry):
+    """Rebuild a pyatv configuration from a cached scan entry."""
+    conf = AppleTV(ipaddress.ip_address(ip), entry.get('name') or ip, deep_sleep=entry.get('deep_sleep', False))
+    for service in entry.get('services', []):
+        conf.add_service(ManualService(
+            service.get('identifier'),
+            Protocol[service['protocol']],
+            service['port'],
+            service.get('properties') or {},
+        ))
+    return conf
 
-    if not os.path.exists(CREDENTIALS_FILE):
-        print(json.dumps({"error": "Credentials file not found"}))
-        sys.exit(1)
+# Discovery service type -> (pyatv protocol name, TXT key pyatv uses as identifier)
+DISCOVERY_PROTOCOLS = {
+    '_mediaremotetv._tcp.local.': ('MRP', 'uniqueidentifier'),
+    '_companion-link._tcp.local.': ('Companion', 'rpmrtid'),
+    '_airplay._tcp.local.': ('AirPlay', 'deviceid'),
+}
 
-    with open(CREDENTIALS_FILE, 'r') as f:
-        creds_data = json.load(f)
+def entry_from_discovery(record):
+    """Convert a discovery registry record into a scan-cache entry, or None."""
+    services = []
+    for service_type, (protocol, id_key) in DISCOVERY_PROTOCOLS.items():
+        service = record['services'].get(service_type)
+        if not service:
+            continue
+        properties = service['properties']
+        identifier = next((v for k, v in properties.items() if k.lower() == id_key), None)
+        services.append({'identifier': identifier, 'protocol': protocol,
+                         'port': service['port'], 'properties': properties})
+    if not services:
+        return None
+    return {'name': record['name'], 'services': services, 'scanned_at': record.get('updated_at', 0)}
 
-    # Find credentials for this IP
-    device_conf = None
-    for d_id, d_conf in creds_data.items():
-        if d_conf.get('ip') == args.ip:
-            device_conf = d_conf
-            break
-            
-    if not device_conf:
-        print(json.dumps({"error": f"No credentials found for IP {args.ip}"}))
-        sys.exit(1)
-    
-    atv = None
-
-    async def connect_to_device():
-        nonlocal atv
-        if atv: return True
-        
-        print(json.dumps({"status": "scanning", "message": f"Scanning for {args.ip}..."}), flush=True)
+class StatusListener:
+    """Receives pyatv push, power, audio and connection callbacks for a session."""
+
+    def __init__(self, session):
+        self.session = session
+
+    def playstatus_update(self, updater, playstatus):
+        self.session.playing = playstatus
+        self.session.publish_status()
+
+    def playstatus_error(self, updater, exception):
+        # pyatv keeps retrying the push updater on its own
+        pass
+
+    def powerstate_update(self, old_state, new_state):
+        self.session.publish_status()
+
+    def volume_update(self, old_level, new_level):
+        self.session.publish_status()
+
+    def outputdevices_update(self, old_devices, new_devices):
+        pass
+
+    def connection_lost(self, exception):
+        self.session.connection_dropped(f"Connection lost: {exception}")
+
+    def connection_closed(self):
+        self.session.connection_dropped("Connection closed")
+
+class AppleTVSession:
+    """One persistent pyatv connection, driven by JSON commands.
+
+    Status is pushed: the session listens to pyatv's push updater and the
+    power/volume listeners and emits a ``status`` event only when the
+    reported state differs from the last one sent. A slow poll remains as
+    a fallback for devices or protocols that cannot push.
+    """
+
+    def __init__(self, ip, device_conf, emit):
+        self.ip = ip
+        self.device_conf = device_conf
+        self.emit = emit
+        self.atv = None
+        self.connect_lock = asyncio.Lock()
+        self.listener = StatusListener(self)
+        self.playing = None
+        self.push_enabled = False
+        self.last_status = None
+        self.poll_task = None
+        self.artwork_id = None
+        self.artwork_key = ''
+        self.artwork_task = None
+        self.rescan_task = None
+        self.hold_task = None
+        self.holding = False
+        self.hold = KeyHold(self.hold_press, self.hold_release)
+        # Connects and reconnects happen in the background; commands only wait
+        # for the link (or fail fast while the device is known to be down).
+        self.metrics = SessionMetrics()
+        self.supervisor = ReconnectSupervisor(self.connect_to_device, emit, metrics=self.metrics)
+
+    async def start(self):
+        self.supervisor.start()
+        self.poll_task = asyncio.create_task(self.poll_loop())
+
+    async def poll_loop(self):
+        """Fallback poll: catches updates the push listeners missed."""
+        while True:
+            await asyncio.sleep(PUSH_FALLBACK_INTERVAL if self.push_enabled else POLL_INTERVAL)
+            try:
+                if not self.atv:
+                    continue
+                self.playing = await self.fetch_playing()
+                self.publish_status()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+
+    def subscribe(self):
+        """Attach listeners and start pushing. Returns True when push updates are available."""
+        atv = self.atv
+        atv.listener = self.listener
+        for iface in (atv.power, atv.audio):
+            try:
+                iface.listener = self.listener
+            except Exception:
+                pass
         try:
-            with suppress_stderr():
-                atvs = await scan(loop=asyncio.get_event_loop(), hosts=[args.ip])
-            if not atvs:
-                print(json.dumps({"error": f"Could not find Apple TV at {args.ip}"}), flush=True)
+            if not atv.features.in_state(FeatureState.Available, FeatureName.PushUpdates):
                 return False
-            
-            conf = atvs[0]
-            protocol_str = device_conf.get('protocol')
-            if protocol_str == 'companion':
-                conf.set_credentials(Protocol.Companion, device_conf['credentials'])
-            elif protocol_str == 'mrp':
-                conf.set_credentials(Protocol.MRP, device_conf['credentials'])
-            elif protocol_str == 'airplay':
-                conf.set_credentials(Protocol.AirPlay, device_conf['credentials'])
-            
-            print(json.dumps({"status": "connecting", "message": "Connecting..."}), flush=True)
-            with suppress_stderr():
-                atv = await connect(conf, loop=asyncio.get_event_loop())
-            print(json.dumps({"status": "connected", "message": "Connected successfully"}), flush=True)
+            atv.push_updater.listener = self.listener
+            atv.push_updater.start()
             return True
-        except Exception as e:
-            print(json.dumps({"error": f"Connection failed: {str(e)}"}), flush=True)
-            atv = None
+        except Exception:
             return False
 
-    # Initial connection attempt (don't exit on failure)
-    await connect_to_device()
+    def connection_dropped(self, reason):
+        atv, self.atv = self.atv, None
+        if not atv:
+            return
+        self.push_enabled = False
+        try:
+            atv.close()
+        except Exception:
+            pass
+        self.emit({"error": reason, "type": "connection_lost"})
+        self.supervisor.link_lost()
 
-    # Main loop
-    reader = asyncio.StreamReader()
-    protocol = asyncio.StreamReaderProtocol(reader)
-    await asyncio.get_event_loop().connect_read_pipe(lambda: protocol, sys.stdin)
+    async def scan_device(self):
+        """Scan the device's IP and refresh the scan cache. Returns the config or None."""
+        with suppress_stderr(), self.metrics.timer('scan'):
+            atvs = await scan(loop=asyncio.get_event_loop(), hosts=[self.ip])
+        if not atvs:
+            return None
+        try:
+            save_scan_result(self.ip, atvs[0])
+        except Exception:
+            pass
+        return atvs[0]
 
-    while True:
+    async def background_rescan(self):
         try:
-            line = await reader.readline()
-            if not line:
-                break
-            
-            line = line.decode().strip()
-            if not line:
-                continue
-                
-            try:
-                req = json.loads(line)
-            except json.JSONDecodeError:
-                print(json.dumps({"error": "Invalid JSON input"}), flush=True)
-                continue
-                
-            cmd = req.get('command')
-            val = req.get('value')
-            
-            # Ensure connected before executing command
-            if not atv:
-                if not await connect_to_device():
-                    # If still not connected, report error and skip command
-                    print(json.dumps({"error": "Not connected"}), flush=True)
-                    continue
+            await self.scan_device()
+        except Exception:
+            pass
 
-            # Execute command
-            try:
-                if cmd == 'turn_on':
-                    await atv.power.turn_on()
-                elif cmd == 'turn_off':
+    def apply_credentials(self, conf):
+        protocol_str = self.device_conf.get('protocol')
+        if protocol_str == 'companion':
+            conf.set_credentials(Protocol.Companion, self.device_conf['credentials'])
+        elif protocol_str == 'mrp':
+            conf.set_credentials(Protocol.MRP, self.device_conf['credentials'])
+        elif protocol_str == 'airplay':
+            conf.set_credentials(Protocol.AirPlay, self.device_conf['credentials'])
+
+    async def open_connection(self, conf):
+        self.apply_credentials(conf)
+        self.emit({"status": "connecting", "message": "Connecting..."})
+        with suppress_stderr():
+            self.atv = await self.supervisor.timed(connect(conf, loop=asyncio.get_event_loop()), 'connect')
+        self.push_enabled = self.subscribe()
+        self.emit({"status": "connected", "message": "Connected successfully", "push": self.push_enabled})
+
+    async def connect_to_device(self):
+        """One connect attempt: cached scan, discovery registry, then a fresh scan. Raises on failure."""
+        async with self.connect_lock:
+            if self.atv: return True
+
+            # Pick up re-pairing done by another process since the last connect
+            self.device_conf = find_device_conf(self.ip) or self.device_conf
+
+            # Fast path: connect straight from the cached scan result
+            entry = load_scan_cache().get(self.ip)
+            if entry:
+                try:
+                    await self.open_connection(config_from_cache(self.ip, entry))
+                    stale = time.time() - entry.get('scanned_at', 0) > SCAN_CACHE_TTL
+                    if stale and not (self.rescan_task and not self.rescan_task.done()):
+                        self.rescan_task = asyncio.create_task(self.background_rescan())
+                    return True
+                except Exception:
+                    # Ports or properties may have changed; fall back to a fresh scan
+                    self.atv = None
+
+            # Next best: the live discovery registry, when this process runs one
+            registry = running_registry()
+            record = registry.get(self.ip) if registry else None
+            entry = entry_from_discovery(record) if record else None
+            if entry:
+                try:
+                    conf = config_from_cache(self.ip, entry)
+                    await self.open_connection(conf)
+                except Exception:
+                    self.atv = None
+                else:
                     try:
-                        await atv.power.turn_off()
+                        save_scan_result(self.ip, conf)
                     except Exception:
-                        # Fallback to stop for AirPlay targets that don't support power off
-                        try:
-                            await atv.remote_control.stop()
-                        except: pass
-                        print(json.dumps({"status": "success", "command": cmd, "note": "fallback_stop"}), flush=True)
-                        continue
-                elif cmd == 'play':
-                    try:
-                        await atv.remote_control.play()
-                    except:
-                        await atv.remote_control.play_pause()
-                elif cmd == 'pause':
-                    try:
-                        await atv.remote_control.pause()
-                    except:
-                        await atv.remote_control.play_pause()
-                elif cmd == 'play_pause':
-                    await atv.remote_control.play_pause()
-                elif cmd == 'stop':
-                    await atv.remote_control.stop()
-                elif cmd == 'next':
-                    await atv.remote_control.next()
-                elif cmd == 'previous':
-                    await atv.remote_control.previous()
-                elif cmd == 'select':
-                    await atv.remote_control.select()
-                elif cmd == 'menu':
-                    await atv.remote_control.menu()
-                elif cmd == 'top_menu':
-                    await atv.remote_control.top_menu()
-                elif cmd == 'up':
-                    await atv.remote_control.up()
-                elif cmd == 'down':
-                    await atv.remote_control.down()
-                elif cmd == 'left':
-                    await atv.remote_control.left()
-                elif cmd == 'right':
-                    await atv.remote_control.right()
-                elif cmd == 'volume_up':
-                    await atv.audio.volume_up()
-                elif cmd == 'volume_down':
-                    await atv.audio.volume_down()
-                elif cmd == 'set_volume':
-                    if val is not None:
-                        await atv.audio.set_volume(float(val))
-                elif cmd == 'status':
-                    # Fetch status
-                    try:
-                        playing = await atv.metadata.playing()
-                    except Exception as e:
-                        playing = None
-                        # If fetching metadata fails, we might be disconnected
-                        # But let's not kill the connection immediately unless we are sure
                         pass
-                        
-                    vol = 0
-                    try:
-                        vol = atv.audio.volume
-                        if vol is None: vol = 0
-                    except: pass
-                    
-                    # Handle Power State
-                    is_on = True
-                    try:
-                        if hasattr(atv.power, 'power_state'):
-                            is_on = atv.power.power_state == PowerState.On
-                    except:
-                        is_on = True
-
-                    # Handle Playing State
-                    p_state_str = 'stopped'
-                    if playing:
-                        try:
-                            p_state_str = playing.device_state.name.lower()
-                            if playing.device_state in [DeviceState.Playing, DeviceState.Paused, DeviceState.Buffering]:
-                                is_on = True
-                        except:
-                            p_state_str = 'stopped'
-
-                    app_name = ''
-                    if playing and hasattr(playing, 'app') and playing.app:
-                        app_name = playing.app.name
-
-                    output = {
-                        'on': is_on, 
-                        'volume': vol,
-                        'playing_state': p_state_str,
-                        'title': playing.title if playing else '',
-                        'artist': playing.artist if playing else '',
-                        'album': playing.album if playing else '',
-                        'app': app_name
-                    }
-                    print(json.dumps({"type": "status", "data": output}), flush=True)
-                    continue 
-
-                print(json.dumps({"status": "success", "command": cmd}), flush=True)
+                    return True
 
+            self.emit({"status": "scanning", "message": f"Scanning for {self.ip}..."})
+            conf = await self.scan_device()
+            if not conf:
+                raise NotConnected(f"Could not find Apple TV at {self.ip}")
+            try:
+                await self.open_connection(conf)
             except Exception as e:
-                # Fallback logic for play/pause on Mac
-                if cmd == 'play' or cmd == 'pause':
-                    try:
-                        await atv.remote_control.play_pause()
-                        print(json.dumps({"status": "success", "command": cmd, "note": "fallback_toggle"}), flush=True)
-                    except Exception as e2:
-                        print(json.dumps({"error": str(e2)}), flush=True)
-                else:
-                    msg = str(e)
-                    if "blocked" in msg.lower() and device_conf.get('protocol') == 'airplay':
-                        msg += " (AirPlay protocol does not support remote control. Please re-pair your Apple TV to use MRP protocol.)"
-                    print(json.dumps({"error": msg}), flush=True)
-                    # If error message indicates connection loss, reset atv
-                    if "not connected" in str(e).lower() or "closed" in str(e).lower():
-                        atv = None
+                self.atv = None
+                raise self.device_error(e) from e
+            return True
+
+    def device_error(self, exc):
+        """Typed error for a pyatv failure."""
+        error = classify(exc, pyatv_error_types()) or DeviceError(str(exc))
+        if isinstance(error, NotSupported) and self.device_conf.get('protocol') == 'airplay':
+            return AuthRequired(f"{error} (AirPlay protocol does not support remote control. "
+                                "Please re-pair your Apple TV to use MRP protocol.)")
+        return error
+
+    async def ensure_connected(self):
+        if self.atv:
+            return
+        if not await self.supervisor.wait_up(self.supervisor.timeout('connect')) or not self.atv:
+            raise NotConnected(f"Not connected to {self.ip}")
 
+    async def run_command(self, cmd, val):
+        """``perform`` under the adaptive command timeout, with failures typed."""
+        try:
+            return await self.supervisor.timed(self.perform(cmd, val), label=cmd)
+        except (asyncio.CancelledError, DeviceTimeout):
+            raise
         except Exception as e:
-            print(json.dumps({"error": f"Loop error: {str(e)}"}), flush=True)
-            # Don't break the loop, just continue
-            continue
+            error = self.device_error(e)
+            if isinstance(error, (ConnectionLost, NotConnected)):
+                self.connection_dropped(str(error))
+            raise error from e
+
+    async def perform(self, cmd, val):
+        """Run one remote command. Returns an optional note, raises on failure."""
+        atv = self.atv
+        if cmd == 'turn_on':
+            await atv.power.turn_on()
+        elif cmd == 'turn_off':
+            try:
+                await atv.power.turn_off()
+            except Exception:
+                # Fallback to stop for AirPlay targets that don't support power off
+                try:
+                    await atv.remote_control.stop()
+                except: pass
+                return 'fallback_stop'
+        elif cmd == 'play':
+            try:
+                await atv.remote_control.play()
+            except:
+                await atv.remote_control.play_pause()
+        elif cmd == 'pause':
+            try:
+                await atv.remote_control.pause()
+            except:
+                await atv.remote_control.play_pause()
+        elif cmd == 'play_pause':
+            await atv.remote_control.play_pause()
+        elif cmd == 'stop':
+            await atv.remote_control.stop()
+        elif cmd == 'next':
+            await atv.remote_control.next()
+        elif cmd == 'previous':
+            await atv.remote_control.previous()
+        elif cmd == 'select':
+            await atv.remote_control.select()
+        elif cmd == 'menu':
+            await atv.remote_control.menu()
+        elif cmd == 'top_menu':
+            await atv.remote_control.top_menu()
+        elif cmd == 'up':
+            await atv.remote_control.up()
+        elif cmd == 'down':
+            await atv.remote_control.down()
+        elif cmd == 'left':
+            await atv.remote_control.left()
+        elif cmd == 'right':
+            await atv.remote_control.right()
+        elif cmd == 'volume_up':
+            await atv.audio.volume_up()
+        elif cmd == 'volume_down':
+            await atv.audio.volume_down()
+        elif cmd == 'set_volume':
+            if val is not None:
+                await atv.audio.set_volume(float(val))
+        return None
+
+    async def hold_press(self, cmd):
+        await self.ensure_connected()
+        button = HOLD_BUTTONS.get(cmd)
+        if button is None:
+            raise NotSupported(f"Cannot hold '{cmd}'")
+        if self.hold_task:
+            # The previous hold still finishes its last press
+            await asyncio.gather(self.hold_task, return_exceptions=True)
+        self.holding = True
+        self.hold_task = asyncio.create_task(self.keep_holding(button))
+
+    async def hold_release(self, cmd):
+        # The press in flight releases the button when its hold ends; it is
+        # not cancelled, so the button never stays down on the device
+        self.holding = False
+
+    async def keep_holding(self, button):
+        """Chain InputAction.Hold presses (about a second each) until the hold ends."""
+        press = getattr(self.atv.remote_control, button)
+        try:
+            while self.holding and self.atv:
+                await self.supervisor.timed(press(InputAction.Hold), record=False, label='hold')
+        except Exception as e:
+            self.holding = False
+            error = e if isinstance(e, DeviceError) else self.device_error(e)
+            if isinstance(error, (ConnectionLost, NotConnected)):
+                self.connection_dropped(str(error))
+            self.emit({**error.to_message(), 'command': 'hold_start'})
+
+    async def run_step(self, cmd, val):
+        """One step of a sequence or macro."""
+        await self.ensure_connected()
+        if cmd == 'status':
+            return
+        await self.run_command(cmd, val)
+
+    async def handle(self, req):
+        cmd = req.get('command')
+        val = req.get('value')
+
+        if await handle_macro_command(self.run_step, self.emit, req):
+            return
+
+        if await self.hold.handle(req):
+            self.emit({"status": "success", "command": cmd})
+            return
+
+        # Waits for the background connect; fails fast while the device is down
+        await self.ensure_connected()
+
+        if cmd == 'status':
+            # Explicit requests always get an answer: the session host turns an
+            # unchanged status into a snapshot instead of dropping it
+            self.playing = await self.fetch_playing()
+            self.publish_status(force=True)
+            return
+
+        try:
+            note = await self.run_command(cmd, val)
+        except DeviceError as e:
+            # Fallback logic for play/pause on Mac; a dead link is not worth a second try
+            if cmd not in ('play', 'pause') or isinstance(e, (ConnectionLost, NotConnected, DeviceTimeout)):
+                raise
+            await self.run_command('play_pause', None)
+            note = 'fallback_toggle'
+        if note:
+            self.emit({"status": "success", "command": cmd, "note": note})
+        else:
+            self.emit({"status": "success", "command": cmd})
+
+    async def fetch_playing(self):
+        try:
+            return await self.supervisor.timed(self.atv.metadata.playing(), label='status')
+        except Exception as e:
+            # If fetching metadata fails, we might be disconnected
+            # But let's not kill the connection immediately unless we are sure
+            return None
+
+    def build_status(self):
+        """Assemble the status payload from the latest playing info and cached properties."""
+        atv = self.atv
+        playing = self.playing
+
+        vol = 0
+        try:
+            vol = atv.audio.volume
+            if vol is None: vol = 0
+        except: pass
+
+        # Handle Power State
+        is_on = True
+        try:
+            if hasattr(atv.power, 'power_state'):
+                is_on = atv.power.power_state == PowerState.On
+        except:
+            is_on = True
+
+        # Handle Playing State
+        p_state_str = 'stopped'
+        if playing:
+            try:
+                p_state_str = playing.device_state.name.lower()
+                if playing.device_state in [DeviceState.Playing, DeviceState.Paused, DeviceState.Buffering]:
+                    is_on = True
+            except:
+                p_state_str = 'stopped'
+
+        app_name = ''
+        if playing and hasattr(playing, 'app') and playing.app:
+            app_name = playing.app.name
+
+        return {
+            'on': is_on,
+            'volume': vol,
+            'playing_state': p_state_str,
+            'title': playing.title if playing else '',
+            'artist': playing.artist if playing else '',
+            'album': playing.album if playing else '',
+            'app': app_name,
+            'artwork': self.artwork_key
+        }
+
+    def current_artwork_id(self):
+        try:
+            if not self.atv.features.in_state(FeatureState.Available, FeatureName.Artwork):
+                return ''
+            return self.atv.metadata.artwork_id or ''
+        except Exception:
+            return self.playing.hash if self.playing else ''
+
+    def check_artwork(self):
+        """Start an artwork fetch when the artwork identifier changed."""
+        artwork_id = self.current_artwork_id()
+        if artwork_id == self.artwork_id:
+            return
+        self.artwork_id = artwork_id
+        self.artwork_key = ''
+        if self.artwork_task and not self.artwork_task.done():
+            self.artwork_task.cancel()
+        if artwork_id:
+            self.artwork_task = asyncio.create_task(self.fetch_artwork(artwork_id))
+
+    async def fetch_artwork(self, artwork_id):
+        try:
+            artwork = await self.atv.metadata.artwork(width=ARTWORK_WIDTH, height=None)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return
+        if not artwork or not artwork.bytes:
+            return
+        loop = asyncio.get_running_loop()
+        # Hashing and thumbnailing are CPU work; keep them off the event loop
+        key = await loop.run_in_executor(None, get_cache().put, artwork.bytes, artwork.mimetype)
+        if self.artwork_id == artwork_id:
+            self.artwork_key = key
+            self.publish_status()
+
+    def publish_status(self, force=False):
+        """Emit a status event if the state changed since the last one (or when forced)."""
+        if not self.atv:
+            return
+        self.check_artwork()
+        status = self.build_status()
+        if not force and status == self.last_status:
+            return
+        self.last_status = status
+        self.emit({"type": "status", "data": status})
+
+    async def close(self):
+        self.hold.close()
+        self.holding = False
+        for task in (self.poll_task, self.artwork_task, self.rescan_task):
+            if task:
+                task.cancel()
+        await self.supervisor.close()
+        atv, self.atv = self.atv, None
+        if atv:
+            try:
+                atv.push_updater.stop()
+            except Exception:
+                pass
+            atv.close()
+
+def create_session(ip, emit):
+    """Build a session for the bridge. Raises when the device cannot be served."""
+    if PYATV_IMPORT_ERROR:
+        raise PYATV_IMPORT_ERROR
+    device_conf = find_device_conf(ip)
+    if not device_conf:
+        raise LookupError(f"No credentials found for IP {ip}")
+    return AppleTVSession(ip, device_conf, emit)
+
+async def main():
+    parser = argparse.ArgumentParser(description='Persistent Apple TV Control Service')
+    parser.add_argument('ip', help='IP address of the Apple TV to control')
+    args = parser.parse_args()
+
+    if PYATV_IMPORT_ERROR:
+        write_message({"error": "missing_dependency", "module": "pyatv", "message": str(PYATV_IMPORT_ERROR)})
+        sys.exit(1)
+
+    device_conf = find_device_conf(args.ip)
+    if not device_conf:
+        write_message({"error": f"No credentials found for IP {args.ip}"})
+        sys.exit(1)
 
-    if atv:
-        atv.close()
+    await run_single(lambda emit: AppleTVSession(args.ip, device_conf, emit))
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -42,6 +42,28 @@ class AuditLogManager {
         }
     }
 
+    // Timeline written by the Python bridge's flight recorder (<data dir>/flight-dumps/*.json):
+    // a JSON array of entries in the same { id, timestamp, source, action, details } format.
+    loadTimeline(file) {
+        try {
+            const entries = JSON.parse(fs.readFileSync(file, 'utf8'));
+            return Array.isArray(entries) ? entries : [];
+        } catch (err) {
+            console.error('AuditLogManager: Error loading timeline', err);
+            return [];
+        }
+    }
+
+    listTimelines() {
+        // Same directory as flight_recorder.py: paths.data_path(), which honours DELOVA_DATA_DIR
+        const dir = path.join(path.resolve(process.env.DELOVA_DATA_DIR || path.join(__dirname, '..')), 'flight-dumps');
+        try {
+            return fs.readdirSync(dir).filter(f => f.endsWith('.json')).sort().reverse().map(f => path.join(dir, f));
+        } catch (err) {
+            return [];
+        }
+    }
+
     getLogs(filter = {}) {
         // Implement filtering if needed
         return this.logs;
@@ -231,10 +231,15 @@ class AutomationManager extends EventEmitter {
             const type = action.type || (action.deviceId ? 'device' : (action.duration ? 'delay' : 'unknown'));
 
             try {
-                console.log(`[Automation] Action: ${type} -> ${action.deviceId || action.sceneName} : ${action.command}`);
+                console.log(`[Automation] Action: ${type} -> ${action.deviceId || action.group || action.sceneName} : ${action.command}`);
                 
                 if (type === 'device') {
                     await deviceManager.controlDevice(action.deviceId, action.command, action.value);
+                } else if (type === 'group') {
+                    // { type: 'group', group: 'all_tvs', command: 'turn_off' }: every device at once
+                    const results = await deviceManager.controlGroup(action.group, action.command, action.value);
+                    const failed = Object.keys(results).filter(id => !results[id].ok);
+                    if (failed.length) console.warn(`[Automation] Group '${action.group}' failed on: ${failed.join(', ')}`);
                 } else if (type === 'scene') {
                     // This was calling deviceManager.activateScene, but sceneManager is better if available. 
                     // But to avoid circular dependency, we might emit an event or rely on deviceManager proxy.
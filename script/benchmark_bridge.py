@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from bridge_service import SESSION_MODULES, missing_dependency
+from device_standins import STANDIN_TYPES, create_standin
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# One cheap, stateless command per session type
+BENCH_COMMANDS = {
+    'samsung': {'command': 'key', 'value': 'KEY_VOLUP'},
+    'androidtv': {'command': 'volume_up'},
+}
+
+# pyatv's fake Apple TV lives in its test suite and is not part of the wheel
+UNSUPPORTED = {'appletv': "no stand-in (pyatv's fake device ships only with its test suite)"}
+
+CONNECT_TIMEOUT = 60.0
+REQUEST_TIMEOUT = 15.0
+RECONNECT_TIMEOUT = 30.0
+RETRY_DELAY = 0.05
+
+
+class BridgeClient:
+    """A bridge_service.py process driven over its stdin/stdout protocol."""
+
+    def __init__(self, env):
+        self.env = env
+        self.proc = None
+        self.reader = None
+        self.pending = {}
+        self.waiters = []
+        self.next_id = 0
+
+    async def start(self):
+        self.proc = await asyncio.create_subprocess_exec(
+            sys.executable, os.path.join(SCRIPT_DIR, 'bridge_service.py'),
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL,
+            cwd=SCRIPT_DIR, env=self.env, limit=16 * 1024 * 1024)
+        self.reader = asyncio.create_task(self.read())
+        await self.wait_for(lambda m: m.get('bridge') == 'ready', CONNECT_TIMEOUT)
+
+    async def read(self):
+        async for line in self.proc.stdout:
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            future = self.pending.get(msg.get('id'))
+            if future and not future.done() and (msg.get('done') or msg.get('error')):
+                future.set_result(msg)
+            for predicate, waiter in list(self.waiters):
+                if not waiter.done() and predicate(msg):
+                    waiter.set_result(msg)
+
+    def send(self, msg):
+        self.proc.stdin.write((json.dumps(msg) + '\n').encode())
+
+    async def wait_for(self, predicate, timeout):
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (predicate, waiter)
+        self.waiters.append(entry)
+        try:
+            return await asyncio.wait_for(waiter, timeout)
+        finally:
+            self.waiters.remove(entry)
+
+    async def request(self, device, payload, timeout=REQUEST_TIMEOUT):
+        """Send one command and wait for its final reply (``done`` or an error)."""
+        self.next_id += 1
+        rid = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[rid] = future
+        try:
+            self.send({**payload, 'device': device, 'id': rid})
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            del self.pending[rid]
+
+    def rss_mb(self):
+        """Resident memory of the bridge process (Linux only, else None)."""
+        try:
+            with open(f'/proc/{self.proc.pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return round(int(line.split()[1]) / 1024, 1)
+        except OSError:
+            pass
+        return None
+
+    async def close(self):
+        try:
+            self.proc.stdin.close()
+            await asyncio.wait_for(self.proc.wait(), 10)
+        except (asyncio.TimeoutError, OSError):
+            self.proc.kill()
+        if self.reader:
+            self.reader.cancel()
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50_ms': None, 'p99_ms': None, 'max_ms': None}
+    ordered = sorted(samples)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+    return {
+        'p50_ms': round(pick(50) * 1000, 2),
+        'p99_ms': round(pick(99) * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+def prepare_data_dir(session_type, data_dir, ips):
+    """Pairing state the sessions expect, kept away from the real files."""
+    if session_type == 'samsung':
+        # A stored token makes the session connect up front, like a paired TV
+        with open(os.path.join(data_dir, 'samsung-tokens.json'), 'w') as f:
+            json.dump({ip: 'standin-token' for ip in ips}, f)
+
+
+async def connect_all(bridge, session_type, devices):
+    """Add every session and time until each reports connected."""
+    started = time.monotonic()
+    connected = {}
+
+    async def wait_connected(device):
+        await bridge.wait_for(lambda m: m.get('device') == device and m.get('status') == 'connected', CONNECT_TIMEOUT)
+        connected[device] = time.monotonic() - started
+
+    waits = [asyncio.create_task(wait_connected(device)) for device in devices]
+    for device in devices:
+        bridge.send({'op': 'add', 'device': device, 'type': session_type, 'ip': device.split(':', 1)[1]})
+    await asyncio.gather(*waits)
+    return list(connected.values())
+
+
+async def run_commands(bridge, session_type, devices, per_device):
+    """Every device runs ``per_device`` commands back to back, all devices at once."""
+    latencies = []
+    errors = 0
+
+    async def drive(device):
+        nonlocal errors
+        for _ in range(per_device):
+            started = time.monotonic()
+            reply = await bridge.request(device, BENCH_COMMANDS[session_type])
+            if reply.get('error'):
+                errors += 1
+            else:
+                latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(drive(device) for device in devices))
+    return latencies, errors, time.monotonic() - started
+
+
+async def measure_reconnect(bridge, session_type, devices, standins):
+    """Drop every link on the TV side and time until each device takes a command again.
+
+    A command only counts once it went over a new connection: right after the
+    drop a send can still "succeed" on the dead socket before the client notices.
+    """
+    before = [standin.connections for standin in standins]
+    await asyncio.gather(*(standin.drop() for standin in standins))
+    dropped = time.monotonic()
+
+    async def recover(device, standin, connections):
+        while time.monotonic() - dropped < RECONNECT_TIMEOUT:
+            try:
+                reply = await bridge.request(device, BENCH_COMMANDS[session_type])
+            except asyncio.TimeoutError:
+                continue
+            if not reply.get('error') and standin.connections > connections:
+                return time.monotonic() - dropped
+            await asyncio.sleep(RETRY_DELAY)
+        return None
+
+    results = await asyncio.gather(*(recover(*args) for args in zip(devices, standins, before)))
+    return [r for r in results if r is not None], sum(1 for r in results if r is None)
+
+
+async def run_scenario(session_type, count, per_device):
+    data_dir = tempfile.mkdtemp(prefix='delova-bench-')
+    standins = [create_standin(session_type, i, data_dir) for i in range(count)]
+    devices = [f'{session_type}:{standin.host}' for standin in standins]
+    prepare_data_dir(session_type, data_dir, [standin.host for standin in standins])
+    bridge = BridgeClient({**os.environ, 'DELOVA_DATA_DIR': data_dir})
+    try:
+        await asyncio.gather(*(standin.start() for standin in standins))
+        await bridge.start()
+        rss_start = bridge.rss_mb()
+        connect = await connect_all(bridge, session_type, devices)
+        rss_connected = bridge.rss_mb()
+        latencies, errors, wall = await run_commands(bridge, session_type, devices, per_device)
+        rss_loaded = bridge.rss_mb()
+        reconnect, unrecovered = await measure_reconnect(bridge, session_type, devices, standins)
+        return {
+            'type': session_type,
+            'devices': count,
+            'commands': len(latencies) + errors,
+            'errors': errors,
+            'throughput_per_s': round(len(latencies) / wall, 1) if wall else None,
+            'command': percentiles(latencies),
+            'connect': percentiles(connect),
+            'reconnect': {**percentiles(reconnect), 'unrecovered': unrecovered},
+            'rss_mb': {'bridge_ready': rss_start, 'connected': rss_connected, 'after_load': rss_loaded},
+            'keys_received': sum(standin.keys for standin in standins),
+        }
+    finally:
+        await bridge.close()
+        await asyncio.gather(*(standin.stop() for standin in standins), return_exceptions=True)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def print_result(result, as_json):
+    if as_json:
+        print(json.dumps(result), flush=True)
+    elif 'skipped' in result:
+        print(f"{result['type']:10} skipped ({result['skipped']})")
+    else:
+        print(f"{result['type']:10} {result['devices']:3} devices | "
+              f"{result['throughput_per_s']:8.1f} cmd/s | "
+              f"command p50 {result['command']['p50_ms']} / p99 {result['command']['p99_ms']} ms | "
+              f"connect p50 {result['connect']['p50_ms']} ms | "
+              f"reconnect p50 {result['reconnect']['p50_ms']} / p99 {result['reconnect']['p99_ms']} ms | "
+              f"rss {result['rss_mb']['after_load']} MB | errors {result['errors']}", flush=True)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description='Bridge throughput, latency, reconnect and memory against stand-in TVs')
+    parser.add_argument('--types', nargs='+', default=list(STANDIN_TYPES), choices=list(SESSION_MODULES))
+    parser.add_argument('--devices', nargs='+', type=int, default=[1, 10, 50])
+    parser.add_argument('--commands', type=int, default=50, help='Commands per device')
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per scenario')
+    args = parser.parse_args()
+
+    for session_type in args.types:
+        reason = UNSUPPORTED.get(session_type)
+        missing = missing_dependency(session_type)
+        if missing:
+            reason = f'{missing} not installed'
+        if reason:
+            print_result({'type': session_type, 'skipped': reason}, args.json)
+            continue
+        for count in args.devices:
+            try:
+                result = await run_scenario(session_type, count, args.commands)
+            except (OSError, RuntimeError, asyncio.TimeoutError) as e:
+                result = {'type': session_type, 'devices': count, 'skipped': f'{type(e).__name__}: {e}'}
+            print_result(result, args.json)
+
+if __name__ == '__main__':
+    asyncio.run(main())
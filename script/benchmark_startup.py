@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from bridge_service import SESSION_MODULES, missing_dependency
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# TEST-NET address: sessions are created but never reach a real device
+BENCH_IP = '192.0.2.1'
+
+REPLY_TIMEOUT = 60.0
+
+
+def time_import(module_name):
+    """Seconds for a fresh interpreter to import one module (interpreter start excluded)."""
+    code = f"import time; t = time.perf_counter(); import {module_name}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, '-c', code], cwd=SCRIPT_DIR, capture_output=True, text=True, timeout=REPLY_TIMEOUT)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'import failed')
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+class BridgeRun:
+    """One bridge process driven over stdin/stdout."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.proc = subprocess.Popen([sys.executable, os.path.join(SCRIPT_DIR, 'bridge_service.py')],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                     cwd=SCRIPT_DIR, text=True, bufsize=1)
+
+    def send(self, msg):
+        self.proc.stdin.write(json.dumps(msg) + '\n')
+        self.proc.stdin.flush()
+
+    def wait_for(self, predicate):
+        deadline = time.perf_counter() + REPLY_TIMEOUT
+        while time.perf_counter() < deadline:
+            line = self.proc.stdout.readline()
+            if not line:
+                raise RuntimeError('bridge exited')
+            try:
+                msg = json.loads(line)
+            except ValueError:
+                continue
+            if predicate(msg):
+                return msg
+        raise TimeoutError('no reply from bridge')
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+
+
+def time_session(session_type, warm):
+    """Seconds from spawning the bridge until a session of ``session_type`` is set up.
+
+    With ``warm`` the modules are preloaded first and only the session
+    creation itself is timed, which is what a TV added to a running bridge pays.
+    """
+    run = BridgeRun()
+    try:
+        run.wait_for(lambda m: m.get('bridge') == 'ready')
+        ready = time.perf_counter() - run.started
+        if warm:
+            run.send({"op": "preload", "types": [session_type]})
+            run.wait_for(lambda m: m.get('bridge') == 'preloaded')
+        device = f'{session_type}:{BENCH_IP}'
+        started = time.perf_counter()
+        run.send({"op": "add", "device": device, "type": session_type, "ip": BENCH_IP})
+        # Apple TV sessions without stored credentials fail setup; that still
+        # marks the point where the module was imported and the session built.
+        run.wait_for(lambda m: m.get('device') == device and (m.get('bridge') == 'added' or 'error' in m))
+        return ready, time.perf_counter() - started
+    finally:
+        run.close()
+
+
+def summarize(samples):
+    return {
+        'median_ms': round(statistics.median(samples) * 1000, 1),
+        'min_ms': round(min(samples) * 1000, 1),
+        'max_ms': round(max(samples) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cold/warm start benchmark for the device bridge services')
+    parser.add_argument('--types', nargs='+', default=list(SESSION_MODULES), choices=list(SESSION_MODULES))
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--json', action='store_true', help='Print one JSON object per service')
+    args = parser.parse_args()
+
+    for session_type in args.types:
+        missing = missing_dependency(session_type)
+        if missing:
+            result = {'type': session_type, 'skipped': f'{missing} not installed'}
+        else:
+            imports, bridge_ready, cold, warm = [], [], [], []
+            for _ in range(args.runs):
+                imports.append(time_import(SESSION_MODULES[session_type]))
+                ready, session = time_session(session_type, warm=False)
+                bridge_ready.append(ready)
+                cold.append(session)
+                warm.append(time_session(session_type, warm=True)[1])
+            result = {
+                'type': session_type,
+                'runs': args.runs,
+                'module_import': summarize(imports),
+                'bridge_ready': summarize(bridge_ready),
+                'cold_session': summarize(cold),
+                'warm_session': summarize(warm),
+            }
+
+        if args.json:
+            print(json.dumps(result), flush=True)
+        elif 'skipped' in result:
+            print(f"{session_type:10} skipped ({result['skipped']})")
+        else:
+            print(f"{session_type:10} import {result['module_import']['median_ms']:8.1f} ms | "
+                  f"bridge ready {result['bridge_ready']['median_ms']:7.1f} ms | "
+                  f"cold session {result['cold_session']['median_ms']:8.1f} ms | "
+                  f"warm session {result['warm_session']['median_ms']:6.1f} ms  (median of {args.runs})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,361 @@
+import asyncio
+import contextvars
+import time
+
+from flight_recorder import current_device, dump_if_slow, record
+from ipc import (drain_output, loads, log, message_taps, open_output, read_lines,
+                 set_log_level, write_message)
+from macros import sequence_timeout
+from metrics import SessionMetrics, sessions as metric_sessions
+from supervisor import DeviceError
+
+# Default per-command deadline. A device that does not answer within this
+# window gets an error reply and the session moves on to the next command.
+COMMAND_TIMEOUT = 15.0
+
+# Commands queued for a single session before new ones are rejected as busy.
+MAX_PENDING = 64
+
+# Read-only commands run beside a session's ordered lane instead of behind it,
+# so a slow status read never delays a keypress. Sessions may override this
+# with a ``concurrent_commands`` attribute.
+CONCURRENT_COMMANDS = frozenset({'status', 'list_macros', 'metrics', 'snapshot'})
+MAX_CONCURRENT = 8
+
+# Commands merged with an identical one still waiting in the queue. 'latest'
+# keeps only the newest value (absolute settings such as a volume slider);
+# 'repeat' folds a burst of the same relative key into one entry with a
+# count. Sessions may override this with a ``coalesce`` attribute, and
+# sessions that set ``accepts_repeat`` get a burst as one call with a
+# ``repeat`` count (to send it as one batch) instead of one call per repeat.
+COALESCE = {
+    'set_volume': 'latest',
+    **dict.fromkeys(('up', 'down', 'left', 'right', 'volume_up', 'volume_down', 'key'), 'repeat'),
+}
+
+# Minimum gap (seconds) between two coalescable commands sent to one device.
+# Bursts arriving faster wait in the queue, where they coalesce. Sessions
+# may set ``command_interval`` to the pace their devices keep up with.
+COMMAND_INTERVAL = 0.1
+
+# Message types whose ``data`` is device state. The host keeps the latest
+# value of every field and forwards only the fields that changed.
+STATE_TYPES = frozenset({'status', 'sensor'})
+
+# Id of the request being handled; every message emitted while handling it
+# echoes the id so the caller can match replies to requests.
+request_id = contextvars.ContextVar('request_id', default=None)
+
+# Set while an explicit ``status`` request is handled: its state is answered
+# even when nothing changed (as a snapshot, since the version did not move).
+state_requested = contextvars.ContextVar('state_requested', default=False)
+
+
+class QueuedCommand:
+    """A request waiting in a session's queue, plus the requests merged into it."""
+
+    __slots__ = ('req', 'merged', 'repeat')
+
+    def __init__(self, req):
+        self.req = req
+        self.merged = []
+        self.repeat = 1
+
+
+class SessionHost:
+    """Runs one device session behind its own command queue.
+
+    Every session gets a dedicated worker task, so a device that hangs on
+    connect or on a command only delays its own queue. Commands that depend
+    on order (key presses, sequences) go through that queue one at a time;
+    read-only ones run as separate tasks next to it.
+
+    Ordered commands listed in ``coalesce`` are paced to one per
+    ``command_interval``. A new one that matches the last command still
+    waiting is merged into it instead of queued: a newer ``set_volume``
+    replaces the pending value, and a repeated key raises the pending entry's
+    repeat count. Every merged request still gets its own final reply.
+
+    Per-command latency, error counts and whatever the session records in its
+    ``metrics`` go into one SessionMetrics, returned by the ``metrics`` command.
+
+    State messages (``STATE_TYPES``) are folded into the session's
+    authoritative state. Only changed fields are forwarded, as
+    ``{"type": ..., "version": n, "data": {changed fields}}``, and a message
+    that changes nothing is not forwarded at all, except in answer to an
+    explicit ``status`` request, which then gets a snapshot (below).
+    ``version`` grows by one per forwarded change, so a consumer that sees a gap has missed an event. It
+    can then send ``snapshot`` and get
+    ``{"type": "snapshot", "version": n, "data": {type: full state}}``.
+
+    Every request is stamped with ``received`` (``time.monotonic()``) when it
+    is submitted, so sessions can measure deadlines from its arrival rather
+    than from when its turn in the queue came.
+
+    A request may carry an ``id`` and a ``timeout`` (seconds). Messages the
+    session emits while handling it carry the same ``id``, and a final
+    ``{"id": ..., "done": true}`` marks completion. Timeouts and failures are
+    reported as errors with the id instead; a ``DeviceError`` raised by the
+    session keeps its ``type`` (and ``retry_in``) in that reply.
+    """
+
+    def __init__(self, device_id, factory, command_timeout=COMMAND_TIMEOUT, max_pending=MAX_PENDING):
+        self.device_id = device_id
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.session = factory(self.emit)
+        # Sessions with slow connect paths may ask for a longer deadline.
+        self.command_timeout = getattr(self.session, 'command_timeout', command_timeout)
+        self.concurrent_commands = getattr(self.session, 'concurrent_commands', CONCURRENT_COMMANDS)
+        self.coalesce = getattr(self.session, 'coalesce', COALESCE)
+        self.command_interval = getattr(self.session, 'command_interval', COMMAND_INTERVAL)
+        self.next_send = 0.0
+        self.tail = None
+        self.state = {}
+        self.state_version = 0
+        self.metrics = getattr(self.session, 'metrics', None) or SessionMetrics()
+        self.concurrency = asyncio.Semaphore(MAX_CONCURRENT)
+        self.side_tasks = set()
+        self.max_pending = max_pending
+        self.worker = None
+        self.starter = None
+
+    def emit(self, msg):
+        if msg.get('status') == 'debug':
+            # Diagnostics stay off the data channel (see ipc.log)
+            log('debug', msg.get('message'), device=self.device_id)
+            return
+        if msg.get('type') in STATE_TYPES and 'version' not in msg:
+            delta = self._state_delta(msg)
+            if delta is None and state_requested.get():
+                delta = self.snapshot()
+            if delta is None:
+                return
+            msg = delta
+        rid = request_id.get()
+        if rid is not None and 'id' not in msg:
+            msg = {'id': rid, **msg}
+        if self.device_id is not None:
+            msg = {'device': self.device_id, **msg}
+        write_message(msg)
+
+    def _state_delta(self, msg):
+        """Fold a state message into the session state; the delta to forward, or None."""
+        state = self.state.setdefault(msg['type'], {})
+        changes = {key: value for key, value in (msg.get('data') or {}).items()
+                   if key not in state or state[key] != value}
+        if not changes:
+            return None
+        state.update(changes)
+        self.state_version += 1
+        return {**msg, 'version': self.state_version, 'data': changes}
+
+    def snapshot(self):
+        return {'type': 'snapshot', 'version': self.state_version,
+                'data': {kind: dict(fields) for kind, fields in self.state.items()}}
+
+    def start(self):
+        metric_sessions[self.device_id or 'local'] = self.metrics
+        self.starter = asyncio.create_task(self._run_start())
+        self.worker = asyncio.create_task(self._run_worker())
+
+    async def _run_start(self):
+        current_device.set(self.device_id)
+        try:
+            await self.session.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.emit({'error': f'Session start failed: {e}'})
+
+    def metrics_snapshot(self):
+        snapshot = self.metrics.snapshot()
+        supervisor = getattr(self.session, 'supervisor', None)
+        if supervisor is not None:
+            snapshot['timeouts'] = {kind: round(supervisor.timeout(kind), 3) for kind in supervisor.latency}
+        return snapshot
+
+    def _reply(self, ids, msg):
+        """Emit a final reply for the current request and every request merged into it."""
+        self.emit(msg)
+        for rid in ids:
+            self.emit({'id': rid, **msg})
+
+    async def _pace(self):
+        wait = self.next_send - time.monotonic()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.next_send = time.monotonic() + self.command_interval
+
+    async def _execute(self, req, merged=(), repeat=1):
+        rid = req.get('id')
+        command = req.get('command')
+        merged = [m for m in merged if m is not None]
+        token = request_id.set(rid)
+        requested = state_requested.set(command == 'status')
+        started = time.monotonic()
+        error = None
+        try:
+            if command == 'metrics':
+                self.emit({'type': 'metrics', 'data': self.metrics_snapshot()})
+            elif command == 'snapshot':
+                self.emit(self.snapshot())
+            else:
+                timeout = req.get('timeout') or sequence_timeout(req, self.command_timeout)
+                paced = command in self.coalesce
+                calls = repeat
+                if repeat > 1 and getattr(self.session, 'accepts_repeat', False):
+                    calls, req = 1, {**req, 'repeat': repeat}
+                # A coalesced burst is paced once and then replayed back to
+                # back; pacing every repeat would keep a key moving long
+                # after the user let go
+                if paced:
+                    await self._pace()
+                for _ in range(calls):
+                    await asyncio.wait_for(self.session.handle(req), timeout=timeout)
+            if rid is not None or merged:
+                done = {'command': command, 'done': True,
+                        'elapsed_ms': round((time.monotonic() - started) * 1000, 1)}
+                if repeat > 1:
+                    done['repeat'] = repeat
+                if merged:
+                    done['coalesced'] = len(merged)
+                self._reply(merged, done)
+        except asyncio.TimeoutError:
+            error = 'timeout'
+            self._reply(merged, {'error': 'Command timed out', 'command': command, 'type': 'timeout'})
+        except asyncio.CancelledError:
+            raise
+        except DeviceError as e:
+            error = e.type
+            self._reply(merged, {**e.to_message(), 'command': command})
+        except Exception as e:
+            error = 'failed'
+            self._reply(merged, {'error': f'Command failed: {e}', 'command': command})
+        finally:
+            request_id.reset(token)
+            state_requested.reset(requested)
+            if command not in ('metrics', 'snapshot'):
+                elapsed = time.monotonic() - started
+                self.metrics.observe('command', elapsed, command)
+                self.metrics.count('commands', command)
+                if error:
+                    self.metrics.count('errors', error)
+                dumping = dump_if_slow(elapsed, self.device_id, command)
+                if dumping:
+                    dumping.add_done_callback(lambda future: self._dumped(future, command, elapsed))
+
+    def _dumped(self, future, command, elapsed):
+        # A dump that could not be written only costs the timeline, not the command
+        if future.cancelled() or future.exception():
+            return
+        write_message({'bridge': 'flight_dump', 'reason': 'slow_command', 'device': self.device_id,
+                       'command': command, 'elapsed_ms': round(elapsed * 1000, 1), 'path': future.result()})
+
+    async def _run_worker(self):
+        current_device.set(self.device_id)
+        while True:
+            entry = await self.queue.get()
+            if entry is self.tail:
+                self.tail = None
+            try:
+                await self._execute(entry.req, entry.merged, entry.repeat)
+            finally:
+                self.queue.task_done()
+
+    async def _run_side(self, req):
+        current_device.set(self.device_id)
+        async with self.concurrency:
+            await self._execute(req)
+
+    def submit(self, req):
+        """Queue a request without waiting. Returns False when the session is saturated."""
+        record('command', req, self.device_id)
+        req.setdefault('received', time.monotonic())
+        if req.get('command') in self.concurrent_commands:
+            if len(self.side_tasks) >= self.max_pending:
+                self._busy(req)
+                return False
+            task = asyncio.create_task(self._run_side(req))
+            self.side_tasks.add(task)
+            task.add_done_callback(self.side_tasks.discard)
+            return True
+        if self._merge(req):
+            return True
+        entry = QueuedCommand(req)
+        try:
+            self.queue.put_nowait(entry)
+            self.tail = entry
+            return True
+        except asyncio.QueueFull:
+            self._busy(req)
+            return False
+
+    def _merge(self, req):
+        """Fold ``req`` into the last queued command if it supersedes or repeats it."""
+        command = req.get('command')
+        mode = self.coalesce.get(command)
+        tail = self.tail
+        if mode is None or tail is None or tail.req.get('command') != command or 'steps' in req:
+            return False
+        if mode == 'latest':
+            tail.req = {**tail.req, 'value': req.get('value')}
+        elif mode == 'repeat' and tail.req.get('value') == req.get('value'):
+            tail.repeat += 1
+        else:
+            return False
+        tail.merged.append(req.get('id'))
+        self.metrics.count('coalesced', command)
+        return True
+
+    def _busy(self, req):
+        token = request_id.set(req.get('id'))
+        try:
+            self.emit({'error': 'Session busy', 'command': req.get('command'), 'type': 'busy'})
+        finally:
+            request_id.reset(token)
+
+    async def drain(self, timeout):
+        """Wait for already queued commands to finish, up to ``timeout`` seconds."""
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def close(self):
+        if metric_sessions.get(self.device_id or 'local') is self.metrics:
+            del metric_sessions[self.device_id or 'local']
+        for task in [self.starter, self.worker, *self.side_tasks]:
+            if task and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except (asyncio.CancelledError, Exception):
+                    pass
+        try:
+            await asyncio.wait_for(self.session.close(), timeout=5.0)
+        except (asyncio.TimeoutError, Exception):
+            pass
+
+
+async def run_single(factory):
+    """Serve one session over stdin/stdout, the standalone per-device mode."""
+    await open_output()
+    host = SessionHost(None, factory)
+    host.start()
+    try:
+        async for line in read_lines():
+            try:
+                req = loads(line)
+            except ValueError:
+                write_message({"error": "Invalid JSON input"})
+                continue
+            if not isinstance(req, dict):
+                continue
+            if req.get('op') == 'log_level':
+                set_log_level(req.get('level'))
+                continue
+            host.submit(req)
+        await host.drain(host.command_timeout)
+    finally:
+        await host.close()
+        await drain_output()
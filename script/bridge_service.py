@@ -0,0 +1,419 @@
+import asyncio
+import importlib
+import importlib.util
+import time
+import json
+import os
+import secrets
+import sys
+import warnings
+import logging
+
+# Suppress urllib3/ssl warnings
+warnings.filterwarnings("ignore", category=UserWarning, module='urllib3')
+logging.getLogger('asyncio').setLevel(logging.CRITICAL)
+
+import flight_recorder
+from bridge_host import SessionHost
+from ipc import drain_output, dumps, loads, log, message_taps, open_output, read_lines, set_log_level, write_message
+from metrics import METRICS_FILE, METRICS_INTERVAL, write_textfile
+from paths import data_path
+
+# Where the local control endpoint advertises its port and token, so one-shot
+# scripts can hand commands to an already connected session.
+CONTROL_FILE = data_path('bridge-control.json')
+
+# How long a control client waits for the session to report on its command
+CONTROL_REPLY_TIMEOUT = 5.0
+
+# Group fan-out: devices commanded at once, and the default overall deadline
+GROUP_CONCURRENCY = 16
+GROUP_DEADLINE = 10.0
+
+# Final statuses of a session request that mean the command did not go out
+FAILED_STATUSES = ('dropped', 'failed', 'error')
+
+# Session type -> module providing create_session(ip, emit). Modules are
+# imported on first use so a bridge that only hosts Samsung TVs never
+# loads pyatv or androidtvremote2.
+SESSION_MODULES = {
+    'appletv': 'atv_service',
+    'androidtv': 'androidtv_service',
+    'samsung': 'samsung_service',
+    'homekit': 'hap_service',
+}
+
+# Third-party packages each session type cannot start without
+SESSION_DEPENDENCIES = {
+    'appletv': ['pyatv'],
+    'androidtv': ['androidtvremote2'],
+    'samsung': ['samsungtvws'],
+    'homekit': ['aiohomekit'],
+}
+
+_dependency_cache = {}
+
+
+def missing_dependency(session_type):
+    """Name of the first missing package for a session type, or None. Checked once per package."""
+    for name in SESSION_DEPENDENCIES.get(session_type, []):
+        if name not in _dependency_cache:
+            _dependency_cache[name] = importlib.util.find_spec(name) is not None
+        if not _dependency_cache[name]:
+            return name
+    return None
+
+
+def preload(session_types):
+    """Import session modules ahead of the first session (runs on a worker thread)."""
+    loaded = []
+    for session_type in session_types:
+        module_name = SESSION_MODULES.get(session_type)
+        if not module_name or missing_dependency(session_type):
+            continue
+        try:
+            importlib.import_module(module_name)
+            loaded.append(session_type)
+        except Exception:
+            pass
+    return loaded
+
+
+class Bridge:
+    """Hosts every TV session in one interpreter and routes JSON lines by device id.
+
+    Control messages carry an ``op`` field::
+
+        {"op": "add", "device": "appletv:192.168.0.68", "type": "appletv", "ip": "192.168.0.68"}
+        {"op": "remove", "device": "appletv:192.168.0.68"}
+        {"op": "list"}
+        {"op": "discover"}          # start the shared zeroconf registry and stream its events
+        {"op": "discovery_list"}
+        {"op": "log_level", "level": "debug"}   # diagnostics on stderr: debug/info/warning/error/off
+        {"op": "preload", "types": ["appletv", "samsung"]}   # warm imports in the background
+        {"op": "recheck"}           # forget cached dependency checks (after installing a package)
+        {"op": "metrics"}           # latency histograms and counters of every session
+        {"op": "metrics_file", "path": "/var/lib/node_exporter/delova.prom", "interval": 15}
+        {"op": "flight_dump"}       # write the flight recorder timeline to flight-dumps/
+        {"op": "group", "id": "g1", "requests": [{"device": "samsung:192.168.0.70", "command": "key", "value": "KEY_POWEROFF"},
+                                                 {"device": "androidtv:192.168.0.71", "command": "turn_off"}],
+         "concurrency": 16, "deadline": 5}
+
+    Anything else with a ``device`` field is forwarded to that session, and
+    every message a session emits is tagged with its ``device``.
+
+    ``group`` runs one command on many sessions at once (at most
+    ``concurrency`` in flight, one command per device) and answers with a single message once all have
+    replied or ``deadline`` seconds have passed. Instead of ``requests``, it
+    also takes ``devices`` plus one shared ``command`` and ``value``::
+
+        {"bridge": "group", "id": "g1", "done": true, "ok": 1, "failed": 1, "elapsed_ms": 412.0,
+         "results": {"samsung:192.168.0.70": {"ok": true, "elapsed_ms": 398.2},
+                     "androidtv:192.168.0.71": {"ok": false, "error": "No reply from session", "type": "timeout"}}}
+
+    The same device commands are accepted on a localhost control socket
+    described in ``bridge-control.json``. Each control connection sends one
+    request (with the file's ``token``) and gets back the first reply its
+    session emits for that request id.
+    """
+
+    def __init__(self):
+        self.sessions = {}
+        self.registry = None
+        self.control_server = None
+        self.control_token = secrets.token_hex(16)
+        self.metrics_task = None
+        self.tasks = set()
+
+    def spawn(self, coro):
+        """Run ``coro`` beside the router, keeping a reference until it finishes."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        if not task.cancelled() and task.exception():
+            write_message({"error": f"Bridge error: {task.exception()}"})
+
+    async def start_control(self):
+        try:
+            self.control_server = await asyncio.start_server(self.handle_control, '127.0.0.1', 0)
+            port = self.control_server.sockets[0].getsockname()[1]
+            tmp = CONTROL_FILE + '.tmp'
+            # Owner-only: the token lets anyone holding it drive every TV
+            with os.fdopen(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w') as f:
+                json.dump({"port": port, "pid": os.getpid(), "token": self.control_token}, f)
+            os.replace(tmp, CONTROL_FILE)
+        except OSError as e:
+            write_message({"error": f"Control endpoint unavailable: {e}"})
+
+    async def handle_control(self, reader, writer):
+        def reply(msg):
+            writer.write(dumps(msg))
+
+        try:
+            line = await asyncio.wait_for(reader.readline(), timeout=CONTROL_REPLY_TIMEOUT)
+            req = loads(line)
+            if not isinstance(req, dict) or req.pop('token', None) != self.control_token:
+                reply({"error": "Unauthorized", "type": "unauthorized"})
+                return
+            device_id = req.get('device')
+            req.setdefault('id', f'control-{secrets.token_hex(4)}')
+            host = self.sessions.get(device_id)
+            if host is None:
+                reply({"device": device_id, "error": "Unknown device", "type": "unknown_device"})
+                return
+
+            reply(await self.request(host, req, CONTROL_REPLY_TIMEOUT))
+        except (asyncio.TimeoutError, ValueError):
+            reply({"error": "Invalid control request"})
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except OSError:
+                pass
+
+    async def request(self, host, req, timeout):
+        """Submit ``req`` (which carries an ``id``) to a session and return its final reply."""
+        device_id, rid = host.device_id, req['id']
+        done = asyncio.get_running_loop().create_future()
+
+        def tap(msg):
+            if done.done() or msg.get('device') != device_id or msg.get('id') != rid:
+                return
+            if msg.get('error') or msg.get('done') or msg.get('status') in ('sent', *FAILED_STATUSES):
+                done.set_result(msg)
+
+        message_taps.append(tap)
+        try:
+            if not host.submit(req):
+                return {"device": device_id, "error": "Session busy", "type": "busy"}
+            try:
+                return await asyncio.wait_for(done, timeout=timeout)
+            except asyncio.TimeoutError:
+                return {"device": device_id, "error": "No reply from session", "type": "timeout"}
+        finally:
+            message_taps.remove(tap)
+
+    async def group(self, req):
+        """Fan one command out to many sessions and report every result in one message."""
+        started = time.monotonic()
+        group_id = req.get('id')
+        deadline = float(req.get('deadline') or GROUP_DEADLINE)
+        limit = asyncio.Semaphore(max(1, int(req.get('concurrency') or GROUP_CONCURRENCY)))
+        requests = req.get('requests')
+        if requests is None:
+            shared = {k: v for k, v in req.items() if k not in ('op', 'id', 'devices', 'concurrency', 'deadline')}
+            requests = [{**shared, 'device': device_id} for device_id in req.get('devices') or []]
+        # One command per device (the last one listed wins); results are keyed by device
+        requests = list({sub.get('device'): sub for sub in requests}.values())
+
+        async def run(sub):
+            device_id = sub.get('device')
+            host = self.sessions.get(device_id)
+            if host is None:
+                return {"ok": False, "error": "Unknown device", "type": "unknown_device"}
+            async with limit:
+                remaining = deadline - (time.monotonic() - started)
+                if remaining <= 0:
+                    return {"ok": False, "error": "Deadline exceeded", "type": "timeout"}
+                sent = time.monotonic()
+                msg = await self.request(host, {**sub, 'id': f'{group_id}/{device_id}', 'timeout': remaining}, remaining)
+            result = {"ok": not msg.get('error') and msg.get('status') not in FAILED_STATUSES,
+                      "elapsed_ms": round((time.monotonic() - sent) * 1000, 1)}
+            if not result['ok']:
+                result.update(error=msg.get('error') or msg.get('message') or msg.get('reason') or msg.get('status'),
+                              type=msg.get('type'))
+            return result
+
+        outcomes = await asyncio.gather(*(run(sub) for sub in requests))
+        results = {sub.get('device'): outcome for sub, outcome in zip(requests, outcomes)}
+        ok = sum(1 for outcome in outcomes if outcome['ok'])
+        write_message({"bridge": "group", "id": group_id, "done": True, "ok": ok, "failed": len(outcomes) - ok,
+                       "elapsed_ms": round((time.monotonic() - started) * 1000, 1), "results": results})
+
+    def flight_dump(self, request_id=None):
+        recorder = flight_recorder.recorder
+        if recorder is None:
+            write_message({"bridge": "flight_dump", "id": request_id, "error": "Flight recorder is not running"})
+            return
+
+        def dumped(future):
+            error = None if future.cancelled() else future.exception()
+            if future.cancelled() or error:
+                write_message({"bridge": "flight_dump", "id": request_id, "error": f"Dump failed: {error or 'cancelled'}"})
+                return
+            write_message({"bridge": "flight_dump", "id": request_id, "done": True, "reason": "requested",
+                           "path": future.result()})
+
+        recorder.dump('requested', devices=list(self.sessions)).add_done_callback(dumped)
+
+    def start_metrics_file(self, path, interval=METRICS_INTERVAL):
+        """Rewrite ``path`` in the Prometheus text format every ``interval`` seconds (None stops)."""
+        if self.metrics_task:
+            self.metrics_task.cancel()
+            self.metrics_task = None
+        if path:
+            self.metrics_task = asyncio.create_task(self.write_metrics(path, float(interval or METRICS_INTERVAL)))
+
+    async def write_metrics(self, path, interval):
+        while True:
+            try:
+                write_textfile(path)
+            except OSError as e:
+                log('warning', 'Metrics file not written', path=path, error=str(e))
+            await asyncio.sleep(interval)
+
+    async def start_discovery(self):
+        if self.registry:
+            return
+        try:
+            from discovery_registry import get_registry
+            self.registry = await get_registry()
+        except ImportError as e:
+            write_message({"error": "missing_dependency", "module": e.name or 'zeroconf', "message": str(e)})
+            return
+        self.registry.listeners.append(
+            lambda event, record: write_message({"bridge": "discovery", "event": event, "record": record}))
+        write_message({"bridge": "discovery_started"})
+
+    async def preload(self, session_types):
+        # Imports hold the import lock, not the event loop; commands keep flowing meanwhile
+        started = time.monotonic()
+        loaded = await asyncio.get_running_loop().run_in_executor(None, preload, session_types)
+        write_message({"bridge": "preloaded", "types": loaded, "elapsed_ms": round((time.monotonic() - started) * 1000, 1)})
+
+    def add(self, device_id, session_type, ip):
+        if device_id in self.sessions:
+            write_message({"bridge": "added", "device": device_id, "existing": True})
+            return
+
+        module_name = SESSION_MODULES.get(session_type)
+        if not module_name:
+            write_message({"device": device_id, "error": f"Unknown session type: {session_type}"})
+            return
+
+        missing = missing_dependency(session_type)
+        if missing:
+            write_message({"device": device_id, "error": "missing_dependency", "module": missing, "message": f"No module named '{missing}'"})
+            return
+
+        try:
+            module = importlib.import_module(module_name)
+            host = SessionHost(device_id, lambda emit: module.create_session(ip, emit))
+        except ImportError as e:
+            importlib.invalidate_caches()
+            write_message({"device": device_id, "error": "missing_dependency", "module": e.name or module_name, "message": str(e)})
+            return
+        except Exception as e:
+            write_message({"device": device_id, "error": f"Session setup failed: {e}"})
+            return
+
+        self.sessions[device_id] = host
+        host.start()
+        write_message({"bridge": "added", "device": device_id, "type": session_type, "ip": ip})
+
+    def remove(self, device_id):
+        host = self.sessions.pop(device_id, None)
+        if host:
+            # Closing can wait on a stuck device; keep the router moving.
+            self.spawn(host.close())
+        write_message({"bridge": "removed", "device": device_id})
+
+    async def dispatch(self, req):
+        op = req.get('op')
+        device_id = req.get('device')
+        if op:
+            # Device commands are recorded by their session host
+            flight_recorder.record('command', req)
+
+        if op == 'add':
+            self.add(device_id, req.get('type'), req.get('ip'))
+        elif op == 'remove':
+            self.remove(device_id)
+        elif op == 'list':
+            write_message({"bridge": "sessions", "devices": list(self.sessions)})
+        elif op == 'discover':
+            await self.start_discovery()
+        elif op == 'preload':
+            self.spawn(self.preload(req.get('types') or list(SESSION_MODULES)))
+        elif op == 'recheck':
+            _dependency_cache.clear()
+            importlib.invalidate_caches()
+            write_message({"bridge": "rechecked"})
+        elif op == 'metrics':
+            write_message({"bridge": "metrics", "devices": {d: h.metrics_snapshot() for d, h in self.sessions.items()}})
+        elif op == 'metrics_file':
+            self.start_metrics_file(req.get('path'), req.get('interval'))
+            write_message({"bridge": "metrics_file", "path": req.get('path')})
+        elif op == 'group':
+            # Runs alongside the router, so other commands keep flowing meanwhile
+            self.spawn(self.group(req))
+        elif op == 'flight_dump':
+            self.flight_dump(req.get('id'))
+        elif op == 'log_level':
+            write_message({"bridge": "log_level", "level": req.get('level'), "ok": set_log_level(req.get('level'))})
+        elif op == 'discovery_list':
+            records = self.registry.records() if self.registry else []
+            write_message({"bridge": "discovery_records", "records": records})
+        elif op:
+            write_message({"error": f"Unknown op: {op}"})
+        else:
+            host = self.sessions.get(device_id)
+            if host is None:
+                write_message({"device": device_id, "error": "Unknown device", "type": "unknown_device"})
+                return
+            host.submit(req)
+
+    async def close(self):
+        if self.metrics_task:
+            self.metrics_task.cancel()
+        if self.control_server:
+            self.control_server.close()
+            try:
+                os.remove(CONTROL_FILE)
+            except OSError:
+                pass
+        hosts = list(self.sessions.values())
+        self.sessions.clear()
+        await asyncio.gather(*(h.close() for h in hosts), return_exceptions=True)
+        if self.registry:
+            await self.registry.close()
+
+
+async def main():
+    await open_output()
+    if flight_recorder.open_recorder():
+        message_taps.append(lambda msg: flight_recorder.record('event', msg, msg.get('device')))
+    bridge = Bridge()
+    await bridge.start_control()
+    if METRICS_FILE:
+        bridge.start_metrics_file(METRICS_FILE)
+    write_message({"bridge": "ready", "pid": os.getpid(), "python_version": sys.version.split('\n')[0]})
+    try:
+        async for line in read_lines():
+            try:
+                req = loads(line)
+            except ValueError:
+                write_message({"error": "Invalid JSON input"})
+                continue
+            if not isinstance(req, dict):
+                continue
+            try:
+                await bridge.dispatch(req)
+            except Exception as e:
+                write_message({"error": f"Bridge error: {e}"})
+    finally:
+        await bridge.close()
+        await drain_output()
+        flight_recorder.close_recorder()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
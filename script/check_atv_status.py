@@ -4,17 +4,16 @@ from pyatv import scan
 from pyatv.const import Protocol
 
 async def main():
-    print("Scanning for Apple TVs...")
-    atvs = await scan(loop=asyncio.get_event_loop())
+    if len(sys.argv) < 2:
+        print("Usage: python check_atv_status.py <ip>")
+        sys.exit(1)
 
-    target_ip = "192.168.0.68"
-    target_atv = None
+    target_ip = sys.argv[1]
+    print(f"Scanning {target_ip}...")
+    # A unicast scan of one host answers immediately instead of waiting out a full network scan
+    atvs = await scan(loop=asyncio.get_event_loop(), hosts=[target_ip])
+    target_atv = atvs[0] if atvs else None
 
-    for atv in atvs:
-        if str(atv.address) == target_ip:
-            target_atv = atv
-            break
-    
     if not target_atv:
         print(f"Could not find Apple TV at {target_ip}")
         return
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+from contextlib import contextmanager
+
+from paths import data_path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Store name -> file. The files keep their existing layout (a JSON object
+# keyed by device id, or by IP for Samsung tokens) so Node and the pairing
+# scripts can still read them directly.
+STORE_FILES = {
+    'appletv': data_path('appletv-credentials.json'),
+    'androidtv': data_path('androidtv-credentials.json'),
+    'samsung': data_path('samsung-tokens.json'),
+    'homekit': data_path('homekit-pairings.json'),
+}
+
+
+@contextmanager
+def file_lock(path):
+    """Exclusive lock on ``<path>.lock``, held across processes."""
+    with open(path + '.lock', 'a+') as handle:
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CredentialStore:
+    """JSON credential file with an in-memory index and atomic, locked writes.
+
+    Entries are looked up by their key (device id) or by the ``ip`` field of
+    the entry. The file is re-read whenever it changes on disk, so devices
+    paired by another process are picked up without a restart. Every write
+    re-reads the file under a cross-process lock, applies the change and
+    atomically replaces the file, so concurrent writers never lose entries.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.by_ip = {}
+        self.signature = None
+        self.lock = threading.Lock()
+
+    def _stat(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def _index(self, entries, signature):
+        self.entries = entries
+        self.by_ip = {entry['ip']: key for key, entry in entries.items()
+                      if isinstance(entry, dict) and entry.get('ip')}
+        self.signature = signature
+
+    def _refresh(self):
+        signature = self._stat()
+        if signature != self.signature:
+            self._index(self._read(), signature)
+
+    def get(self, key):
+        """Entry for a device id or IP address, or None."""
+        with self.lock:
+            self._refresh()
+            if key in self.entries:
+                return self.entries[key]
+            device_id = self.by_ip.get(key)
+            return self.entries.get(device_id) if device_id else None
+
+    def all(self):
+        with self.lock:
+            self._refresh()
+            return dict(self.entries)
+
+    def update(self, changes, removals=()):
+        """Merge ``changes`` and drop ``removals`` in one atomic, locked write."""
+        with self.lock, file_lock(self.path):
+            entries = self._read()
+            entries.update(changes)
+            for key in removals:
+                entries.pop(key, None)
+            tmp = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump(entries, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self._index(entries, self._stat())
+
+    def put(self, key, entry):
+        self.update({key: entry})
+
+    def delete(self, key):
+        self.update({}, removals=[key])
+
+
+_stores = {}
+
+
+def get_store(name):
+    """Process-wide store for one of STORE_FILES."""
+    if name not in _stores:
+        _stores[name] = CredentialStore(STORE_FILES[name])
+    return _stores[name]
@@ -29,6 +29,45 @@ const ps5Manager = require('./ps5Manager');
 const nasManager = require('./nasManager');
 const hueManager = require('./hueManager');
 const discoveryService = require('./discoveryService');
+const auditLogManager = require('./auditLogManager');
+// Credential files are shared with the Python bridge (credential_store.py), which
+// reloads them on change. Replace them atomically so it never reads a half-written file.
+function writeJsonAtomic(filePath, data) {
+    const tmp = `${filePath}.${process.pid}.tmp`;
+    fs.writeFileSync(tmp, JSON.stringify(data, null, 2));
+    fs.renameSync(tmp, filePath);
+}
+
+// Media status field from the Apple TV / Android TV sessions -> device.state key
+const MEDIA_STATUS_FIELDS = {
+    on: 'on',
+    volume: 'volume',
+    title: 'mediaTitle',
+    artist: 'mediaArtist',
+    album: 'mediaAlbum',
+    app: 'mediaApp',
+    playing_state: 'playingState',
+    artwork: 'mediaArtwork'
+};
+
+// Named device groups ("all TVs", "downstairs") shared by scenes and automations
+const DEVICE_GROUPS_FILE = path.join(__dirname, '../data/device-groups.json');
+
+// Commands controlDevice may hand to Spotify instead of the device itself
+const SPOTIFY_ROUTED_COMMANDS = ['play', 'pause', 'toggle', 'next', 'previous', 'set_volume', 'volume_up', 'volume_down'];
+
+const SAMSUNG_KEYS = {
+    'turn_off': 'KEY_POWEROFF', 'toggle': 'KEY_POWER', // Use KEY_POWER for toggle to avoid accidental shutdown during pairing
+    'turn_on': 'KEY_POWERON',
+    'channel_up': 'KEY_CHUP', 'channel_down': 'KEY_CHDOWN',
+    'volume_up': 'KEY_VOLUP', 'volume_down': 'KEY_VOLDOWN',
+    'play': 'KEY_PLAY', 'pause': 'KEY_PAUSE', 'stop': 'KEY_STOP',
+    'next': 'KEY_FF', 'previous': 'KEY_REWIND',
+    'up': 'KEY_UP', 'down': 'KEY_DOWN', 'left': 'KEY_LEFT', 'right': 'KEY_RIGHT',
+    'select': 'KEY_ENTER', 'enter': 'KEY_ENTER',
+    'back': 'KEY_RETURN', 'home': 'KEY_HOME', 'menu': 'KEY_MENU'
+};
+
 let SamsungRemote = null;
 try {
     SamsungRemote = require('samsung-remote');
@@ -78,6 +117,13 @@ class DeviceManager extends EventEmitter {
         this.atvProcesses = new Map();
         this.androidTvProcesses = new Map();
         this.samsungProcesses = new Map();
+        this.hapSessions = new Map(); // ip -> HomeKit (HAP) sensor session
+        this.bridgeProcess = null; // Shared Python bridge hosting all TV sessions
+        this.bridgeSessions = new Map(); // bridge device key -> session callbacks
+        this.bridgeRequests = new Map(); // request id -> pending reply { resolve, reject, timer }
+        this.bridgeRequestSeq = 0;
+        this.deviceGroups = {}; // group name -> { devices: [device ids] }
+        this.servicePythonPath = null;
         this.legacySamsungDevices = new Set();
         this.cameraInstances = new Map(); // Cache for ONVIF camera connections
         this.pairingProcess = null;
@@ -94,6 +140,7 @@ class DeviceManager extends EventEmitter {
         this.loadCameraCredentials();
         this.loadCameraConfigs(); // New
         this.loadSshCredentials(); // New
+        this.loadDeviceGroups();
         
         // Integrate Discovery Service
         discoveryService.on('discovered', (deviceInfo) => {
@@ -199,6 +246,11 @@ class DeviceManager extends EventEmitter {
                 // However, for Cast to work, we might need to know it's a cast device.
                 existingDevice.protocol = 'mdns-googlecast'; // Force protocol update
             }
+
+            // A device first seen without a control protocol (e.g. plain http mDNS) takes the one found now
+            if (info.protocol && (!existingDevice.protocol || existingDevice.protocol === 'ssdp')) {
+                existingDevice.protocol = info.protocol;
+            }
             
             this.emit('device-updated', existingDevice);
             return;
@@ -215,6 +267,7 @@ class DeviceManager extends EventEmitter {
             ip: info.ip,
             mac: info.mac,
             model: info.model,
+            protocol: info.protocol,
             state: { 
                 on: (info.type === 'homekit' || info.type === 'printer' || (info.name && info.name.includes('HomePod'))), // Default ON for always-on devices
                 ...((info.type === 'homekit' || (info.name && info.name.includes('HomePod'))) ? { temperature: null, humidity: null } : {}) // Init sensor slots
@@ -366,6 +419,35 @@ class DeviceManager extends EventEmitter {
         }
     }
 
+    loadDeviceGroups() {
+        try {
+            if (fs.existsSync(DEVICE_GROUPS_FILE)) {
+                this.deviceGroups = JSON.parse(fs.readFileSync(DEVICE_GROUPS_FILE));
+                console.log(`Loaded ${Object.keys(this.deviceGroups).length} device group(s)`);
+            }
+        } catch (e) {
+            console.error('Failed to load device groups:', e.message);
+            this.deviceGroups = {};
+        }
+    }
+
+    getDeviceGroups() {
+        return this.deviceGroups;
+    }
+
+    saveDeviceGroup(name, deviceIds) {
+        this.deviceGroups[name] = { devices: Array.from(new Set(deviceIds)) };
+        writeJsonAtomic(DEVICE_GROUPS_FILE, this.deviceGroups);
+        return this.deviceGroups[name];
+    }
+
+    deleteDeviceGroup(name) {
+        if (!this.deviceGroups[name]) return false;
+        delete this.deviceGroups[name];
+        writeJsonAtomic(DEVICE_GROUPS_FILE, this.deviceGroups);
+        return true;
+    }
+
     saveCameraCredentials(ip, username, password) {
         try {
             if (!this.cameraCredentials) this.cameraCredentials = {};
@@ -464,7 +546,13 @@ class DeviceManager extends EventEmitter {
         // 2. ONVIF Discovery (WS-Discovery) for IP Cameras (Tapo, etc.)
         this.setupOnvifDiscovery();
 
-        // 3. mDNS Discovery (Bonjour/Zeroconf)
+        // 3. Port sweep of the local /24 for TVs that do not advertise themselves
+        if (this.localIp) {
+            const subnet = `${this.localIp.split('.').slice(0, 3).join('.')}.0/24`;
+            discoveryService.scanPorts(this.findServicePython(), [subnet]);
+        }
+
+        // 4. mDNS Discovery (Bonjour/Zeroconf)
         this.bonjour = new Bonjour();
         
         const browser = this.bonjour.find({ type: 'http' }, (service) => {
@@ -499,7 +587,7 @@ class DeviceManager extends EventEmitter {
             this.processMdnsService(service, 'printer');
         });
 
-        // 4. Windows/SMB Discovery (Port Scan)
+        // 5. Windows/SMB Discovery (Port Scan)
         this.scanForWindowsDevices();
         setInterval(() => this.scanForWindowsDevices(), 60000 * 10); // Every 10 minutes
 
@@ -1213,6 +1301,11 @@ class DeviceManager extends EventEmitter {
                      this.loadDenonInputs(existingDevice);
                  }
                  updated = true;
+            } else if (device.protocol && (!existingDevice.protocol || existingDevice.protocol === 'ssdp')) {
+                 // e.g. a TV the port sweep added before its mDNS advertisement arrived
+                 console.log(`[DeviceManager] Setting protocol for ${device.ip}: ${existingDevice.protocol} -> ${device.protocol}`);
+                 existingDevice.protocol = device.protocol;
+                 updated = true;
             }
 
             // Check if Denon inputs need loading (even if protocol didn't change, maybe inputs are missing)
@@ -1574,91 +1667,75 @@ class DeviceManager extends EventEmitter {
         return 'python3';
     }
 
-    async refreshHomeKitSensor(device) {
-        // Poll every 60 seconds
-        const now = Date.now();
-        if (device.lastHomeKitPoll && (now - device.lastHomeKitPoll) < 60000) return;
-        device.lastHomeKitPoll = now;
-
-        const { exec } = require('child_process');
-
-        return new Promise((resolve) => {
-            // Use macOS Shortcuts to get data since we can't pair directly while it's in the Home app
-            exec(`shortcuts run "Read HomePod"`, (error, stdout, stderr) => {
-                if (error) {
-                    // console.log('Shortcuts error:', error.message);
-                    resolve();
-                    return;
-                }
-                if (!stdout || !stdout.trim()) {
-                    resolve();
-                    return;
-                }
-
-                try {
-                    // Robust parsing for "Read HomePod" shortcut output
-                    // Handles formats like: {"temperature": 21,4 °C, "humidity":54} or standard JSON
-                    const output = stdout.trim();
-                    let temp = null;
-                    let humidity = null;
-
-                    // Regex to find numbers after keys, supporting dots and commas
-                    const tempMatch = output.match(/"temperature"\s*:\s*["']?([0-9.,]+)/);
-                    if (tempMatch) {
-                        temp = parseFloat(tempMatch[1].replace(',', '.'));
-                    }
-
-                    const humMatch = output.match(/"humidity"\s*:\s*["']?([0-9.,]+)/);
-                    if (humMatch) {
-                        humidity = parseFloat(humMatch[1].replace(',', '.'));
-                    }
-                    
-                    let updated = false;
+    // HomeKit sensors (e.g. a HomePod's temperature and humidity) come from a
+    // paired HAP session in the device bridge, which subscribes to the
+    // accessory's characteristics and pushes every change as it happens.
+    watchHomeKitSensor(device) {
+        if (!device.ip || this.hapSessions.has(device.ip)) return;
+        console.log(`[DeviceManager] Opening HomeKit session for ${device.ip}...`);
+
+        const session = this.openBridgeSession('homekit', device.ip,
+            (msg) => this.handleHapServiceMessage(device.id, msg),
+            (code) => {
+                console.log(`[HomeKit Service] Session for ${device.ip} closed (${code})`);
+                if (this.hapSessions.get(device.ip) === session) this.hapSessions.delete(device.ip);
+            });
 
-                    // If we got data, the device is definitely ON/Reachable
-                    if (!device.state.on) {
-                        device.state.on = true;
-                        updated = true;
-                    }
+        this.hapSessions.set(device.ip, session);
+    }
 
-                    if (temp !== null && !isNaN(temp) && device.state.temperature !== temp) {
-                        device.state.temperature = temp;
-                        updated = true;
-                    }
-                    if (humidity !== null && !isNaN(humidity) && device.state.humidity !== humidity) {
-                        device.state.humidity = humidity;
-                        updated = true;
-                    }
+    handleHapServiceMessage(deviceId, msg) {
+        const device = this.devices.get(deviceId);
+        if (!device) return;
 
-                    if (updated) {
-                         // console.log(`[HomeKit] ${device.name}: ${temp}C ${humidity}%`);
-                         this.emit('device-updated', device);
-                    }
-                } catch (e) {
-                     // console.error('[HomeKit] Parse error:', e);
+        if (msg.type === 'sensor') {
+            let updated = false;
+            // Sensor data means the accessory is reachable
+            if (!device.state.on) {
+                device.state.on = true;
+                updated = true;
+            }
+            Object.entries(msg.data || {}).forEach(([key, value]) => {
+                if (device.state[key] !== value) {
+                    device.state[key] = value;
+                    updated = true;
                 }
-                resolve();
             });
-        });
+            if (updated) this.emit('device-updated', device);
+        } else if (msg.status === 'pairing_required') {
+            console.log(`[HomeKit Service] ${device.name} is not paired; pair it with its setup code to receive sensor updates.`);
+        } else if (msg.status === 'connected') {
+            console.log(`[HomeKit Service] Subscribed to ${(msg.sensors || []).join(', ')} on ${device.name}`);
+        } else if (msg.status === 'pairing_failed') {
+            console.error(`[HomeKit Service] Pairing ${device.name} failed: ${msg.error}`);
+        } else if (msg.type === 'link') {
+            this.logLinkState('HomeKit Service', device.ip, msg);
+        } else if (msg.error) {
+            console.error(`[HomeKit Service Error] ${device.ip}: ${msg.error}`);
+        }
+    }
+
+    // Pair the HAP session with the accessory's setup code (e.g. '123-45-678').
+    async pairHomeKitAccessory(id, pin) {
+        const device = this.devices.get(id);
+        if (!device || !device.ip) throw new Error('Unknown HomeKit device');
+        this.watchHomeKitSensor(device);
+        return this.hapSessions.get(device.ip).request({ command: 'pair', value: pin }, 60000);
     }
 
     async refreshDevice(id) {
         const device = this.devices.get(id);
         if (!device) return;
 
-        // Skip HomeKit/HomePod devices (Updated via Webhook now)
-        // This prevents them from being marked "Offline" if polling fails
+        // HomeKit/HomePod devices are not polled: sensor values are pushed by
+        // their HAP session (or the webhook), so a failed poll never marks them offline
         if (device.type === 'homekit' || (device.name && device.name.includes('HomePod')) || (device.capabilities && device.capabilities.includes('homekit'))) {
+            if (device.capabilities && device.capabilities.includes('homekit') && device.capabilities.includes('sensor')) {
+                this.watchHomeKitSensor(device);
+            }
             return;
         }
 
-        /* 
-        // Logic moved to "Push" model via Webhook
-        if (device.capabilities && device.capabilities.includes('homekit') && device.capabilities.includes('sensor')) {
-             await this.refreshHomeKitSensor(device);
-        }
-        */
-
         // Skip Hue devices (managed by hueManager)
         if (device.protocol === 'hue') return;
 
@@ -1686,11 +1763,11 @@ class DeviceManager extends EventEmitter {
             // Check credentials
             if (!this.appleTvCredentials[device.deviceId]) return;
 
-            // Use persistent process
-            const process = this.getAtvProcess(device.ip);
-            process.stdin.write(JSON.stringify({ command: 'status' }) + '\n');
+            // Make sure a persistent session exists. It pushes status changes on its
+            // own (with a slow fallback poll), so no per-cycle status request is needed.
+            this.getAtvProcess(device.ip);
             
-            // Output is handled in getAtvProcess
+            // Output is handled in handleAtvServiceMessage
         } else if (device.type === 'light' && (device.name.toLowerCase().includes('yeelight') || device.name.toLowerCase().includes('ylbulb'))) {
             // Refresh Yeelight
             const socket = new net.Socket();
@@ -1733,6 +1810,9 @@ class DeviceManager extends EventEmitter {
 
             socket.on('error', () => socket.destroy());
             socket.on('timeout', () => socket.destroy());
+        } else if (device.protocol === 'mdns-googlecast' && this.androidTvProcesses.has(device.ip)) {
+            // An open Android TV session pushes power/app/volume changes itself
+            return;
         } else if (device.type === 'chromecast' || device.protocol === 'mdns-googlecast') {
             // Refresh Cast Device
             const client = new CastClient();
@@ -1787,39 +1867,11 @@ class DeviceManager extends EventEmitter {
                 });
             });
         } else if (device.protocol === 'samsung-tizen') {
-            // Refresh Samsung TV (More reliable check via WebSocket with fallback)
-            const checkPower = (port) => {
-                const protocol = port === 8002 ? 'wss' : 'ws';
-                const wsUrl = `${protocol}://${device.ip}:${port}`;
-                const ws = new WebSocket(wsUrl, {
-                    rejectUnauthorized: false,
-                    timeout: 2000
-                });
-
-                ws.on('open', () => {
-                    if (!device.state.on) {
-                        device.state.on = true;
-                        this.emit('device-updated', device);
-                    }
-                    ws.close();
-                });
-
-                ws.on('error', (err) => {
-                    ws.terminate();
-                    if (port === 8002) {
-                        // Secure failed, try insecure
-                        checkPower(8001);
-                    } else {
-                        // Both failed, device is off
-                        if (device.state.on) {
-                            device.state.on = false;
-                            this.emit('device-updated', device);
-                        }
-                    }
-                });
-            };
-
-            checkPower(8002);
+            // Samsung TV state is polled by the bridge session (REST API) and
+            // pushed back as status messages; just make sure it is running.
+            if (!this.legacySamsungDevices.has(device.ip)) {
+                this.getSamsungProcess(device.ip);
+            }
 
         } else if (device.protocol === 'denon-avr') {
             // Refresh Denon AVR
@@ -2211,6 +2263,15 @@ class DeviceManager extends EventEmitter {
 
         console.log(`Controlling ${device.name} (${device.protocol}): ${command} = ${value}`);
 
+        if (command === 'hold_start' || command === 'hold_end') {
+            // value is the held button ('up', 'select', ...). Devices without a
+            // hold session get a single press instead.
+            if (!this.holdKey(device, command, value) && command === 'hold_start' && value) {
+                return this.controlDevice(device.id, value);
+            }
+            return device;
+        }
+
         if (device.protocol === 'hue') {
             try {
                 const state = {};
@@ -2601,6 +2662,8 @@ class DeviceManager extends EventEmitter {
         installProc.on('close', (code) => {
             if (code === 0) {
                 console.log(`[DeviceManager] Successfully installed ${moduleName}.`);
+                // The bridge caches dependency checks; make it look again
+                if (this.bridgeProcess) this.bridgeProcess.stdin.write(JSON.stringify({ op: 'recheck' }) + '\n');
                 if (callback) callback(true);
             } else {
                 console.error(`[DeviceManager] Failed to install ${moduleName}. Exit code: ${code}`);
@@ -2609,17 +2672,13 @@ class DeviceManager extends EventEmitter {
         });
     }
 
-    getAndroidTvProcess(ip) {
-        if (this.androidTvProcesses.has(ip)) {
-            return this.androidTvProcesses.get(ip);
-        }
-        console.log(`[DeviceManager] Spawning persistent Android TV service for ${ip}...`);
-        const { spawn } = require('child_process');
+    findServicePython() {
+        if (this.servicePythonPath) return this.servicePythonPath;
 
         // Try several likely venv python locations, then fall back to system python3
         const isWin = process.platform === 'win32';
         let candidates = [];
-        
+
         if (isWin) {
             candidates = [
                 // Standard venv
@@ -2637,16 +2696,20 @@ class DeviceManager extends EventEmitter {
         } else {
             candidates = [
                 path.join(__dirname, '../.venv/bin/python'),
+                path.join(__dirname, '../.venv/bin/python3'),
                 path.join(__dirname, '../../.venv/bin/python'),
                 path.join(process.cwd(), '.venv/bin/python'),
-                '/home/pi/DelovaHome/.venv/bin/python'
+                path.join(process.cwd(), '.venv/bin/python3'),
+                // Common absolute paths (Raspberry Pi default)
+                '/home/pi/DelovaHome/.venv/bin/python',
+                '/home/pi/DelovaHome/.venv/bin/python3'
             ];
         }
 
         let pythonPath = isWin ? 'python' : 'python3';
         for (const cand of candidates) {
             try {
-                if (fs.existsSync(cand)) { 
+                if (fs.existsSync(cand)) {
                     // On Windows, verify this isn't a Mac/Linux venv by checking pyvenv.cfg
                     if (isWin) {
                         // Check parent dir (for .venv/python.exe) or grandparent (for .venv/Scripts/python.exe)
@@ -2655,92 +2718,455 @@ class DeviceManager extends EventEmitter {
                         let cfgContent = '';
                         if (fs.existsSync(p1)) cfgContent = fs.readFileSync(p1, 'utf8');
                         else if (fs.existsSync(p2)) cfgContent = fs.readFileSync(p2, 'utf8');
-                        
+
                         if (cfgContent && (cfgContent.includes('/Applications/') || cfgContent.includes('/usr/bin'))) {
                             console.warn(`[DeviceManager] Ignoring candidate ${cand} because it appears to be a Mac/Linux venv.`);
                             continue;
                         }
                     }
-                    pythonPath = cand; 
-                    break; 
+                    pythonPath = cand;
+                    break;
                 }
             } catch (e) {}
         }
 
-        console.log(`[DeviceManager] Using python executable: ${pythonPath}`);
+        if (!pythonPath.includes('/') && !pythonPath.includes('\\')) {
+            console.warn(`[DeviceManager] Virtual env python not found, falling back to system '${pythonPath}'. (Checked ${candidates.length} locations)`);
+        }
+
+        this.servicePythonPath = pythonPath;
+        return pythonPath;
+    }
 
-        const scriptPath = path.join(__dirname, 'androidtv_service.py');
+    getBridgeProcess() {
+        if (this.bridgeProcess) return this.bridgeProcess;
 
-        const childProc = spawn(pythonPath, [scriptPath, ip], { cwd: path.join(__dirname, '..') });
-        console.log(`[Android TV] Spawned helper pid=${childProc.pid} for ${ip}`);
+        const { spawn } = require('child_process');
+        const pythonPath = this.findServicePython();
+        const scriptPath = path.join(__dirname, 'bridge_service.py');
 
+        console.log(`[DeviceManager] Spawning device bridge: ${pythonPath} ${scriptPath}`);
+        const childProc = spawn(pythonPath, [scriptPath], { cwd: path.join(__dirname, '..') });
+
+        let buffer = '';
         childProc.stdout.on('data', (data) => {
-            const lines = data.toString().split('\n');
+            buffer += data.toString();
+            const lines = buffer.split('\n');
+            buffer = lines.pop();
             lines.forEach(line => {
                 if (!line.trim()) return;
+                let msg;
                 try {
-                    const msg = JSON.parse(line);
-                    // Log everything for debug
-                    if (msg.status === 'debug') {
-                        console.log(`[Android TV Debug] ${msg.message}`);
-                    }
-                    
-                    if (msg.startup) {
-                        console.log(`[Android TV Service] Started. Python: ${msg.python_version}`);
-                    } else if (msg.error === 'missing_dependency') {
-                        console.warn(`[Android TV] Missing dependency: ${msg.module}. Attempting auto-install...`);
-                        this.installPythonDependency(pythonPath, msg.module, ip, (success) => {
-                            if (success) {
-                                console.log(`[Android TV] Restarting service for ${ip}...`);
-                                this.androidTvProcesses.delete(ip);
-                                setTimeout(() => this.getAndroidTvProcess(ip), 1000);
-                            }
-                        });
-                    } else if (msg.status === 'pairing_required') {
-                        console.log(`[Android TV Service] Pairing required for ${ip}. Please check TV for code.`);
-                        this.emit('pairing-required', { ip: ip, name: 'Android TV', type: 'android-tv' });
-                    } else if (msg.status === 'connected' || msg.status === 'paired') {
-                        console.log(`[Android TV Service] Connected to ${ip}`);
-                        const device = Array.from(this.devices.values()).find(d => d.ip === ip);
-                        if (device && device.error) {
-                            device.error = null;
-                            this.emit('device-updated', device);
-                        }
-                    } else if (msg.status === 'failed') {
-                        console.error(`[Android TV Service] Connection failed for ${ip}: ${msg.error}`);
-                        const device = Array.from(this.devices.values()).find(d => d.ip === ip);
-                        if (device) {
-                             device.error = { message: msg.error, action: 'repair', type: 'error' };
-                             this.emit('device-updated', device);
-                        }
-                    } else if (msg.error) {
-                        console.error(`[Android TV Service Error] ${ip}: ${msg.error}`);
-                        // Don't flag transient errors unless persistent
-                    }
+                    msg = JSON.parse(line);
                 } catch (e) {
-                    console.log(`[Android TV Service Raw] ${line}`);
+                    console.log(`[Bridge Raw] ${line}`);
+                    return;
+                }
+                if (msg.bridge === 'ready') {
+                    console.log(`[Bridge] Started (pid ${msg.pid}). Python: ${msg.python_version}`);
+                    return;
+                }
+                if (msg.bridge === 'preloaded') {
+                    console.log(`[Bridge] Preloaded ${msg.types.join(', ') || 'nothing'} in ${msg.elapsed_ms} ms`);
+                    return;
+                }
+                if (msg.ipc === 'dropped') {
+                    console.warn(`[Bridge] ${msg.count} message(s) dropped while output was backed up`);
+                    return;
+                }
+                if (msg.bridge === 'discovery') {
+                    // Live mDNS registry shared by all bridge sessions
+                    this.emit('bridge-discovery', { event: msg.event, record: msg.record });
+                    return;
+                }
+                if (msg.id !== undefined && this.bridgeRequests.has(msg.id) &&
+                    (msg.done || msg.error || ['sent', 'dropped', 'failed', 'error'].includes(msg.status))) {
+                    const pending = this.bridgeRequests.get(msg.id);
+                    this.bridgeRequests.delete(msg.id);
+                    clearTimeout(pending.timer);
+                    if (msg.error || msg.status === 'error') pending.reject(new Error(msg.error || msg.message));
+                    else pending.resolve(msg);
+                }
+                if (msg.bridge === 'flight_dump' && msg.path) {
+                    // Timeline of the bridge traffic before a slow command (or on request)
+                    if (msg.reason === 'slow_command') {
+                        console.warn(`[Bridge] '${msg.command}' on ${msg.device} took ${msg.elapsed_ms} ms; timeline saved to ${msg.path}`);
+                    }
+                    auditLogManager.logAction('bridge', 'flight_dump', {
+                        reason: msg.reason, device: msg.device, command: msg.command, elapsedMs: msg.elapsed_ms, file: msg.path
+                    });
+                    return;
+                }
+                if (msg.device) {
+                    const session = this.bridgeSessions.get(msg.device);
+                    if (session) session.onMessage(msg);
+                    return;
+                }
+                if (msg.error) {
+                    console.error(`[Bridge Error] ${msg.error}`);
                 }
             });
         });
 
         childProc.stderr.on('data', (data) => {
-            console.error(`[Android TV Service Stderr] ${ip}: ${data.toString()}`);
+            const str = data.toString();
+            // Structured diagnostics (gated by the bridge log level) arrive as JSON lines
+            const rest = [];
+            str.split('\n').forEach(line => {
+                if (!line.startsWith('{"log"')) {
+                    if (line.trim()) rest.push(line);
+                    return;
+                }
+                try {
+                    const entry = JSON.parse(line);
+                    const prefix = entry.device ? `[Bridge ${entry.log}] ${entry.device}:` : `[Bridge ${entry.log}]`;
+                    (entry.log === 'error' || entry.log === 'warning' ? console.warn : console.log)(`${prefix} ${entry.message}`);
+                } catch (e) {
+                    rest.push(line);
+                }
+            });
+            const other = rest.join('\n');
+            if (!other) return;
+            // Filter out known asyncio noise from pyatv
+            if (other.includes('Task exception was never retrieved') ||
+                other.includes('Connect call failed') ||
+                other.includes('OSError: [Errno 113]') ||
+                other.includes('future: <Task finished name=')) {
+                return;
+            }
+            console.error(`[Bridge Stderr] ${other}`);
         });
 
         childProc.on('close', (code) => {
-            console.log(`[Android TV Service] Process for ${ip} exited with code ${code}`);
-            this.androidTvProcesses.delete(ip);
+            console.log(`[Bridge] Process exited with code ${code}`);
+            if (this.bridgeProcess === childProc) this.bridgeProcess = null;
+            this.bridgeRequests.forEach(pending => {
+                clearTimeout(pending.timer);
+                pending.reject(new Error('Device bridge exited'));
+            });
+            this.bridgeRequests.clear();
+            const sessions = Array.from(this.bridgeSessions.values());
+            this.bridgeSessions.clear();
+            sessions.forEach(session => session.onExit(code));
         });
 
-        this.androidTvProcesses.set(ip, childProc);
+        this.bridgeProcess = childProc;
+        // Warm the protocol modules for the TVs we know about, so the first
+        // session for each does not pay the import cost
+        const types = new Set();
+        this.devices.forEach(d => {
+            if (d.protocol === 'mdns-airplay' && d.type === 'tv') types.add('appletv');
+            else if (d.protocol === 'mdns-googlecast') types.add('androidtv');
+            else if (d.protocol === 'samsung-tizen') types.add('samsung');
+            if (d.capabilities && d.capabilities.includes('homekit') && d.capabilities.includes('sensor')) types.add('homekit');
+        });
+        if (types.size) childProc.stdin.write(JSON.stringify({ op: 'preload', types: Array.from(types) }) + '\n');
+        // Start the shared discovery registry so sessions can skip their own scans
+        childProc.stdin.write(JSON.stringify({ op: 'discover' }) + '\n');
         return childProc;
     }
 
+    // Runtime verbosity of bridge diagnostics: 'debug', 'info', 'warning', 'error' or 'off'.
+    // The initial level comes from the DELOVA_BRIDGE_LOG environment variable.
+    setBridgeLogLevel(level) {
+        this.getBridgeProcess().stdin.write(JSON.stringify({ op: 'log_level', level }) + '\n');
+    }
+
+    openBridgeSession(type, ip, onMessage, onExit) {
+        const device = `${type}:${ip}`;
+        const handle = {
+            device,
+            ip,
+            exitCode: null,
+            send: (payload) => {
+                if (handle.exitCode !== null) throw new Error(`Bridge session ${device} is closed`);
+                this.getBridgeProcess().stdin.write(JSON.stringify({ ...payload, device }) + '\n');
+            },
+            // Like send(), but resolves with the session's reply for this request
+            // (matched by id) and rejects on an error reply or after timeoutMs.
+            request: (payload, timeoutMs = 20000) => new Promise((resolve, reject) => {
+                const id = `${device}#${++this.bridgeRequestSeq}`;
+                const timer = setTimeout(() => {
+                    this.bridgeRequests.delete(id);
+                    reject(new Error(`No reply from ${device} for '${payload.command}'`));
+                }, timeoutMs);
+                this.bridgeRequests.set(id, { resolve, reject, timer });
+                try {
+                    handle.send({ ...payload, id, timeout: timeoutMs / 1000 });
+                } catch (e) {
+                    clearTimeout(timer);
+                    this.bridgeRequests.delete(id);
+                    reject(e);
+                }
+            }),
+            kill: () => {
+                if (handle.exitCode !== null) return;
+                this.bridgeSessions.delete(device);
+                if (this.bridgeProcess) {
+                    this.bridgeProcess.stdin.write(JSON.stringify({ op: 'remove', device }) + '\n');
+                }
+                handle.exitCode = 0;
+                onExit(0);
+            }
+        };
+
+        // State ('status', 'sensor') arrives as versioned deltas. A gap in the
+        // versions means messages were lost, so ask for the full state; older
+        // deltas that a snapshot already covers are skipped.
+        let stateVersion = 0;
+        this.bridgeSessions.set(device, {
+            onMessage: (msg) => {
+                if (msg.type === 'snapshot') {
+                    stateVersion = Math.max(stateVersion, msg.version);
+                    Object.entries(msg.data || {}).forEach(([type, data]) =>
+                        onMessage({ device, type, data, version: msg.version, snapshot: true }));
+                    return;
+                }
+                if (msg.version !== undefined) {
+                    if (msg.version <= stateVersion) return;
+                    if (msg.version !== stateVersion + 1) {
+                        try {
+                            handle.send({ command: 'snapshot' });
+                        } catch (e) {
+                            // Session closed; nothing left to resync
+                        }
+                    }
+                    stateVersion = msg.version;
+                }
+                onMessage(msg);
+            },
+            onExit: (code) => {
+                handle.exitCode = code === null ? -1 : code;
+                onExit(handle.exitCode);
+            }
+        });
+        this.getBridgeProcess().stdin.write(JSON.stringify({ op: 'add', device, type, ip }) + '\n');
+        return handle;
+    }
+
+    // Send a bridge-level op (no device) and resolve with its 'done' reply.
+    bridgeOp(payload, timeoutMs = 20000) {
+        return new Promise((resolve, reject) => {
+            const id = `bridge#${++this.bridgeRequestSeq}`;
+            const timer = setTimeout(() => {
+                this.bridgeRequests.delete(id);
+                reject(new Error(`No reply from bridge for '${payload.op}'`));
+            }, timeoutMs);
+            this.bridgeRequests.set(id, { resolve, reject, timer });
+            try {
+                this.getBridgeProcess().stdin.write(JSON.stringify({ ...payload, id }) + '\n');
+            } catch (e) {
+                clearTimeout(timer);
+                this.bridgeRequests.delete(id);
+                reject(e);
+            }
+        });
+    }
+
+    // Write the bridge's flight recorder timeline to disk; resolves with its entries.
+    async dumpBridgeFlightRecorder() {
+        const reply = await this.bridgeOp({ op: 'flight_dump' });
+        return { file: reply.path, entries: auditLogManager.loadTimeline(reply.path) };
+    }
+
+    // The bridge session and payload for a command that a TV session can run
+    // as is. Returns null when the command needs the device's full handler:
+    // pairing, Wake-on-LAN, emulated volume, the legacy Samsung protocol, or
+    // media commands that may belong to Spotify.
+    bridgeCommandFor(device, command, value) {
+        if (SPOTIFY_ROUTED_COMMANDS.includes(command)) return null;
+        const withValue = (payload) => (value !== undefined && value !== null ? { ...payload, value } : payload);
+
+        if (device.protocol === 'mdns-googlecast') {
+            if (command === 'pair') return null;
+            return { session: this.getAndroidTvProcess(device.ip), payload: withValue({ command }) };
+        }
+        if (device.protocol === 'samsung-tizen') {
+            const key = SAMSUNG_KEYS[command];
+            if (!key || command === 'turn_on' || this.legacySamsungDevices.has(device.ip)) return null;
+            return { session: this.getSamsungProcess(device.ip), payload: { command: 'key', value: key } };
+        }
+        if (device.protocol === 'mdns-airplay') {
+            if (this.isLocalMachine(device.ip) || !device.deviceId || !this.appleTvCredentials[device.deviceId]) return null;
+            const pyCommand = this.airPlayBridgeCommand(device, command);
+            if (!pyCommand) return null;
+            return { session: this.getAtvProcess(device.ip), payload: withValue({ command: pyCommand }) };
+        }
+        return null;
+    }
+
+    // Press-and-hold on a bridge TV: the session holds the key down (or
+    // repeats it on the device) from hold_start until hold_end, with no
+    // messages in between. Returns false when the device has no hold support.
+    holdKey(device, phase, command) {
+        let session = null;
+        let value = null;
+        if (device.protocol === 'mdns-googlecast') {
+            session = this.getAndroidTvProcess(device.ip);
+            value = command;
+        } else if (device.protocol === 'samsung-tizen' && !this.legacySamsungDevices.has(device.ip)) {
+            value = SAMSUNG_KEYS[command];
+            if (value) session = this.getSamsungProcess(device.ip);
+        } else if (device.protocol === 'mdns-airplay' && !this.isLocalMachine(device.ip) &&
+                   device.deviceId && this.appleTvCredentials[device.deviceId]) {
+            value = this.airPlayBridgeCommand(device, command);
+            if (value) session = this.getAtvProcess(device.ip);
+        }
+        if (!session || !value) return false;
+        try {
+            session.send({ command: phase, value });
+        } catch (e) {
+            console.error(`[DeviceManager] ${phase} failed for ${device.name}: ${e.message}`);
+            return false;
+        }
+        return true;
+    }
+
+    // Run one command on a device group (its name) or a list of device ids, all
+    // at once. Bridge-hosted TVs go out in one 'group' request that the bridge
+    // fans out concurrently. Every other device runs through controlDevice in
+    // parallel. Resolves with { deviceId: { ok, elapsedMs, error } } once every
+    // device has answered or the deadline has passed.
+    async controlGroup(target, command, value, { concurrency = 16, deadlineMs = 10000 } = {}) {
+        const ids = Array.isArray(target) ? target : (this.deviceGroups[target] || {}).devices;
+        if (!ids) throw new Error(`Unknown device group '${target}'`);
+
+        const results = {};
+        const bridged = new Map(); // bridge device key -> device
+        const requests = [];
+        const direct = [];
+        ids.forEach(id => {
+            const device = this.devices.get(id);
+            let routed = null;
+            try {
+                routed = device ? this.bridgeCommandFor(device, command, value) : null;
+            } catch (e) {
+                routed = null; // Session could not be opened; let controlDevice report it
+            }
+            if (routed) {
+                bridged.set(routed.session.device, device);
+                requests.push({ ...routed.payload, device: routed.session.device });
+            } else {
+                direct.push(id);
+            }
+        });
+
+        const runBridged = async () => {
+            if (!requests.length) return;
+            try {
+                const reply = await this.bridgeOp({ op: 'group', requests, concurrency, deadline: deadlineMs / 1000 }, deadlineMs + 2000);
+                Object.entries(reply.results || {}).forEach(([key, result]) => {
+                    const device = bridged.get(key);
+                    if (!device) return;
+                    results[device.id] = { ok: result.ok, elapsedMs: result.elapsed_ms, error: result.error };
+                    if (result.ok && (command === 'turn_off' || command === 'turn_on')) {
+                        device.state.on = command === 'turn_on';
+                        this.emit('device-updated', device);
+                    }
+                });
+            } catch (e) {
+                bridged.forEach(device => { results[device.id] = { ok: false, error: e.message }; });
+            }
+        };
+
+        const stopAt = Date.now() + deadlineMs;
+        const runDirect = async () => {
+            let next = 0;
+            const worker = async () => {
+                while (next < direct.length) {
+                    const id = direct[next++];
+                    const started = Date.now();
+                    if (started >= stopAt) {
+                        results[id] = { ok: false, error: 'Deadline exceeded' };
+                        continue;
+                    }
+                    let timer;
+                    try {
+                        const deadline = new Promise((_, reject) => {
+                            timer = setTimeout(() => reject(new Error('Deadline exceeded')), stopAt - started);
+                        });
+                        const device = await Promise.race([this.controlDevice(id, command, value), deadline]);
+                        results[id] = device ? { ok: true, elapsedMs: Date.now() - started }
+                                             : { ok: false, elapsedMs: Date.now() - started, error: 'Unknown device' };
+                    } catch (e) {
+                        results[id] = { ok: false, elapsedMs: Date.now() - started, error: e.message };
+                    } finally {
+                        clearTimeout(timer);
+                    }
+                }
+            };
+            await Promise.all(Array.from({ length: Math.min(concurrency, direct.length) }, worker));
+        };
+
+        await Promise.all([runBridged(), runDirect()]);
+        return results;
+    }
+
+    getAndroidTvProcess(ip) {
+        if (this.androidTvProcesses.has(ip)) {
+            return this.androidTvProcesses.get(ip);
+        }
+        console.log(`[DeviceManager] Opening Android TV session for ${ip}...`);
+
+        const session = this.openBridgeSession('androidtv', ip,
+            (msg) => this.handleAndroidTvServiceMessage(ip, msg),
+            (code) => {
+                console.log(`[Android TV Service] Session for ${ip} closed (${code})`);
+                if (this.androidTvProcesses.get(ip) === session) this.androidTvProcesses.delete(ip);
+            });
+
+        this.androidTvProcesses.set(ip, session);
+        return session;
+    }
+
+    handleAndroidTvServiceMessage(ip, msg) {
+        // Log everything for debug
+        if (msg.status === 'debug') {
+            console.log(`[Android TV Debug] ${msg.message}`);
+        }
+
+        if (msg.error === 'missing_dependency') {
+            console.warn(`[Android TV] Missing dependency: ${msg.module}. Attempting auto-install...`);
+            this.installPythonDependency(this.findServicePython(), msg.module, ip, (success) => {
+                if (success) {
+                    console.log(`[Android TV] Restarting service for ${ip}...`);
+                    const session = this.androidTvProcesses.get(ip);
+                    if (session) session.kill();
+                    setTimeout(() => this.getAndroidTvProcess(ip), 1000);
+                }
+            });
+        } else if (msg.status === 'pairing_required') {
+            console.log(`[Android TV Service] Pairing required for ${ip}. Please check TV for code.`);
+            this.emit('pairing-required', { ip: ip, name: 'Android TV', type: 'android-tv' });
+        } else if (msg.status === 'connected' || msg.status === 'paired') {
+            console.log(`[Android TV Service] Connected to ${ip}`);
+            const device = Array.from(this.devices.values()).find(d => d.ip === ip);
+            if (device && device.error) {
+                device.error = null;
+                this.emit('device-updated', device);
+            }
+        } else if (msg.status === 'failed') {
+            console.error(`[Android TV Service] Connection failed for ${ip}: ${msg.error}`);
+            const device = Array.from(this.devices.values()).find(d => d.ip === ip);
+            if (device) {
+                 device.error = { message: msg.error, action: 'repair', type: 'error' };
+                 this.emit('device-updated', device);
+            }
+        } else if (msg.type === 'link') {
+            this.logLinkState('Android TV Service', ip, msg);
+        } else if (msg.type === 'status') {
+            this.applyMediaStatus(ip, msg.data);
+        } else if (msg.error) {
+            console.error(`[Android TV Service Error] ${ip}: ${msg.error}`);
+            // Don't flag transient errors unless persistent
+        }
+    }
+
     submitAndroidTvPairingPin(ip, pin) {
         console.log(`[DeviceManager] Submitting PIN for ${ip}`);
         const process = this.androidTvProcesses.get(ip);
         if (process) {
-            process.stdin.write(JSON.stringify({ type: 'pin', pin: pin }) + '\n');
+            process.send({ type: 'pin', pin: pin });
             return true;
         }
         console.warn(`[DeviceManager] No process found for ${ip} to submit PIN`);
@@ -2752,193 +3178,84 @@ class DeviceManager extends EventEmitter {
             return this.atvProcesses.get(ip);
         }
 
-        console.log(`[DeviceManager] Spawning persistent ATV service for ${ip}...`);
-        const { spawn } = require('child_process');
-        
-        // Try to find the correct python executable
-        const isWin = process.platform === 'win32';
-        let candidates = [];
-        
-        if (isWin) {
-            candidates = [
-                path.join(__dirname, '../.venv/Scripts/python.exe'),
-                path.join(__dirname, '../../.venv/Scripts/python.exe'),
-                path.join(process.cwd(), '.venv/Scripts/python.exe'),
-                path.join(process.cwd(), 'python.exe'),
-                path.join(__dirname, '../python.exe')
-            ];
-        } else {
-            candidates = [
-                // Standard relative paths
-                path.join(__dirname, '../.venv/bin/python'),
-                path.join(__dirname, '../.venv/bin/python3'),
-                // Parent logic
-                path.join(__dirname, '../../.venv/bin/python'),
-                
-                // CWD relative
-                path.join(process.cwd(), '.venv/bin/python'),
-                path.join(process.cwd(), '.venv/bin/python3'),
-                
-                // Common absolute paths (Raspberry Pi default)
-                '/home/pi/DelovaHome/.venv/bin/python',
-                '/home/pi/DelovaHome/.venv/bin/python3',
-                
-                // Fallback valid system paths
-                '/usr/bin/python3',
-                '/usr/local/bin/python3'
-            ];
-        }
-
-        let pythonPath = isWin ? 'python' : 'python3';
-        
-        // Find first valid candidate
-        for (const cand of candidates) {
-            try {
-                if (fs.existsSync(cand)) { 
-                     pythonPath = cand;
-                     // Only check for win config if actually on win to save IO
-                     if (isWin) {
-                         // ... (win specific check omitted for brevity in replacement if logically identical)
-                     }
-                     break;
-                }
-            } catch (e) {}
-        }
+        console.log(`[DeviceManager] Opening ATV session for ${ip}...`);
 
-        // Only log warning if we are truly falling back to a raw command string
-        // and we couldn't find a specific binary path
-        if (!pythonPath.includes('/') && !pythonPath.includes('\\')) {
-             console.warn(`[DeviceManager] Virtual env python not found, falling back to system '${pythonPath}'. (Checked ${candidates.length} locations)`);
-        }
+        const session = this.openBridgeSession('appletv', ip,
+            (msg) => this.handleAtvServiceMessage(ip, msg, session),
+            (code) => {
+                console.log(`[ATV Service] Session for ${ip} closed (${code})`);
+                if (this.atvProcesses.get(ip) === session) this.atvProcesses.delete(ip);
+            });
 
-        const scriptPath = path.join(__dirname, 'atv_service.py');
-        
-        const childProc = spawn(pythonPath, [scriptPath, ip]);
-        
-        childProc.stdout.on('data', (data) => {
-            const lines = data.toString().split('\n');
-            lines.forEach(line => {
-                if (!line.trim()) return;
-                try {
-                    const msg = JSON.parse(line);
-                    if (msg.status === 'connected') {
-                        console.log(`[ATV Service] Connected to ${ip}`);
-                        // Immediately fetch status to sync UI
-                        childProc.stdin.write(JSON.stringify({ command: 'status' }) + '\n');
-                    } else if (msg.error) {
-                        const device = Array.from(this.devices.values()).find(d => d.ip === ip);
-                        
-                        // Handle critical errors that require user attention
-                        if (msg.error.includes('blocked') || msg.error.includes('remote_control') || msg.error.includes('AirPlay protocol')) {
-                             console.error(`[ATV Service Error] ${ip}: ${msg.error}`);
-                             if (device) {
-                                device.error = {
-                                    message: msg.error,
-                                    type: 'auth_error',
-                                    action: 'repair'
-                                };
-                                this.emit('device-updated', device);
-                            }
-                        }
-                        // Suppress common connection errors to avoid log spam
-                        else if (!msg.error.includes('Could not find Apple TV') && 
-                            !msg.error.includes('Not connected') &&
-                            !msg.error.includes('Connection failed')) {
-                            console.error(`[ATV Service Error] ${ip}: ${msg.error}`);
-                        }
-                    } else if (msg.type === 'status') {
-                        // Update device state
-                        const device = Array.from(this.devices.values()).find(d => d.ip === ip);
-                        if (device) {
-                            if (device.error) {
-                                device.error = null; // Clear error on successful status
-                                this.emit('device-updated', device);
-                            }
+        this.atvProcesses.set(ip, session);
+        return session;
+    }
 
-                            const status = msg.data;
-                            let updated = false;
-                            
-                            if (status.on !== undefined && device.state.on !== status.on) {
-                                device.state.on = status.on;
-                                updated = true;
-                            }
-                            if (status.volume !== undefined && device.state.volume !== status.volume) {
-                                device.state.volume = status.volume;
-                                updated = true;
-                            }
-                            if (status.title !== device.state.mediaTitle) {
-                                device.state.mediaTitle = status.title;
-                                updated = true;
-                            }
-                            if (status.artist !== device.state.mediaArtist) {
-                                device.state.mediaArtist = status.artist;
-                                updated = true;
-                            }
-                            if (status.album !== device.state.mediaAlbum) {
-                                device.state.mediaAlbum = status.album;
-                                updated = true;
-                            }
-                            if (status.app !== device.state.mediaApp) {
-                                device.state.mediaApp = status.app;
-                                updated = true;
-                            }
-                            if (status.playing_state !== undefined && device.state.playingState !== status.playing_state) {
-                                device.state.playingState = status.playing_state;
-                                updated = true;
-                            }
-                            if (updated) this.emit('device-updated', device);
-                        }
-                    }
-                } catch (e) {
-                    // console.error('[ATV Service] Parse error:', e);
+    handleAtvServiceMessage(ip, msg, session) {
+        if (msg.status === 'connected') {
+            console.log(`[ATV Service] Connected to ${ip}`);
+            // Immediately fetch status to sync UI
+            session.send({ command: 'status' });
+        } else if (msg.error) {
+            const device = Array.from(this.devices.values()).find(d => d.ip === ip);
+            
+            // Handle critical errors that require user attention
+            if (msg.type === 'auth_required') {
+                 console.error(`[ATV Service Error] ${ip}: ${msg.error}`);
+                 if (device) {
+                    device.error = {
+                        message: msg.error,
+                        type: 'auth_error',
+                        action: 'repair'
+                    };
+                    this.emit('device-updated', device);
                 }
-            });
-        });
-
-        childProc.stderr.on('data', (data) => {
-            const str = data.toString();
-            // Filter out known asyncio noise from pyatv
-            if (str.includes('Task exception was never retrieved') || 
-                str.includes('Connect call failed') ||
-                str.includes('OSError: [Errno 113]') ||
-                str.includes('future: <Task finished name=')) {
-                return; 
             }
-            console.error(`[ATV Service Stderr] ${ip}: ${str}`);
-        });
-
-        childProc.on('close', (code) => {
-            console.log(`[ATV Service] Process for ${ip} exited with code ${code}`);
-            this.atvProcesses.delete(ip);
-        });
-
-        this.atvProcesses.set(ip, childProc);
-        return childProc;
+            // The session reconnects in the background; link events cover these
+            else if (!['not_connected', 'unavailable', 'connection_lost'].includes(msg.type)) {
+                console.error(`[ATV Service Error] ${ip}: ${msg.error}`);
+            }
+        } else if (msg.type === 'link') {
+            this.logLinkState('ATV Service', ip, msg);
+        } else if (msg.type === 'status') {
+            this.applyMediaStatus(ip, msg.data);
+        }
     }
 
-    async handleAirPlayCommand(device, command, value) {
-        // Check if target is local machine (Server running on the Mac we want to control)
-        if (this.isLocalMachine(device.ip)) {
-             console.log(`[Local Control] Executing command '${command}' locally via AppleScript...`);
-             return this.handleLocalMacCommand(command, value);
+    logLinkState(label, ip, msg) {
+        // Reconnect supervisor transitions: down -> (open after repeated failures) -> up
+        if (msg.state === 'up') {
+            console.log(`[${label}] Link to ${ip} restored`);
+        } else if (msg.state === 'open') {
+            console.warn(`[${label}] ${ip} unreachable after ${msg.failures} attempts; failing fast, next retry in ${msg.retry_in}s`);
+        } else {
+            console.warn(`[${label}] Link to ${ip} down${msg.error ? `: ${msg.error}` : ''}`);
         }
+    }
 
-        if (!device.deviceId) {
-            console.log(`[AirPlay] Cannot control ${device.name}: No device ID found.`);
-            return;
-        }
+    applyMediaStatus(ip, status) {
+        // Shared by the Apple TV and Android TV sessions, which report the same
+        // schema. Status messages only carry the fields that changed.
+        const device = Array.from(this.devices.values()).find(d => d.ip === ip);
+        if (device) {
+            let updated = false;
+            if (device.error) {
+                device.error = null; // Clear error on successful status
+                updated = true;
+            }
 
-        // Check if we have credentials for this device
-        // The credentials file is keyed by MAC address (deviceId)
-        const deviceCreds = this.appleTvCredentials[device.deviceId];
-        if (!deviceCreds) {
-            console.log(`[AirPlay] Cannot control ${device.name}: Not paired. Run 'python script/pair_atv.py' to pair.`);
-            return;
+            Object.entries(MEDIA_STATUS_FIELDS).forEach(([field, key]) => {
+                if (status[field] !== undefined && device.state[key] !== status[field]) {
+                    device.state[key] = status[field];
+                    updated = true;
+                }
+            });
+            if (updated) this.emit('device-updated', device);
         }
+    }
 
-        console.log(`[AirPlay] Sending command '${command}' to ${device.name} via Persistent Service...`);
-
-        // Map commands to Python script arguments
+    // Map commands to the Apple TV session's command names (null when unsupported)
+    airPlayBridgeCommand(device, command) {
         let pyCommand = null;
         if (command === 'turn_on') pyCommand = 'turn_on';
         else if (command === 'turn_off') pyCommand = 'turn_off';
@@ -2957,11 +3274,38 @@ class DeviceManager extends EventEmitter {
         else if (command === 'volume_up') pyCommand = 'volume_up';
         else if (command === 'volume_down') pyCommand = 'volume_down';
         else if (command === 'set_volume') pyCommand = 'set_volume';
+        else if (command === 'sequence' || command === 'macro') pyCommand = command;
         else if (command === 'toggle') {
             // Power toggle
             pyCommand = device.state.on ? 'turn_off' : 'turn_on';
         }
-        
+        return pyCommand;
+    }
+
+    async handleAirPlayCommand(device, command, value) {
+        // Check if target is local machine (Server running on the Mac we want to control)
+        if (this.isLocalMachine(device.ip)) {
+             console.log(`[Local Control] Executing command '${command}' locally via AppleScript...`);
+             return this.handleLocalMacCommand(command, value);
+        }
+
+        if (!device.deviceId) {
+            console.log(`[AirPlay] Cannot control ${device.name}: No device ID found.`);
+            return;
+        }
+
+        // Check if we have credentials for this device
+        // The credentials file is keyed by MAC address (deviceId)
+        const deviceCreds = this.appleTvCredentials[device.deviceId];
+        if (!deviceCreds) {
+            console.log(`[AirPlay] Cannot control ${device.name}: Not paired. Run 'python script/pair_atv.py' to pair.`);
+            return;
+        }
+
+        console.log(`[AirPlay] Sending command '${command}' to ${device.name} via Persistent Service...`);
+
+        const pyCommand = this.airPlayBridgeCommand(device, command);
+
         if (!pyCommand) {
             console.log(`[AirPlay] Command ${command} not supported via Python script yet.`);
             return;
@@ -2973,7 +3317,7 @@ class DeviceManager extends EventEmitter {
             payload.value = value;
         }
         
-        process.stdin.write(JSON.stringify(payload) + '\n');
+        process.send(payload);
     }
 
     async handleAndroidTvCommand(device, command, value) {
@@ -2985,7 +3329,7 @@ class DeviceManager extends EventEmitter {
         if (command === 'pair') {
             const payload = { type: 'pin', pin: value };
             try {
-                process.stdin.write(JSON.stringify(payload) + '\n');
+                process.send(payload);
                 console.log(`[Android TV] Sent pairing PIN to ${device.ip}`);
             } catch(e) {
                 console.error(`[Android TV] Failed to send PIN to ${device.ip}: ${e.message}`);
@@ -2999,7 +3343,7 @@ class DeviceManager extends EventEmitter {
         }
         
         try {
-            process.stdin.write(JSON.stringify(payload) + '\n');
+            process.send(payload);
         } catch(e) {
             console.error(`[Android TV] Failed to send command to ${device.ip}: ${e.message}`);
         }
@@ -3029,7 +3373,7 @@ class DeviceManager extends EventEmitter {
                         const tokens = JSON.parse(fs.readFileSync(tokenPath));
                         if (tokens[device.ip]) {
                             delete tokens[device.ip];
-                            fs.writeFileSync(tokenPath, JSON.stringify(tokens, null, 2));
+                            writeJsonAtomic(tokenPath, tokens);
                             console.log(`[Samsung] Token removed from disk for ${device.ip}`);
                         }
                     }
@@ -3044,18 +3388,24 @@ class DeviceManager extends EventEmitter {
             return;
         }
 
+        if (command === 'sequence' || command === 'macro') {
+            // Run the whole key sequence inside the Python session (one IPC message)
+            this.getSamsungProcess(device.ip).send({ command, value });
+            return;
+        }
+
         if (command === 'launch_app') {
             console.log(`[Samsung] Launching app ${value} on ${device.name}`);
             try {
                 const process = this.getSamsungProcess(device.ip);
-                if (process.exitCode !== null) throw new Error("Samsung service process is dead");
+                if (process.exitCode !== null) throw new Error("Samsung service session is closed");
 
                 // Send launch_app command to python service
                 const payload = {
                     method: 'launch_app',
                     app_id: value
                 };
-                process.stdin.write(JSON.stringify(payload) + '\n');
+                process.send(payload);
                 return;
             } catch(e) {
                 console.error(`[Samsung] Failed to launch app via Python: ${e.message}`);
@@ -3065,18 +3415,7 @@ class DeviceManager extends EventEmitter {
             }
         }
 
-        const keyMap = {
-            'turn_off': 'KEY_POWEROFF', 'toggle': 'KEY_POWER', // Use KEY_POWER for toggle to avoid accidental shutdown during pairing
-            'turn_on': 'KEY_POWERON',
-            'channel_up': 'KEY_CHUP', 'channel_down': 'KEY_CHDOWN',
-            'volume_up': 'KEY_VOLUP', 'volume_down': 'KEY_VOLDOWN',
-            'play': 'KEY_PLAY', 'pause': 'KEY_PAUSE', 'stop': 'KEY_STOP',
-            'next': 'KEY_FF', 'previous': 'KEY_REWIND',
-            'up': 'KEY_UP', 'down': 'KEY_DOWN', 'left': 'KEY_LEFT', 'right': 'KEY_RIGHT',
-            'select': 'KEY_ENTER', 'enter': 'KEY_ENTER',
-            'back': 'KEY_RETURN', 'home': 'KEY_HOME', 'menu': 'KEY_MENU'
-        };
-        let key = keyMap[command];
+        let key = SAMSUNG_KEYS[command];
 
         if (command === 'set_input') {
             const inputMap = { 'tv': 'KEY_TV', 'hdmi1': 'KEY_HDMI1', 'hdmi2': 'KEY_HDMI2', 'hdmi3': 'KEY_HDMI3', 'hdmi4': 'KEY_HDMI4' };
@@ -3138,10 +3477,6 @@ class DeviceManager extends EventEmitter {
         } else {
             // Try Python method first (Persistent Service)
             try {
-                // We use a timeout race to detect if the persistent service is unresponsive or dead
-                // But since sendSamsungKeyPython is now fire-and-forget, it returns immediately.
-                // We need to check if the process is actually running and healthy.
-                
                 const process = this.getSamsungProcess(device.ip);
                 if (process.exitCode !== null) {
                      throw new Error("Samsung service process is dead");
@@ -3200,136 +3535,71 @@ class DeviceManager extends EventEmitter {
             return this.samsungProcesses.get(ip);
         }
 
-        console.log(`[DeviceManager] Spawning persistent Samsung service for ${ip}...`);
-        const { spawn } = require('child_process');
-        
-        let pythonPath = this.pythonPath;
+        console.log(`[DeviceManager] Opening Samsung session for ${ip}...`);
 
-        if (!pythonPath) {
-            const isWin = process.platform === 'win32';
-            let candidates = [];
-            
-            if (isWin) {
-                candidates = [
-                    path.join(__dirname, '../.venv/Scripts/python.exe'),
-                    path.join(__dirname, '../../.venv/Scripts/python.exe'),
-                    path.join(process.cwd(), '.venv/Scripts/python.exe'),
-                    path.join(process.cwd(), 'python.exe'),
-                    path.join(__dirname, '../python.exe'),
-                    path.join(__dirname, '../../python.exe'),
-                    path.join(__dirname, '../.venv/python.exe'),
-                    path.join(process.cwd(), '.venv/python.exe')
-                ];
-            } else {
-                candidates = [
-                    path.join(process.cwd(), '.venv/bin/python'),
-                    '/home/pi/DelovaHome/.venv/bin/python',
-                    path.join(__dirname, '../.venv/bin/python'),
-                    path.join(__dirname, '../../.venv/bin/python')
-                ];
-            }
+        const session = this.openBridgeSession('samsung', ip,
+            (msg) => this.handleSamsungServiceMessage(ip, msg),
+            (code) => {
+                console.log(`[Samsung Service] Session for ${ip} closed (${code})`);
+                if (this.samsungProcesses.get(ip) === session) this.samsungProcesses.delete(ip);
+            });
 
-            // Default fallback
-            pythonPath = isWin ? 'python' : 'python3';
+        this.samsungProcesses.set(ip, session);
+        return session;
+    }
 
-            // Check candidates
-            for (const cand of candidates) {
-                try {
-                    if (fs.existsSync(cand)) {
-                        pythonPath = cand;
-                        console.log(`[DeviceManager] Found valid Python env: ${cand}`);
-                        break;
-                    } else {
-                         console.log(`[DeviceManager] Python env not found at: ${cand}`);
-                    }
-                } catch(e) {
-                     console.log(`[DeviceManager] Error checking Python env ${cand}: ${e.message}`);
+    handleSamsungServiceMessage(ip, msg) {
+        if (msg.status === 'connected') {
+            console.log(`[Samsung Service] Connected to ${ip} (Port: ${msg.port || 'unknown'})`);
+        } else if (msg.status === 'sent') {
+            console.log(`[Samsung Service] Successfully sent '${msg.key}' to ${ip}`);
+        } else if (msg.status === 'dropped') {
+            console.warn(`[Samsung Service] Dropped '${msg.key}' for ${ip} (${msg.reason})`);
+        } else if (msg.type === 'link') {
+            this.logLinkState('Samsung Service', ip, msg);
+        } else if (msg.type === 'status') {
+            const device = Array.from(this.devices.values()).find(d => d.ip === ip);
+            if (device) {
+                const status = msg.data;
+                let updated = false;
+
+                if (status.on !== undefined && device.state.on !== status.on) {
+                    device.state.on = status.on;
+                    updated = true;
+                }
+                if (status.model && device.model !== status.model) {
+                    device.model = status.model;
+                    updated = true;
                 }
+                if (status.network_type && device.state.networkType !== status.network_type) {
+                    device.state.networkType = status.network_type;
+                    updated = true;
+                }
+
+                if (updated) this.emit('device-updated', device);
             }
-            
-            this.pythonPath = pythonPath; // Cache it
-            console.log(`[DeviceManager] Selected Python interpreter: ${this.pythonPath}`);
+        } else if (msg.status === 'debug') {
+            console.log(`[Samsung Debug] ${msg.message}`);
+        } else if (msg.error === 'legacy_detected') {
+            console.log(`[Samsung Service] Legacy TV detected at ${ip}. Switching to legacy protocol.`);
+            this.legacySamsungDevices.add(ip);
+        } else if (msg.error) {
+            console.error(`[Samsung Service Error] ${ip}: ${msg.error}`);
         }
-
-        const scriptPath = path.join(__dirname, 'samsung_service.py');
-        
-        console.log(`[DeviceManager] Spawning: ${pythonPath} ${scriptPath} ${ip}`);
-        const childProc = spawn(pythonPath, [scriptPath, ip]);
-
-        childProc.stderr.on('data', (data) => {
-            console.error(`[Samsung Service ERROR] ${ip}: ${data.toString()}`);
-        });
-        
-        childProc.stdout.on('data', (data) => {
-             // Increase listeners limit if needed or clean up properly
-            if (childProc.stdout.getMaxListeners() < 20) childProc.stdout.setMaxListeners(20);
-
-            const lines = data.toString().split('\n');
-            lines.forEach(line => {
-                if (!line.trim()) return;
-                try {
-                    const msg = JSON.parse(line);
-                    if (msg.status === 'connected') {
-                        console.log(`[Samsung Service] Connected to ${ip} (Port: ${msg.port || 'unknown'})`);
-                    } else if (msg.status === 'sent') {
-                        console.log(`[Samsung Service] Successfully sent '${msg.key}' to ${ip}`);
-                    } else if (msg.status === 'debug') {
-                        console.log(`[Samsung Debug] ${msg.message}`);
-                    } else if (msg.error === 'legacy_detected') {
-                        console.log(`[Samsung Service] Legacy TV detected at ${ip}. Switching to legacy protocol.`);
-                        this.legacySamsungDevices.add(ip);
-                    } else if (msg.error) {
-                        console.error(`[Samsung Service Error] ${ip}: ${msg.error}`);
-                    }
-                } catch (e) {}
-            });
-        });
-
-        childProc.stderr.on('data', (data) => {
-            // console.error(`[Samsung Service Stderr] ${ip}: ${data}`);
-        });
-
-        childProc.on('close', (code) => {
-            console.log(`[Samsung Service] Process for ${ip} exited with code ${code}`);
-            this.samsungProcesses.delete(ip);
-        });
-
-        this.samsungProcesses.set(ip, childProc);
-        return childProc;
     }
 
     async sendSamsungKeyPython(device, key) {
         if (this.legacySamsungDevices.has(device.ip)) {
             throw new Error("Legacy Samsung TV detected, forcing fallback");
         }
-        const process = this.getSamsungProcess(device.ip);
-        process.stdin.write(JSON.stringify({ command: 'key', value: key }) + '\n');
-        // We assume success for speed, but if the service crashes or reports legacy, 
-        // the next command might fail or we might want to handle it.
-        // For now, this is "fire and forget" to the persistent service.
-        // If the service is dead, getSamsungProcess will respawn it.
-        
-        // However, to support fallback for the 2015 TV, we need to know if it failed.
-        // Since we can't easily await the result from the stream without complex logic,
-        // we will rely on the service staying alive for Tizen.
-        // If the service exits (e.g. legacy detected), we should probably catch that?
-        
-        // Actually, if it's legacy, the service might just sit there or exit.
-        // Let's add a small delay and check if process is still alive? No that's slow.
-        
-        // Better approach: If the user complains about 2015 TV, it's likely legacy.
-        // The persistent service checks for port 8002. If closed, it prints "legacy_detected".
-        // But we are not reading that here.
-        
-        // Let's just return true here. If it fails, the user will report it.
-        // But wait, the previous code had a try/catch fallback!
-        // If I replace it with this, I lose the fallback!
-        
-        // I must implement a way to know if it failed.
-        // Or, I can keep the old one-off script for the first attempt? No.
-        
-        // Let's make sendSamsungKeyPython return a Promise that resolves quickly?
-        return Promise.resolve();
+        const session = this.getSamsungProcess(device.ip);
+        // Resolves once the key went out; a key the TV could not take in time
+        // comes back as 'dropped' so the caller can try the legacy protocol.
+        const reply = await session.request({ command: 'key', value: key }, 5000);
+        if (reply.status === 'dropped') {
+            throw new Error(`Key '${key}' dropped (${reply.reason})`);
+        }
+        return reply;
     }
 
     // Deprecated: kept for reference but unused
@@ -3633,7 +3903,7 @@ class DeviceManager extends EventEmitter {
             } catch (e) {}
         }
         Object.assign(existing, newCreds);
-        fs.writeFileSync(credsPath, JSON.stringify(existing, null, 2));
+        writeJsonAtomic(credsPath, existing);
         this.appleTvCredentials = existing; // Update in-memory
         console.log('Credentials saved.');
     }
@@ -4280,9 +4550,9 @@ class DeviceManager extends EventEmitter {
                 // Trigger a refresh via the persistent process if available
                 if (this.atvProcesses.has(ip)) {
                     const proc = this.atvProcesses.get(ip);
-                    if (proc && proc.stdin) {
+                    if (proc) {
                         try {
-                            proc.stdin.write(JSON.stringify({ command: 'status' }) + '\n');
+                            proc.send({ command: 'status' });
                         } catch (e) {
                             console.error(`[DeviceManager] Failed to request status for ${ip}:`, e);
                         }
@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import tempfile
+
+# Stand-in TVs for benchmarks and manual testing without hardware. Each one
+# listens on its own loopback address (127.0.0.2, 127.0.0.3, ...), so a
+# session sees a separate "TV" per IP exactly as on the LAN. Linux routes all
+# of 127.0.0.0/8 to loopback; other systems only have 127.0.0.1.
+
+try:
+    from aiohttp import web
+except ImportError:
+    web = None
+
+SAMSUNG_PORT = 8001
+ANDROIDTV_PORT = 6466
+
+# androidtvremote2 drops a link that has been silent for 16 s; real TVs ping every 5 s
+ANDROIDTV_PING_INTERVAL = 5.0
+
+# Feature bits a TV advertises in remote_configure (keys, app links, volume, power)
+ANDROIDTV_FEATURES = 622
+
+
+def standin_ip(index):
+    return f'127.0.0.{index + 2}'
+
+
+class SamsungStandIn:
+    """Tizen TV: the ``/api/v2/`` REST info and the remote-control websocket.
+
+    Serves plain HTTP/WS on port 8001 and reports ``TokenAuthSupport`` false,
+    so clients use the unencrypted port. Counts connections and every
+    ``ms.remote.control`` message as one key.
+    """
+
+    def __init__(self, host, port=SAMSUNG_PORT, token='standin-token'):
+        self.host = host
+        self.port = port
+        self.token = token
+        self.keys = 0
+        self.connections = 0
+        self.sockets = set()
+        self.runner = None
+
+    async def start(self):
+        if web is None:
+            raise RuntimeError('aiohttp is required for the Samsung stand-in')
+        app = web.Application()
+        app.router.add_get('/api/v2/', self.info)
+        app.router.add_get('/api/v2/channels/samsung.remote.control', self.remote)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, self.host, self.port).start()
+
+    async def info(self, request):
+        return web.json_response({
+            'name': f'Stand-in {self.host}',
+            'device': {
+                'name': f'Stand-in {self.host}',
+                'modelName': 'STANDIN',
+                'PowerState': 'on',
+                'TokenAuthSupport': 'false',
+                'networkType': 'wired',
+                'OS': 'Tizen',
+            },
+        })
+
+    async def remote(self, request):
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.connections += 1
+        self.sockets.add(ws)
+        try:
+            await ws.send_json({'event': 'ms.channel.connect', 'data': {'token': self.token, 'clients': []}})
+            async for msg in ws:
+                if msg.type != web.WSMsgType.TEXT:
+                    continue
+                try:
+                    data = json.loads(msg.data)
+                except ValueError:
+                    continue
+                if data.get('method') == 'ms.remote.control':
+                    self.keys += 1
+        finally:
+            self.sockets.discard(ws)
+        return ws
+
+    async def drop(self):
+        """Close every open remote connection, as a TV does when it reboots."""
+        await asyncio.gather(*(ws.close() for ws in list(self.sockets)), return_exceptions=True)
+
+    async def stop(self):
+        await self.drop()
+        if self.runner:
+            await self.runner.cleanup()
+
+
+def _write_varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+async def _read_varint(reader):
+    shift = 0
+    value = 0
+    while True:
+        byte = (await reader.readexactly(1))[0]
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return value
+        shift += 7
+
+
+class AndroidTVStandIn:
+    """Google TV remote service (the androidtvremote2 protocol) on TLS port 6466.
+
+    Runs the TV side of the handshake (configure, set_active, start), reports
+    power, volume and the foreground app, pings like a real TV and counts
+    connections and the keys it receives. Any client certificate is accepted, so no pairing is
+    needed.
+    """
+
+    def __init__(self, host, cert_dir, port=ANDROIDTV_PORT):
+        self.host = host
+        self.port = port
+        self.cert_dir = cert_dir
+        self.keys = 0
+        self.connections = 0
+        self.writers = set()
+        self.server = None
+
+    def ssl_context(self):
+        from androidtvremote2.certificate_generator import generate_selfsigned_cert
+        cert_file = os.path.join(self.cert_dir, 'standin-tv-cert.pem')
+        key_file = os.path.join(self.cert_dir, 'standin-tv-key.pem')
+        if not os.path.exists(cert_file):
+            cert_pem, key_pem = generate_selfsigned_cert('StandInTV')
+            with open(cert_file, 'wb') as f:
+                f.write(cert_pem)
+            with open(key_file, 'wb') as f:
+                f.write(key_pem)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        return context
+
+    async def start(self):
+        from androidtvremote2.remotemessage_pb2 import RemoteMessage
+        self.message_type = RemoteMessage
+        self.server = await asyncio.start_server(self.handle, self.host, self.port, ssl=self.ssl_context())
+
+    def send(self, writer, msg):
+        data = msg.SerializeToString()
+        writer.write(_write_varint(len(data)) + data)
+
+    async def ping(self, writer):
+        counter = 0
+        while True:
+            await asyncio.sleep(ANDROIDTV_PING_INTERVAL)
+            counter += 1
+            msg = self.message_type()
+            msg.remote_ping_request.val1 = counter
+            self.send(writer, msg)
+
+    def started_messages(self):
+        start = self.message_type()
+        start.remote_start.started = True
+        volume = self.message_type()
+        volume.remote_set_volume_level.volume_max = 100
+        volume.remote_set_volume_level.volume_level = 20
+        volume.remote_set_volume_level.volume_muted = False
+        app = self.message_type()
+        app.remote_ime_key_inject.app_info.app_package = 'com.google.android.tvlauncher'
+        return [start, volume, app]
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        self.writers.add(writer)
+        pinger = asyncio.create_task(self.ping(writer))
+        try:
+            configure = self.message_type()
+            configure.remote_configure.code1 = ANDROIDTV_FEATURES
+            configure.remote_configure.device_info.model = 'StandIn'
+            configure.remote_configure.device_info.vendor = 'DelovaHome'
+            configure.remote_configure.device_info.app_version = '1.0.0'
+            self.send(writer, configure)
+            while True:
+                length = await _read_varint(reader)
+                msg = self.message_type()
+                msg.ParseFromString(await reader.readexactly(length))
+                if msg.HasField('remote_configure'):
+                    reply = self.message_type()
+                    reply.remote_set_active.active = ANDROIDTV_FEATURES
+                    self.send(writer, reply)
+                elif msg.HasField('remote_set_active'):
+                    for reply in self.started_messages():
+                        self.send(writer, reply)
+                elif msg.HasField('remote_key_inject'):
+                    self.keys += 1
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            pinger.cancel()
+            self.writers.discard(writer)
+            writer.close()
+
+    async def drop(self):
+        for writer in list(self.writers):
+            writer.close()
+
+    async def stop(self):
+        await self.drop()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+STANDIN_TYPES = ('samsung', 'androidtv')
+
+
+def create_standin(session_type, index, work_dir):
+    ip = standin_ip(index)
+    if session_type == 'samsung':
+        return SamsungStandIn(ip)
+    if session_type == 'androidtv':
+        return AndroidTVStandIn(ip, work_dir)
+    raise ValueError(f'No stand-in for {session_type}')
+
+
+async def serve(session_type, count):
+    work_dir = tempfile.mkdtemp(prefix='delova-standins-')
+    standins = [create_standin(session_type, i, work_dir) for i in range(count)]
+    await asyncio.gather(*(s.start() for s in standins))
+    print(json.dumps({'type': session_type, 'ips': [s.host for s in standins]}), flush=True)
+    try:
+        while True:
+            await asyncio.sleep(3600)
+    finally:
+        await asyncio.gather(*(s.stop() for s in standins), return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run stand-in TVs on loopback addresses until interrupted')
+    parser.add_argument('--type', choices=STANDIN_TYPES, default='samsung')
+    parser.add_argument('--count', type=int, default=1)
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.type, args.count))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -927,11 +927,11 @@ document.addEventListener('DOMContentLoaded', () => {
                 <div class="remote-layout">
                     <!-- D-Pad Navigation -->
                     <div class="d-pad" style="margin-bottom: 30px;">
-                        <button class="d-pad-btn d-pad-up" onclick="controlDevice('${device.id}', 'up')"><i class="fas fa-chevron-up"></i></button>
-                        <button class="d-pad-btn d-pad-left" onclick="controlDevice('${device.id}', 'left')"><i class="fas fa-chevron-left"></i></button>
-                        <button class="d-pad-btn d-pad-center" onclick="controlDevice('${device.id}', 'select')"><i class="fas fa-circle"></i></button>
-                        <button class="d-pad-btn d-pad-right" onclick="controlDevice('${device.id}', 'right')"><i class="fas fa-chevron-right"></i></button>
-                        <button class="d-pad-btn d-pad-down" onclick="controlDevice('${device.id}', 'down')"><i class="fas fa-chevron-down"></i></button>
+                        <button class="d-pad-btn d-pad-up" onpointerdown="remoteKeyDown(event, '${device.id}', 'up')" onclick="remoteKeyClick(event, '${device.id}', 'up')"><i class="fas fa-chevron-up"></i></button>
+                        <button class="d-pad-btn d-pad-left" onpointerdown="remoteKeyDown(event, '${device.id}', 'left')" onclick="remoteKeyClick(event, '${device.id}', 'left')"><i class="fas fa-chevron-left"></i></button>
+                        <button class="d-pad-btn d-pad-center" onpointerdown="remoteKeyDown(event, '${device.id}', 'select')" onclick="remoteKeyClick(event, '${device.id}', 'select')"><i class="fas fa-circle"></i></button>
+                        <button class="d-pad-btn d-pad-right" onpointerdown="remoteKeyDown(event, '${device.id}', 'right')" onclick="remoteKeyClick(event, '${device.id}', 'right')"><i class="fas fa-chevron-right"></i></button>
+                        <button class="d-pad-btn d-pad-down" onpointerdown="remoteKeyDown(event, '${device.id}', 'down')" onclick="remoteKeyClick(event, '${device.id}', 'down')"><i class="fas fa-chevron-down"></i></button>
                     </div>
 
                     <!-- System Actions -->
@@ -1364,6 +1364,7 @@ document.addEventListener('DOMContentLoaded', () => {
             if (app.toLowerCase().includes('spotify')) artContent = `<i class="fab fa-spotify" style="color: #1db954;"></i>`;
             else if (app.toLowerCase().includes('netflix')) artContent = `<span style="color: #e50914; font-weight: bold; font-size: 0.5em;">NETFLIX</span>`;
             else if (app.toLowerCase().includes('youtube')) artContent = `<i class="fab fa-youtube" style="color: #ff0000;"></i>`;
+            if (device.state.mediaArtwork) artContent = `<img src="/api/artwork/${device.state.mediaArtwork}?size=medium" alt="" style="width: 100%; height: 100%; object-fit: cover; border-radius: inherit;">`;
 
             tabControlsContent = `
                 ${errorHtml}
@@ -1692,6 +1693,44 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     };
 
+    // TV remote buttons: a tap sends one key. Holding one past REMOTE_HOLD_DELAY
+    // sends hold_start, and the TV session keeps the key down (native long
+    // press / auto-repeat) until the matching hold_end on release.
+    const REMOTE_HOLD_DELAY = 400;
+
+    const sendHold = (id, phase, command) => {
+        fetch(`/api/devices/${id}/command`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ command: phase, value: command })
+        }).catch(() => {});
+    };
+
+    window.remoteKeyDown = (event, id, command) => {
+        const button = event.currentTarget;
+        let holding = false;
+        const timer = setTimeout(() => {
+            holding = true;
+            button.dataset.held = '1';
+            sendHold(id, 'hold_start', command);
+        }, REMOTE_HOLD_DELAY);
+        const release = () => {
+            clearTimeout(timer);
+            ['pointerup', 'pointercancel', 'pointerleave'].forEach(type => button.removeEventListener(type, release));
+            if (holding) sendHold(id, 'hold_end', command);
+        };
+        ['pointerup', 'pointercancel', 'pointerleave'].forEach(type => button.addEventListener(type, release));
+    };
+
+    window.remoteKeyClick = (event, id, command) => {
+        // The click that follows a hold is not another press
+        if (event.currentTarget.dataset.held) {
+            delete event.currentTarget.dataset.held;
+            return;
+        }
+        window.controlDevice(id, command);
+    };
+
     window.controlPS5 = (id, action) => {
         let endpoint = `/api/ps5/${id}/command`;
         let body = { command: action };
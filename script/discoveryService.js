@@ -1,6 +1,7 @@
 const dgram = require('dgram');
 const EventEmitter = require('events');
-const { exec } = require('child_process');
+const { exec, spawn } = require('child_process');
+const path = require('path');
 const { Bonjour } = require('bonjour-service');
 
 class DiscoveryService extends EventEmitter {
@@ -316,6 +317,77 @@ class DiscoveryService extends EventEmitter {
         }
     }
 
+    /**
+     * Sweep one or more IPs/CIDR ranges with port_scan.py and emit recognised devices.
+     * Resolves with the per-host results once the scan has finished.
+     */
+    scanPorts(pythonPath, targets, ports = null) {
+        return new Promise((resolve) => {
+            const args = [path.join(__dirname, 'port_scan.py'), ...targets, '--json'];
+            if (ports) args.push('--ports', ports.join(','));
+
+            console.log(`[Discovery] Port scan of ${targets.join(', ')}...`);
+            const proc = spawn(pythonPath, args);
+            const results = [];
+            let buffer = '';
+
+            proc.stdout.on('data', (data) => {
+                buffer += data.toString();
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                lines.forEach(line => {
+                    if (!line.trim()) return;
+                    try {
+                        const msg = JSON.parse(line);
+                        if (msg.type === 'summary') {
+                            console.log(`[Discovery] Port scan done: ${results.length}/${msg.hosts} hosts with open device ports in ${msg.elapsed}s`);
+                        } else if (msg.ip) {
+                            results.push(msg);
+                            this.handlePortScanResult(msg);
+                        }
+                    } catch (e) {}
+                });
+            });
+
+            proc.stderr.on('data', (data) => {
+                console.error(`[Discovery] Port scan error: ${data.toString().trim()}`);
+            });
+
+            proc.on('error', (err) => {
+                console.error(`[Discovery] Port scan failed to start: ${err.message}`);
+                resolve(results);
+            });
+
+            proc.on('close', () => resolve(results));
+        });
+    }
+
+    handlePortScanResult(result) {
+        this.emit('portscan-result', result);
+
+        // protocol matches what mDNS/SSDP discovery sets, so a TV first seen by
+        // the sweep is controllable without waiting for its advertisement
+        const kinds = {
+            'samsung-tv': { type: 'tv', model: 'Samsung Smart TV', protocol: 'samsung-tizen' },
+            'android-tv': { type: 'tv', model: 'Android TV', protocol: 'mdns-googlecast' },
+            'android-adb': { type: 'tv', model: 'Android TV (ADB)', protocol: 'mdns-googlecast' },
+            'apple-tv': { type: 'tv', model: 'Apple TV', protocol: 'mdns-airplay' },
+            'homekit': { type: 'homekit', model: 'HomeKit Device' }
+        };
+        const kind = kinds[result.kind];
+        if (!kind) return;
+
+        this.emit('discovered', {
+            id: `${result.kind}-${result.ip.replace(/\./g, '-')}`,
+            name: `${kind.model} (${result.ip})`,
+            type: kind.type,
+            ip: result.ip,
+            model: kind.model,
+            protocol: kind.protocol,
+            raw: { type: 'portscan', ports: result.ports }
+        });
+    }
+
     startSSDP() {
         console.log('[Discovery] Starting SSDP...');
         const SSDP_ADDR = '239.255.255.250';
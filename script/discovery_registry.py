@@ -0,0 +1,202 @@
+import asyncio
+import sys
+import time
+
+from zeroconf import ServiceStateChange
+from zeroconf.asyncio import AsyncServiceBrowser, AsyncServiceInfo, AsyncZeroconf
+
+from ipc import drain_output, loads, open_output, read_lines, write_message
+
+SERVICE_TYPES = [
+    '_airplay._tcp.local.',
+    '_companion-link._tcp.local.',
+    '_mediaremotetv._tcp.local.',
+    '_hap._tcp.local.',
+    '_androidtvremote2._tcp.local.',
+]
+
+# TXT keys that carry a stable device identifier, strongest first
+IDENTIFIER_KEYS = ['deviceid', 'UniqueIdentifier', 'id', 'bt', 'rpBA']
+
+RESOLVE_TIMEOUT_MS = 3000
+
+
+def decode_properties(properties):
+    decoded = {}
+    for key, value in (properties or {}).items():
+        if isinstance(key, bytes):
+            key = key.decode('utf-8', errors='replace')
+        if isinstance(value, bytes):
+            value = value.decode('utf-8', errors='replace')
+        decoded[key] = value if value is not None else ''
+    return decoded
+
+
+class DiscoveryRegistry:
+    """Live registry of LAN media devices built on one AsyncZeroconf instance.
+
+    Browses the Apple, HomeKit and Android TV service types continuously and
+    merges every service a host advertises into one record. Records can be
+    looked up by any identifier found in their TXT data or by IP address.
+    Listeners receive ``(event, record)`` for ``add``, ``update`` and
+    ``remove``.
+    """
+
+    def __init__(self, service_types=SERVICE_TYPES):
+        self.service_types = list(service_types)
+        self.aiozc = None
+        self.browser = None
+        self.devices = {}       # host -> record
+        self.aliases = {}       # identifier or IP -> host
+        self.service_hosts = {}  # service instance name -> host
+        self.listeners = []
+        self.changed = asyncio.Event()
+        self.pending = set()
+
+    async def start(self, aiozc=None):
+        self.aiozc = aiozc or AsyncZeroconf()
+        self.browser = AsyncServiceBrowser(self.aiozc.zeroconf, self.service_types, handlers=[self._on_change])
+
+    async def close(self):
+        for task in list(self.pending):
+            task.cancel()
+        if self.browser:
+            await self.browser.async_cancel()
+            self.browser = None
+        if self.aiozc:
+            await self.aiozc.async_close()
+            self.aiozc = None
+
+    def _on_change(self, zeroconf, service_type, name, state_change):
+        if state_change is ServiceStateChange.Removed:
+            self._remove_service(service_type, name)
+            return
+        task = asyncio.ensure_future(self._resolve(service_type, name))
+        self.pending.add(task)
+        task.add_done_callback(self.pending.discard)
+
+    async def _resolve(self, service_type, name):
+        info = AsyncServiceInfo(service_type, name)
+        if not await info.async_request(self.aiozc.zeroconf, RESOLVE_TIMEOUT_MS):
+            return
+        host = info.server or name
+        properties = decode_properties(info.properties)
+        self.service_hosts[name] = host
+
+        record = self.devices.get(host)
+        event = 'update' if record else 'add'
+        if record is None:
+            record = {'id': host, 'name': name.split('.', 1)[0], 'host': host,
+                      'addresses': [], 'identifiers': {}, 'services': {}}
+            self.devices[host] = record
+
+        record['addresses'] = sorted(set(record['addresses']) | set(info.parsed_addresses()))
+        service = {'name': name, 'port': info.port, 'properties': properties}
+        if record['services'].get(service_type) == service and event == 'update':
+            return
+        record['services'][service_type] = service
+        for key in IDENTIFIER_KEYS:
+            if properties.get(key):
+                record['identifiers'][key] = properties[key]
+        # Prefer a real device identifier over the mDNS host name once one is known
+        for key in IDENTIFIER_KEYS:
+            if key in record['identifiers']:
+                record['id'] = record['identifiers'][key]
+                break
+        record['updated_at'] = time.time()
+
+        for alias in list(record['identifiers'].values()) + record['addresses'] + [record['id']]:
+            self.aliases[alias] = host
+        self._notify(event, record)
+
+    def _remove_service(self, service_type, name):
+        host = self.service_hosts.pop(name, None)
+        record = self.devices.get(host)
+        if not record:
+            return
+        record['services'].pop(service_type, None)
+        if record['services']:
+            record['updated_at'] = time.time()
+            self._notify('update', record)
+            return
+        del self.devices[host]
+        for alias in [a for a, h in self.aliases.items() if h == host]:
+            del self.aliases[alias]
+        self._notify('remove', record)
+
+    def _notify(self, event, record):
+        self.changed.set()
+        self.changed = asyncio.Event()
+        for listener in list(self.listeners):
+            try:
+                listener(event, record)
+            except Exception:
+                pass
+
+    def get(self, key):
+        """Look up a record by identifier, IP address or host name."""
+        host = self.aliases.get(key, key)
+        return self.devices.get(host)
+
+    def records(self):
+        return list(self.devices.values())
+
+    async def wait_for(self, key, timeout=5.0, service_type=None):
+        """Return the record for ``key`` as soon as it (and ``service_type``) is known."""
+        deadline = time.monotonic() + timeout
+        while True:
+            record = self.get(key)
+            if record and (service_type is None or service_type in record['services']):
+                return record
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return record
+            try:
+                await asyncio.wait_for(self.changed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+_registry = None
+
+
+async def get_registry():
+    """Start (once) and return the process-wide registry."""
+    global _registry
+    if _registry is None:
+        _registry = DiscoveryRegistry()
+        await _registry.start()
+    return _registry
+
+
+def running_registry():
+    """Return the registry if this process already started one, else None."""
+    return _registry
+
+
+async def main():
+    await open_output()
+    registry = await get_registry()
+    registry.listeners.append(lambda event, record: write_message({"event": event, "device": record}))
+    try:
+        async for line in read_lines():
+            try:
+                req = loads(line)
+            except ValueError:
+                write_message({"error": "Invalid JSON input"})
+                continue
+            command = req.get('command')
+            if command == 'list':
+                write_message({"type": "devices", "devices": registry.records()})
+            elif command == 'get':
+                write_message({"type": "device", "device": registry.get(req.get('id') or req.get('ip'))})
+    finally:
+        await registry.close()
+        await drain_output()
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
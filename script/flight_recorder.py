@@ -0,0 +1,227 @@
+import asyncio
+import contextvars
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+from datetime import datetime, timezone
+
+from ipc import dumps, loads
+from paths import data_path
+
+# Ring file and the copy of the previous run's ring (kept across a crash)
+RECORDER_FILE = data_path('bridge-flight.rec')
+PREVIOUS_FILE = data_path('bridge-flight.prev.rec')
+
+# Timeline dumps (JSON, audit log entry format) go here
+DUMP_DIR = data_path('flight-dumps')
+
+# Ring geometry: SLOTS records of SLOT_SIZE bytes each, 2 MiB in total
+SLOT_SIZE = 512
+SLOTS = 4096
+
+# A command slower than this (seconds) dumps the timeline that led up to it
+SLOW_COMMAND = float(os.environ.get('DELOVA_RECORDER_SLOW', '2.0'))
+
+# At most one automatic dump per this many seconds, so a dead device that
+# times out on every command does not fill the disk
+DUMP_INTERVAL = 60.0
+
+MAGIC = b'DLVFR01\0'
+# magic, slot size, slot count, wall and monotonic clock at open
+HEADER = struct.Struct('<8sIIdd')
+HEADER_SIZE = 64
+# sequence number, monotonic time, kind, payload length
+RECORD = struct.Struct('<QdBH')
+PAYLOAD_SIZE = SLOT_SIZE - RECORD.size
+
+# Record kinds and the audit log action each is exported as
+KINDS = ('command', 'device_call', 'event')
+
+# Fields never written to the ring: it survives crashes and is served over
+# /api/bridge/flight-dump. A pair command's value is its PIN.
+SECRET_FIELDS = ('pin', 'token', 'credentials')
+SECRET_VALUE_COMMANDS = ('pair',)
+
+# Device of the session whose task is running, for records made deep inside a session
+current_device = contextvars.ContextVar('current_device', default=None)
+
+
+class FlightRecorder:
+    """Fixed-size ring of bridge traffic in a memory-mapped file.
+
+    Every inbound command, device call and emitted message is one record with
+    a monotonic timestamp. The file is preallocated and written in place, so
+    recording never allocates on disk, and the kernel keeps the pages when the
+    process dies: the last SLOTS records of a crashed bridge are still in the
+    file, and the next start moves it aside to ``PREVIOUS_FILE``.
+    """
+
+    def __init__(self, path, slots=SLOTS):
+        self.path = path
+        self.slots = slots
+        self.seq = 0
+        self.last_dump = 0.0
+        self.pending = set()
+        size = HEADER_SIZE + slots * SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self.map[HEADER_SIZE:] = bytes(size - HEADER_SIZE)
+        HEADER.pack_into(self.map, 0, MAGIC, SLOT_SIZE, slots, time.time(), time.monotonic())
+
+    def record(self, kind, device, data):
+        """Append one record, overwriting the oldest once the ring is full."""
+        payload = dumps({'device': device, **redact(data)} if device else redact(data)).rstrip(b'\n')
+        if len(payload) > PAYLOAD_SIZE:
+            # Keep the start of an oversized message; escaping can grow it, so shrink until it fits
+            head = payload[:PAYLOAD_SIZE // 3].decode(errors='ignore')
+            while len(payload) > PAYLOAD_SIZE:
+                payload = dumps({'device': device, 'truncated': True, 'head': head}).rstrip(b'\n')
+                head = head[:len(head) // 2]
+        self.seq += 1
+        offset = HEADER_SIZE + (self.seq % self.slots) * SLOT_SIZE
+        # Payload first and the sequence number last, so a reader never pairs
+        # a new sequence number with a half-written payload
+        self.map[offset + RECORD.size:offset + RECORD.size + len(payload)] = payload
+        RECORD.pack_into(self.map, offset, 0, time.monotonic(), KINDS.index(kind), len(payload))
+        struct.pack_into('<Q', self.map, offset, self.seq)
+
+    def timeline(self):
+        return read_timeline(self.map)
+
+    def dump(self, reason, **details):
+        """Write the current timeline to DUMP_DIR on a worker thread; returns a future of the file path.
+
+        Only the copy of the ring is taken on the event loop. Decoding and
+        writing 4096 records would otherwise stall every session, right when
+        a slow command has already been noticed.
+        """
+        self.last_dump = time.monotonic()
+        snapshot = bytes(self.map)
+        future = asyncio.get_running_loop().run_in_executor(None, write_dump, snapshot, reason, details)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+
+
+def redact(data):
+    """``data`` without secrets (see SECRET_FIELDS), replaced by a marker."""
+    if not isinstance(data, dict):
+        return data
+    if not any(k in data for k in SECRET_FIELDS) and data.get('command') not in SECRET_VALUE_COMMANDS:
+        return data
+    clean = {k: ('<redacted>' if k in SECRET_FIELDS else v) for k, v in data.items()}
+    if clean.get('command') in SECRET_VALUE_COMMANDS and 'value' in clean:
+        clean['value'] = '<redacted>'
+    return clean
+
+
+def write_dump(snapshot, reason, details):
+    """Write a ring snapshot to DUMP_DIR as a JSON timeline; returns the file path."""
+    os.makedirs(DUMP_DIR, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+    path = os.path.join(DUMP_DIR, f'{stamp}-{reason}.json')
+    entries = read_timeline(snapshot)
+    entries.insert(0, audit_entry('flight_recorder', 'dump', {'reason': reason, **details}))
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(entries, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+
+def audit_entry(source, action, details, timestamp=None, entry_id=None):
+    """One timeline entry in the format of auditLogManager.js (data/audit_log.json)."""
+    when = datetime.fromtimestamp(timestamp if timestamp is not None else time.time(), timezone.utc)
+    return {
+        'id': entry_id or f'fr-{time.monotonic_ns():x}',
+        'timestamp': when.isoformat(timespec='milliseconds').replace('+00:00', 'Z'),
+        'source': source,
+        'action': action,
+        'details': details,
+    }
+
+
+def read_timeline(buffer):
+    """Records in a ring (mmap or file bytes), oldest first, as audit log entries."""
+    if len(buffer) < HEADER_SIZE:
+        raise ValueError('Not a flight recorder file')
+    magic, slot_size, slots, wall, monotonic = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a flight recorder file')
+    records = []
+    for index in range(slots):
+        offset = HEADER_SIZE + index * slot_size
+        seq, at, kind, length = RECORD.unpack_from(buffer, offset)
+        if not seq:
+            continue
+        try:
+            data = loads(bytes(buffer[offset + RECORD.size:offset + RECORD.size + length]))
+        except ValueError:
+            continue
+        records.append((seq, at, kind, data))
+    records.sort()
+    entries = []
+    for seq, at, kind, data in records:
+        device = data.pop('device', None) if isinstance(data, dict) else None
+        details = {'device': device, 'seq': seq, 't_ms': round((at - monotonic) * 1000, 3), 'data': data}
+        entries.append(audit_entry('bridge', KINDS[kind], details, wall + (at - monotonic), f'fr-{seq}'))
+    return entries
+
+
+recorder = None
+
+
+def open_recorder(path=RECORDER_FILE):
+    """Start recording for this process. Keeps the previous run's ring as PREVIOUS_FILE."""
+    global recorder
+    if recorder is not None:
+        return recorder
+    try:
+        if os.path.exists(path) and os.path.getsize(path) > HEADER_SIZE:
+            os.replace(path, PREVIOUS_FILE)
+        recorder = FlightRecorder(path)
+    except (OSError, ValueError):
+        recorder = None
+    return recorder
+
+
+def close_recorder():
+    global recorder
+    if recorder is not None:
+        recorder.close()
+        recorder = None
+
+
+def record(kind, data, device=None):
+    """Record one entry if a recorder is open (a no-op otherwise)."""
+    if recorder is not None:
+        recorder.record(kind, device or current_device.get(), data)
+
+
+def dump_if_slow(elapsed, device, command):
+    """Start a timeline dump after a command slower than SLOW_COMMAND. Returns its future or None."""
+    if recorder is None or elapsed < SLOW_COMMAND or time.monotonic() - recorder.last_dump < DUMP_INTERVAL:
+        return None
+    return recorder.dump('slow_command', device=device, command=command, elapsed_ms=round(elapsed * 1000, 1))
+
+
+def main():
+    """Print a ring file (default: the previous run's) as an audit log timeline."""
+    path = sys.argv[1] if len(sys.argv) > 1 else PREVIOUS_FILE
+    with open(path, 'rb') as f:
+        json.dump(read_timeline(f.read()), sys.stdout, indent=2)
+    sys.stdout.write('\n')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,256 @@
+import asyncio
+import sys
+
+AIOHOMEKIT_IMPORT_ERROR = None
+try:
+    from aiohomekit.controller import Controller
+    from aiohomekit.exceptions import (AccessoryDisconnectedError, AccessoryNotFoundError, AuthenticationError,
+                                       UnpairedError)
+    from aiohomekit.model.characteristics import CharacteristicsTypes
+except ImportError as e:
+    AIOHOMEKIT_IMPORT_ERROR = e
+
+import logging
+# Suppress logs
+logging.basicConfig(level=logging.CRITICAL)
+
+from bridge_host import run_single
+from credential_store import get_store
+from discovery_registry import get_registry
+from ipc import log, write_message
+from metrics import SessionMetrics
+from supervisor import (AuthRequired, DeviceError, NotConnected, NotSupported, ReconnectSupervisor,
+                        classify)
+
+# Time for the accessory to show up in mDNS before pairing gives up
+DISCOVER_TIMEOUT = 10.0
+
+# Pair-setup does SRP on the accessory, which takes a few seconds on small devices
+PAIR_TIMEOUT = 30.0
+
+
+def sensor_characteristics():
+    """HAP characteristic type -> field name in the ``sensor`` events."""
+    return {
+        CharacteristicsTypes.TEMPERATURE_CURRENT: 'temperature',
+        CharacteristicsTypes.RELATIVE_HUMIDITY_CURRENT: 'humidity',
+        CharacteristicsTypes.OCCUPANCY_DETECTED: 'occupancy',
+        CharacteristicsTypes.MOTION_DETECTED: 'motion',
+        CharacteristicsTypes.CONTACT_STATE: 'contact',
+        CharacteristicsTypes.LIGHT_LEVEL_CURRENT: 'light_level',
+        CharacteristicsTypes.AIR_QUALITY: 'air_quality',
+        CharacteristicsTypes.CARBON_DIOXIDE_LEVEL: 'co2',
+    }
+
+
+def hap_error_types():
+    """aiohomekit exception classes -> typed device errors, for ``classify``."""
+    return (
+        ((AuthenticationError, UnpairedError), AuthRequired),
+        ((AccessoryDisconnectedError, AccessoryNotFoundError), NotConnected),
+    )
+
+
+_controller = None
+_controller_lock = None
+
+async def get_controller():
+    """Start (once) and return the process-wide HomeKit controller.
+
+    It browses on the shared discovery registry's zeroconf instance, so
+    accessories that change address are followed without a second browser.
+    """
+    global _controller, _controller_lock
+    if _controller_lock is None:
+        _controller_lock = asyncio.Lock()
+    async with _controller_lock:
+        if _controller is None:
+            registry = await get_registry()
+            controller = Controller(async_zeroconf_instance=registry.aiozc)
+            await controller.async_start()
+            _controller = controller
+    return _controller
+
+
+class HomeKitSession:
+    """Paired HAP controller session for one HomeKit accessory.
+
+    Pairs once with the accessory's setup code (``pair`` command) and keeps
+    the pairing in the credential store. The session then holds one
+    encrypted connection to the accessory. All of its sensor characteristics
+    are subscribed over that connection, and every change is pushed at once
+    as ``{"type": "sensor", "data": {...}}``. aiohomekit re-establishes the
+    connection and the subscriptions after drops. The supervisor only
+    retries the first connect.
+    """
+
+    def __init__(self, ip, emit):
+        self.ip = ip
+        self.emit = emit
+        self.pairing = None
+        self.characteristics = {}   # (aid, iid) -> field name
+        self.values = {}
+        self.listeners = []
+        self.metrics = SessionMetrics()
+        self.supervisor = ReconnectSupervisor(self.connect, emit, metrics=self.metrics)
+
+    async def start(self):
+        paired = get_store('homekit').get(self.ip) is not None
+        if not paired:
+            self.emit({"status": "pairing_required"})
+        self.supervisor.start(connect_now=paired)
+
+    async def close(self):
+        await self.supervisor.close()
+        await self.disconnect()
+
+    async def disconnect(self):
+        for stop_listening in self.listeners:
+            stop_listening()
+        self.listeners = []
+        pairing, self.pairing = self.pairing, None
+        if pairing:
+            try:
+                await pairing.close()
+            except Exception:
+                pass
+
+    async def connect(self):
+        """Open the pairing and subscribe to its sensors. Returns True, or raises a typed error."""
+        data = get_store('homekit').get(self.ip)
+        if data is None:
+            raise AuthRequired("Accessory is not paired")
+        try:
+            controller = await get_controller()
+            if self.pairing is None:
+                self.pairing = controller.load_pairing(self.ip, dict(data))
+            await self.supervisor.timed(self.pairing.list_accessories_and_characteristics(), 'connect')
+            self.characteristics = self.find_sensors()
+            if not self.characteristics:
+                raise NotSupported("Accessory has no sensor characteristics")
+            self.listeners = [self.pairing.dispatcher_connect(self.on_event)]
+            await self.read()
+            await self.supervisor.timed(self.pairing.subscribe(list(self.characteristics)), label='subscribe')
+        except DeviceError:
+            await self.disconnect()
+            raise
+        except Exception as e:
+            await self.disconnect()
+            raise (classify(e, hap_error_types()) or DeviceError(str(e))) from e
+        self.emit({"status": "connected", "protocol": "hap", "sensors": sorted(set(self.characteristics.values()))})
+        return True
+
+    def find_sensors(self):
+        wanted = sensor_characteristics()
+        found = {}
+        for accessory in self.pairing.accessories:
+            for service in accessory.services:
+                for char in service.characteristics:
+                    if char.type in wanted:
+                        found[(accessory.aid, char.iid)] = wanted[char.type]
+        return found
+
+    def on_event(self, changes):
+        """Characteristic changes from aiohomekit (also the initial read)."""
+        changed = False
+        for key, update in changes.items():
+            name = self.characteristics.get(key)
+            if name is None or 'value' not in update:
+                continue
+            if self.values.get(name) != update['value']:
+                self.values[name] = update['value']
+                changed = True
+        if changed:
+            self.publish()
+
+    def publish(self, force=False):
+        if self.values or force:
+            self.emit({"type": "sensor", "data": dict(self.values)})
+
+    async def discover(self, controller):
+        while True:
+            async for found in controller.async_discover():
+                if self.ip in (found.description.address, *found.description.addresses):
+                    return found
+            await asyncio.sleep(1.0)
+
+    async def pair(self, pin):
+        """Pair with the accessory's setup code and store the keys."""
+        controller = await get_controller()
+        try:
+            discovery = await asyncio.wait_for(self.discover(controller), DISCOVER_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise NotConnected(f"No HomeKit accessory advertised at {self.ip}")
+        if discovery.paired:
+            raise AuthRequired("Accessory is already paired with another controller; remove it there first")
+
+        try:
+            finish_pairing = await asyncio.wait_for(discovery.async_start_pairing(self.ip), PAIR_TIMEOUT)
+            pairing = await asyncio.wait_for(finish_pairing(pin), PAIR_TIMEOUT)
+        except Exception as e:
+            raise (classify(e, hap_error_types()) or DeviceError(str(e))) from e
+        get_store('homekit').put(self.ip, dict(pairing.pairing_data))
+        self.pairing = pairing
+        self.emit({"status": "paired"})
+        self.supervisor.wake.set()
+
+    async def read(self):
+        """Fresh values of every sensor characteristic."""
+        try:
+            self.on_event(await self.supervisor.timed(self.pairing.get_characteristics(list(self.characteristics)),
+                                                      label='read'))
+        except DeviceError:
+            raise
+        except Exception as e:
+            raise (classify(e, hap_error_types()) or DeviceError(str(e))) from e
+
+    async def handle(self, req):
+        command = req.get('command')
+
+        if command == 'pair':
+            try:
+                await self.pair(str(req.get('value') or req.get('pin') or ''))
+            except DeviceError as e:
+                self.emit({"status": "pairing_failed", "error": str(e)})
+                raise
+            return
+
+        if get_store('homekit').get(self.ip) is None:
+            raise AuthRequired("Accessory is not paired; send its setup code with the pair command")
+        if not self.supervisor.up.is_set():
+            if not await self.supervisor.wait_up(self.supervisor.timeout('connect')):
+                raise NotConnected(f"Not connected to {self.ip}")
+
+        if command == 'status':
+            await self.read()
+            self.publish(force=True)
+            return
+
+        raise NotSupported(f"Unknown command: {command}")
+
+
+def create_session(ip, emit):
+    """Build a session for the bridge. Raises ImportError when aiohomekit is missing."""
+    if AIOHOMEKIT_IMPORT_ERROR:
+        raise AIOHOMEKIT_IMPORT_ERROR
+    return HomeKitSession(ip, emit)
+
+def main():
+    if AIOHOMEKIT_IMPORT_ERROR:
+        write_message({"error": f"Import failed: {AIOHOMEKIT_IMPORT_ERROR}", "type": "import_error"})
+        sys.exit(1)
+
+    if len(sys.argv) < 2:
+        write_message({"error": "Usage: python hap_service.py <ip>"})
+        sys.exit(1)
+
+    ip = sys.argv[1]
+    log('debug', 'Service starting...', ip=ip)
+
+    try:
+        asyncio.run(run_single(lambda emit: HomeKitSession(ip, emit)))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import sys
+from collections import deque
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Messages held while Node is not draining stdout. Past this the oldest are
+# dropped (and counted) rather than blocking the event loop.
+MAX_PENDING = 1000
+
+# Bytes the pipe transport may hold before we stop handing it more
+HIGH_WATER = 256 * 1024
+
+# How soon to retry while the transport is above HIGH_WATER (seconds)
+RETRY_DELAY = 0.05
+
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40, 'off': 100}
+
+_log_level = LOG_LEVELS.get(os.environ.get('DELOVA_BRIDGE_LOG', 'info').lower(), LOG_LEVELS['info'])
+
+# Callables that also receive every outgoing message (e.g. local control clients)
+message_taps = []
+
+
+def dumps(msg):
+    """Encode one message as a JSON line (bytes)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(msg, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return (json.dumps(msg, default=str) + '\n').encode()
+
+
+def loads(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+class OutputChannel:
+    """Coalescing, non-blocking writer for the stdout data channel.
+
+    Before ``open()`` (or when the stream cannot be registered with the loop)
+    every message is written and flushed synchronously. Afterwards messages
+    are queued, and everything written during one loop iteration goes out in
+    a single write on the pipe transport.
+    """
+
+    def __init__(self, stream=None, max_pending=MAX_PENDING):
+        self.stream = stream or sys.stdout
+        self.pending = deque()
+        self.max_pending = max_pending
+        self.transport = None
+        self.loop = None
+        self.scheduled = False
+        self.dropped = 0
+
+    async def open(self):
+        if self.transport is not None:
+            return
+        loop = asyncio.get_running_loop()
+        try:
+            self.stream.flush()
+            self.transport, _ = await loop.connect_write_pipe(asyncio.Protocol, self.stream)
+            self.loop = loop
+        except (NotImplementedError, OSError, ValueError, AttributeError):
+            # Windows consoles and some redirected handles are not pipes;
+            # stay on synchronous writes.
+            self.transport = None
+
+    def write(self, msg):
+        for tap in list(message_taps):
+            tap(msg)
+        data = dumps(msg)
+        if self.transport is None or self.transport.is_closing():
+            if hasattr(self.stream, 'buffer'):
+                self.stream.buffer.write(data)
+            else:
+                self.stream.write(data.decode())
+            self.stream.flush()
+            return
+        if len(self.pending) >= self.max_pending:
+            self.pending.popleft()
+            self.dropped += 1
+        self.pending.append(data)
+        if not self.scheduled:
+            self.scheduled = True
+            self.loop.call_soon(self._flush)
+
+    def _flush(self):
+        self.scheduled = False
+        if not self.pending or self.transport.is_closing():
+            return
+        if self.transport.get_write_buffer_size() > HIGH_WATER:
+            # Node is not keeping up; hold messages here and try again shortly
+            self.scheduled = True
+            self.loop.call_later(RETRY_DELAY, self._flush)
+            return
+        if self.dropped:
+            self.pending.appendleft(dumps({"ipc": "dropped", "count": self.dropped}))
+            self.dropped = 0
+        self.transport.write(b''.join(self.pending))
+        self.pending.clear()
+
+    async def drain(self, timeout=2.0):
+        """Push out everything queued, waiting up to ``timeout`` seconds."""
+        if self.transport is None:
+            return
+        deadline = self.loop.time() + timeout
+        while (self.pending or self.transport.get_write_buffer_size()) and self.loop.time() < deadline:
+            if self.pending and not self.scheduled:
+                self._flush()
+            await asyncio.sleep(0.01)
+
+
+output = OutputChannel()
+
+
+def write_message(msg):
+    """Send one message on the data channel."""
+    output.write(msg)
+
+
+async def open_output():
+    await output.open()
+
+
+async def drain_output(timeout=2.0):
+    await output.drain(timeout)
+
+
+def set_log_level(level):
+    """Change the diagnostic log level at runtime. Returns False for unknown levels."""
+    global _log_level
+    value = LOG_LEVELS.get(str(level).lower())
+    if value is None:
+        return False
+    _log_level = value
+    return True
+
+
+def log_enabled(level):
+    return LOG_LEVELS.get(level, 0) >= _log_level
+
+
+def log(level, message, **fields):
+    """Diagnostics go to stderr, off the data channel, and only at or above the current level."""
+    if not log_enabled(level):
+        return
+    sys.stderr.write(dumps({'log': level, 'message': message, **fields}).decode())
+    sys.stderr.flush()
+
+
+async def read_lines():
+    """Yield stripped, non-empty lines from stdin until EOF."""
+    loop = asyncio.get_running_loop()
+    reader = None
+    try:
+        reader = asyncio.StreamReader()
+        protocol = asyncio.StreamReaderProtocol(reader)
+        await loop.connect_read_pipe(lambda: protocol, sys.stdin)
+    except (NotImplementedError, OSError, ValueError):
+        # Windows Proactor loops and some redirected handles cannot be
+        # registered as pipes; fall back to a blocking read in a thread.
+        reader = None
+
+    while True:
+        if reader is not None:
+            raw = await reader.readline()
+            if not raw:
+                break
+            line = raw.decode(errors='replace').strip()
+        else:
+            raw = await loop.run_in_executor(None, sys.stdin.readline)
+            if not raw:
+                break
+            line = raw.strip()
+        if line:
+            yield line
@@ -0,0 +1,75 @@
+import asyncio
+
+# Longest a key stays held without a hold_end. A lost release (closed tab,
+# dropped socket) must not leave the TV scrolling forever.
+HOLD_MAX = 10.0
+
+# Pace of session-side repeats for protocols without a native long press
+HOLD_REPEAT_INTERVAL = 0.12
+
+
+class KeyHold:
+    """The one key a session holds down, between ``hold_start`` and ``hold_end``.
+
+    ``press(key)`` and ``release(key)`` are the session's coroutines for the
+    device-native key down and key up. A new hold releases the previous one
+    first, and a hold without its ``hold_end`` is released after HOLD_MAX.
+    """
+
+    def __init__(self, press, release, max_hold=HOLD_MAX):
+        self.press = press
+        self.release = release
+        self.max_hold = max_hold
+        self.key = None
+        self.expiry = None
+
+    async def start(self, key):
+        await self.end()
+        await self.press(key)
+        self.key = key
+        self.expiry = asyncio.create_task(self.expire(key))
+
+    async def expire(self, key):
+        await asyncio.sleep(self.max_hold)
+        # Running now; end() must not cancel this task
+        self.expiry = None
+        try:
+            await self.end(key)
+        except Exception:
+            # The link is gone; the device lets go of the key on its own
+            pass
+
+    def close(self):
+        """Stop the expiry timer (the session is closing and takes the link with it)."""
+        if self.expiry:
+            self.expiry.cancel()
+            self.expiry = None
+
+    async def end(self, key=None):
+        """Release the held key (only if it is ``key``, when given). Returns False if none was held."""
+        if self.key is None or (key is not None and key != self.key):
+            return False
+        held, self.key = self.key, None
+        if self.expiry:
+            self.expiry.cancel()
+            self.expiry = None
+        await self.release(held)
+        return True
+
+    async def handle(self, req):
+        """Run a ``hold_start``/``hold_end`` request. Returns False for any other command."""
+        command = req.get('command')
+        if command == 'hold_start':
+            await self.start(req.get('value'))
+        elif command == 'hold_end':
+            await self.end(req.get('value'))
+        else:
+            return False
+        return True
+
+
+async def repeat_key(send, key, interval=HOLD_REPEAT_INTERVAL):
+    """Send ``key`` every ``interval`` seconds until cancelled (the hold for protocols without one)."""
+    while True:
+        await send(key)
+        await asyncio.sleep(interval)
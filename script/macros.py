@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+
+from paths import data_path
+
+MACROS_FILE = data_path('macros.json')
+
+# Pause between steps when neither the step nor the sequence sets one
+DEFAULT_STEP_DELAY = 0.3
+
+# Time budget per step on top of its delay, used to size the command timeout
+STEP_BUDGET = 2.0
+
+# Macros may call other macros, but not endlessly
+MAX_MACRO_DEPTH = 4
+
+MACRO_COMMANDS = ('sequence', 'macro', 'define_macro', 'delete_macro', 'list_macros')
+
+
+def load_macros():
+    if not os.path.exists(MACROS_FILE):
+        return {}
+    try:
+        with open(MACROS_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_macros(macros):
+    tmp = MACROS_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(macros, f, indent=2)
+    os.replace(tmp, MACROS_FILE)
+
+
+def save_macro(name, steps, delay=None):
+    macros = load_macros()
+    macros[name] = {'steps': steps, 'delay': delay}
+    _save_macros(macros)
+
+
+def delete_macro(name):
+    macros = load_macros()
+    if macros.pop(name, None) is not None:
+        _save_macros(macros)
+        return True
+    return False
+
+
+def expand_steps(steps, delay=None, macros=None, depth=0):
+    """Flatten a step list into ``(command, value, delay)`` tuples.
+
+    A step is a command name (``"up"``), a dict with ``command`` and optional
+    ``value``/``delay``, ``{"sleep": seconds}`` or ``{"macro": name}``.
+    """
+    if depth > MAX_MACRO_DEPTH:
+        raise ValueError('Macros nested too deeply')
+    if not isinstance(steps, list):
+        raise ValueError('Steps must be a list')
+    default_delay = DEFAULT_STEP_DELAY if delay is None else float(delay)
+    flat = []
+    for step in steps:
+        if isinstance(step, str):
+            flat.append((step, None, default_delay))
+        elif isinstance(step, dict) and 'sleep' in step:
+            flat.append((None, None, float(step['sleep'])))
+        elif isinstance(step, dict) and 'macro' in step:
+            if macros is None:
+                macros = load_macros()
+            macro = macros.get(step['macro'])
+            if macro is None:
+                raise ValueError(f"Unknown macro: {step['macro']}")
+            flat.extend(expand_steps(macro['steps'], macro.get('delay'), macros, depth + 1))
+        elif isinstance(step, dict) and step.get('command'):
+            step_delay = step.get('delay')
+            flat.append((step['command'], step.get('value'), default_delay if step_delay is None else float(step_delay)))
+        else:
+            raise ValueError(f'Invalid step: {step!r}')
+    return flat
+
+
+def request_steps(req):
+    """Resolve the steps a ``sequence`` or ``macro`` request will run."""
+    if req.get('command') == 'macro':
+        name = req.get('name') or req.get('value')
+        return expand_steps([{'macro': name}])
+    return expand_steps(req.get('steps') or req.get('value') or [], req.get('delay'))
+
+
+def sequence_timeout(req, base):
+    """Command timeout for a request, stretched to fit sequences and macros."""
+    if req.get('command') not in ('sequence', 'macro'):
+        return base
+    try:
+        steps = request_steps(req)
+    except ValueError:
+        return base
+    return base + sum(delay + STEP_BUDGET for _, _, delay in steps)
+
+
+async def run_sequence(run_step, steps, stop_on_error=True):
+    """Run steps in-process on a fixed schedule and return one aggregated result.
+
+    Each step's delay is measured from the moment that step started, so slow
+    device replies do not stretch the overall timing.
+    """
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    completed = 0
+    errors = []
+    for index, (command, value, delay) in enumerate(steps):
+        step_started = loop.time()
+        if command is not None:
+            try:
+                await run_step(command, value)
+                completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                errors.append({'step': index, 'command': command, 'error': str(e)})
+                if stop_on_error:
+                    break
+        else:
+            completed += 1
+        if index < len(steps) - 1:
+            remaining = step_started + delay - loop.time()
+            if remaining > 0:
+                await asyncio.sleep(remaining)
+
+    result = {
+        'status': 'failed' if errors else 'success',
+        'steps': len(steps),
+        'completed': completed,
+        'elapsed': round(loop.time() - started, 3),
+    }
+    if errors:
+        result['errors'] = errors
+    return result
+
+
+async def handle_macro_command(run_step, emit, req):
+    """Serve the sequence/macro commands for a session. Returns False for anything else."""
+    command = req.get('command')
+    if command not in MACRO_COMMANDS:
+        return False
+
+    try:
+        if command == 'define_macro':
+            name = req.get('name')
+            steps = req.get('steps') or []
+            # Validate before storing so a bad macro fails at definition time
+            expand_steps(steps, req.get('delay'))
+            if not name:
+                raise ValueError('Macro name is required')
+            save_macro(name, steps, req.get('delay'))
+            emit({"status": "success", "command": command, "name": name})
+        elif command == 'delete_macro':
+            emit({"status": "success" if delete_macro(req.get('name')) else "failed", "command": command, "name": req.get('name')})
+        elif command == 'list_macros':
+            emit({"type": "macros", "macros": load_macros()})
+        else:
+            steps = request_steps(req)
+            result = await run_sequence(run_step, steps, stop_on_error=req.get('stop_on_error', True))
+            result['command'] = command
+            if command == 'macro':
+                result['name'] = req.get('name') or req.get('value')
+            emit(result)
+    except ValueError as e:
+        emit({"status": "failed", "command": command, "error": str(e)})
+    return True
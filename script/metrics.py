@@ -0,0 +1,188 @@
+import os
+import time
+from contextlib import contextmanager
+
+# Histogram resolution: values are bucketed in microseconds with 2**SUB_BITS
+# linear sub-buckets per power of two, i.e. better than 2% relative precision
+# (the HdrHistogram layout). Recording is a few integer operations.
+SUB_BITS = 7
+
+# Bucket bounds (seconds) in the Prometheus export
+EXPORT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Label name per metric in the Prometheus export; everything else is per command
+LABEL_NAMES = {
+    'errors': 'type',
+    'dropped': 'reason',
+    'rtt': 'operation',
+    'timeouts': 'operation',
+}
+
+# Write the Prometheus text file here (and every METRICS_INTERVAL seconds)
+# when set, e.g. for systemMonitor.js or node_exporter's textfile collector.
+METRICS_FILE = os.environ.get('DELOVA_BRIDGE_METRICS')
+METRICS_INTERVAL = 15.0
+
+
+def _bucket(micros):
+    shift = max(micros.bit_length() - SUB_BITS, 0)
+    return (shift << SUB_BITS) | (micros >> shift)
+
+
+def _bucket_upper(index):
+    """Upper bound (microseconds) of a bucket index."""
+    shift = index >> SUB_BITS
+    return ((index & ((1 << SUB_BITS) - 1)) + 1) << shift
+
+
+class Histogram:
+    """Log-linear latency histogram with count, sum, min and max."""
+
+    __slots__ = ('counts', 'count', 'total', 'min', 'max')
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, seconds):
+        index = _bucket(max(int(seconds * 1_000_000), 0))
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, pct):
+        """Value (seconds) at or below which ``pct`` percent of the samples fall."""
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(_bucket_upper(index) / 1_000_000, self.max)
+        return self.max
+
+    def cumulative(self, bounds):
+        """Sample counts at or below each bound (seconds), for the Prometheus buckets."""
+        ordered = sorted((_bucket_upper(index) / 1_000_000, n) for index, n in self.counts.items())
+        result = []
+        seen = 0
+        position = 0
+        for bound in bounds:
+            while position < len(ordered) and ordered[position][0] <= bound:
+                seen += ordered[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+    def summary(self):
+        ms = lambda value: None if value is None else round(value * 1000, 2)
+        return {
+            'count': self.count,
+            'mean_ms': ms(self.total / self.count) if self.count else None,
+            'min_ms': ms(self.min),
+            'p50_ms': ms(self.percentile(50)),
+            'p90_ms': ms(self.percentile(90)),
+            'p99_ms': ms(self.percentile(99)),
+            'max_ms': ms(self.max),
+        }
+
+
+class SessionMetrics:
+    """Latency histograms and counters for one device session.
+
+    Every series has a name and an optional label (usually the command), e.g.
+    ``observe('command', 0.12, 'up')`` or ``count('errors', 'timeout')``.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def observe(self, name, seconds, label=''):
+        key = (name, label or '')
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.record(seconds)
+
+    def count(self, name, label='', n=1):
+        key = (name, label or '')
+        self.counters[key] = self.counters.get(key, 0) + n
+
+    @contextmanager
+    def timer(self, name, label=''):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - started, label)
+
+    def snapshot(self):
+        histograms = {}
+        for (name, label), histogram in sorted(self.histograms.items()):
+            histograms.setdefault(name, {})[label or 'all'] = histogram.summary()
+        counters = {}
+        for (name, label), value in sorted(self.counters.items()):
+            counters.setdefault(name, {})[label or 'all'] = value
+        return {'since': round(self.started), 'histograms': histograms, 'counters': counters}
+
+
+# Device id -> SessionMetrics for every live session in this process
+sessions = {}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items() if v != '') + '}'
+
+
+def render_prometheus(metrics_by_device=None):
+    """All sessions' metrics in the Prometheus text exposition format."""
+    metrics_by_device = sessions if metrics_by_device is None else metrics_by_device
+    histograms = {}
+    counters = {}
+    for device, metrics in metrics_by_device.items():
+        for (name, label), histogram in metrics.histograms.items():
+            histograms.setdefault(name, []).append((device, label, histogram))
+        for (name, label), value in metrics.counters.items():
+            counters.setdefault(name, []).append((device, label, value))
+
+    lines = []
+    for name, series in sorted(histograms.items()):
+        metric = f'delova_bridge_{name}_seconds'
+        label_name = LABEL_NAMES.get(name, 'command')
+        lines.append(f'# TYPE {metric} histogram')
+        for device, label, histogram in series:
+            base = {'device': device, label_name: label}
+            for bound, seen in zip(EXPORT_BUCKETS, histogram.cumulative(EXPORT_BUCKETS)):
+                lines.append(f'{metric}_bucket{_labels(**base, le=bound)} {seen}')
+            lines.append(f'{metric}_bucket{_labels(**base, le="+Inf")} {histogram.count}')
+            lines.append(f'{metric}_sum{_labels(**base)} {histogram.total:.6f}')
+            lines.append(f'{metric}_count{_labels(**base)} {histogram.count}')
+    for name, series in sorted(counters.items()):
+        metric = f'delova_bridge_{name}_total'
+        label_name = LABEL_NAMES.get(name, 'command')
+        lines.append(f'# TYPE {metric} counter')
+        for device, label, value in series:
+            lines.append(f'{metric}{_labels(device=device, **{label_name: label})} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path, metrics_by_device=None):
+    """Atomically replace ``path`` with the current metrics."""
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        f.write(render_prometheus(metrics_by_device))
+    os.replace(tmp, path)
@@ -7,7 +7,7 @@ from pyatv import scan, pair
 from pyatv.const import Protocol
 from pyatv.conf import ManualService
 
-CREDENTIALS_FILE = os.path.join(os.path.dirname(__file__), '../appletv-credentials.json')
+from credential_store import STORE_FILES, get_store
 
 async def main():
     print("Scanning for Apple TVs using pyatv...")
@@ -84,28 +84,19 @@ async def main():
         print("Pairing successful!")
         
         # Get credentials
-        credentials = {
-            str(conf.identifier): {
-                "protocol": str(protocol).split('.')[-1].lower(), 
-                "credentials": pairing_handler.service.credentials,
-                "port": pairing_handler.service.port
-            }
+        entry = {
+            "protocol": str(protocol).split('.')[-1].lower(),
+            "credentials": pairing_handler.service.credentials,
+            "port": pairing_handler.service.port,
+            # Lets the services find the entry by IP
+            "ip": str(conf.address),
+            "name": conf.name
         }
-        
-        # Load existing
-        if os.path.exists(CREDENTIALS_FILE):
-            try:
-                with open(CREDENTIALS_FILE, 'r') as f:
-                    existing = json.load(f)
-                    existing.update(credentials)
-                    credentials = existing
-            except:
-                pass
 
-        with open(CREDENTIALS_FILE, 'w') as f:
-            json.dump(credentials, f, indent=2)
-            
-        print(f"Credentials saved to {CREDENTIALS_FILE}")
+        # Merged into the shared store under its lock, so running sessions see it on their next connect
+        get_store('appletv').put(str(conf.identifier), entry)
+
+        print(f"Credentials saved to {STORE_FILES['appletv']}")
         await pairing_handler.close()
 
     except Exception as e:
@@ -6,19 +6,44 @@ from pyatv import scan, pair
 from pyatv.const import Protocol
 from pyatv.conf import ManualService
 
+from atv_service import load_scan_cache, config_from_cache, entry_from_discovery
+from discovery_registry import get_registry
+
+# Longest wait for the device to answer mDNS before falling back to a scan
+DISCOVERY_TIMEOUT = 3.0
+
+async def find_device(ip):
+    """Resolve a pyatv config for ``ip``: scan cache, then live discovery, then a unicast scan."""
+    entry = load_scan_cache().get(ip)
+    if entry:
+        return config_from_cache(ip, entry)
+
+    try:
+        registry = await get_registry()
+        try:
+            record = await registry.wait_for(ip, timeout=DISCOVERY_TIMEOUT, service_type='_mediaremotetv._tcp.local.')
+        finally:
+            await registry.close()
+        entry = entry_from_discovery(record) if record else None
+        if entry:
+            return config_from_cache(ip, entry)
+    except Exception:
+        pass
+
+    # print(f"Scanning host {ip}...", file=sys.stderr)
+    atvs = await scan(loop=asyncio.get_event_loop(), hosts=[ip])
+    return atvs[0] if atvs else None
+
 async def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("ip", help="IP address of the Apple TV")
     args = parser.parse_args()
 
-    # print(f"Scanning host {args.ip}...", file=sys.stderr)
-    atvs = await scan(loop=asyncio.get_event_loop(), hosts=[args.ip])
+    conf = await find_device(args.ip)
 
-    if not atvs:
+    if not conf:
         print("ERROR: Device not found", file=sys.stdout)
         sys.exit(1)
-
-    conf = atvs[0]
     
     # Determine available protocols
     available_protocols = [s.protocol for s in conf.services]
@@ -0,0 +1,10 @@
+import os
+
+# Pairing files, caches and the control endpoint live next to the app (one
+# level above script/). DELOVA_DATA_DIR points a bridge somewhere else, e.g.
+# a throwaway directory for the benchmark's stand-in devices.
+DATA_DIR = os.environ.get('DELOVA_DATA_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def data_path(name):
+    return os.path.join(DATA_DIR, name)
@@ -1,33 +1,201 @@
-import socket
+import argparse
 import asyncio
+import ipaddress
+import json
+import sys
+import time
 
-target_ip = "192.168.0.68"
+# Ports our TV/streamer integrations talk to, with the service each one implies
+KNOWN_PORTS = {
+    3689: 'daap',
+    5000: 'airplay-legacy',
+    7000: 'airplay',
+    7100: 'airplay-mirror',
+    8001: 'samsung-ws',
+    8002: 'samsung-wss',
+    6466: 'androidtv-remote',
+    6467: 'androidtv-pairing',
+    5555: 'adb',
+    51826: 'hap',
+}
+
+# Apple TV's MRP/Companion and most HomeKit accessories listen in the dynamic range
+DYNAMIC_PORTS = list(range(49152, 49161))
+
+DEFAULT_PORTS = sorted(set(KNOWN_PORTS) | set(DYNAMIC_PORTS))
+
+# Scanning limits: overall sockets in flight, sockets per host and connects per second per host
+CONCURRENCY = 256
+PER_HOST_CONCURRENCY = 8
+PER_HOST_RATE = 50.0
+CONNECT_TIMEOUT = 0.5
+PROBE_TIMEOUT = 0.5
+
+
+def parse_ports(spec):
+    ports = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            lo, hi = part.split('-', 1)
+            ports.update(range(int(lo), int(hi) + 1))
+        else:
+            ports.add(int(part))
+    return sorted(p for p in ports if 0 < p < 65536)
+
+
+def expand_targets(targets):
+    hosts = []
+    for target in targets:
+        network = ipaddress.ip_network(target, strict=False)
+        if network.num_addresses == 1:
+            hosts.append(str(network.network_address))
+        else:
+            hosts.extend(str(h) for h in network.hosts())
+    return hosts
+
+
+def classify(services):
+    """Guess the device kind from the set of recognised services."""
+    names = set(services.values())
+    if names & {'samsung-ws', 'samsung-wss'}:
+        return 'samsung-tv'
+    if names & {'androidtv-remote', 'androidtv-pairing'}:
+        return 'android-tv'
+    if 'adb' in names:
+        return 'android-adb'
+    if 'airplay' in names and 'mrp' in names:
+        return 'apple-tv'
+    if 'hap' in names:
+        return 'homekit'
+    if names & {'airplay', 'airplay-legacy', 'airplay-mirror', 'daap'}:
+        return 'airplay'
+    return None
+
+
+class HostLimiter:
+    """Caps concurrent sockets and connect rate against a single host."""
+
+    def __init__(self, concurrency, rate):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        if self.interval:
+            async with self.lock:
+                now = time.monotonic()
+                delay = self.next_slot - now
+                self.next_slot = max(now, self.next_slot) + self.interval
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.semaphore.release()
+
+
+class PortScanner:
+    def __init__(self, ports=DEFAULT_PORTS, concurrency=CONCURRENCY, per_host=PER_HOST_CONCURRENCY,
+                 rate=PER_HOST_RATE, timeout=CONNECT_TIMEOUT, probe=True):
+        self.ports = ports
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.per_host = per_host
+        self.rate = rate
+        self.timeout = timeout
+        self.probe = probe
+
+    async def identify(self, reader, writer, ip, port):
+        """Tell HomeKit (HTTP, answers 470/4xx) apart from MRP/Companion (binary) on dynamic ports."""
+        if port in KNOWN_PORTS:
+            return KNOWN_PORTS[port]
+        if not self.probe:
+            return 'dynamic'
+        try:
+            writer.write(f'GET /accessories HTTP/1.1\r\nHost: {ip}\r\n\r\n'.encode())
+            await writer.drain()
+            line = await asyncio.wait_for(reader.readline(), timeout=PROBE_TIMEOUT)
+        except (asyncio.TimeoutError, OSError):
+            return 'mrp'
+        if line.startswith(b'HTTP/1.1 470') or line.startswith(b'HTTP/1.1 4'):
+            return 'hap'
+        return 'mrp' if not line else 'http'
+
+    async def check(self, ip, port, limiter):
+        # Host limit first: a probe waiting on its host's pacing must not hold a global slot
+        async with limiter, self.semaphore:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout=self.timeout)
+            except (asyncio.TimeoutError, OSError):
+                return None
+            try:
+                return port, await self.identify(reader, writer, ip, port)
+            finally:
+                writer.close()
+                try:
+                    await writer.wait_closed()
+                except OSError:
+                    pass
+
+    async def scan_host(self, ip):
+        limiter = HostLimiter(self.per_host, self.rate)
+        results = await asyncio.gather(*(self.check(ip, port, limiter) for port in self.ports))
+        services = dict(r for r in results if r)
+        if not services:
+            return None
+        return {
+            'ip': ip,
+            'ports': [{'port': p, 'service': s} for p, s in sorted(services.items())],
+            'kind': classify(services),
+        }
+
+    async def scan(self, hosts, on_result):
+        async def run(ip):
+            result = await self.scan_host(ip)
+            if result:
+                on_result(result)
+        await asyncio.gather(*(run(ip) for ip in hosts))
 
-async def scan_port(port):
-    conn = asyncio.open_connection(target_ip, port)
-    try:
-        reader, writer = await asyncio.wait_for(conn, timeout=0.5)
-        print(f"Port {port} is OPEN")
-        writer.close()
-        await writer.wait_closed()
-    except:
-        pass
 
 async def main():
-    print(f"Scanning {target_ip}...")
-    # Scan common ranges
-    tasks = []
-    # Common Apple TV ports
-    ports_to_scan = [3689, 5000, 7000, 7100, 49152, 49153, 49154, 49155, 49156, 49157, 49158, 49159, 49160]
-    
-    # Add a wider range
-    ports_to_scan.extend(range(49152, 49200))
-    
-    # Remove duplicates
-    ports_to_scan = sorted(list(set(ports_to_scan)))
-
-    for port in ports_to_scan:
-        await scan_port(port)
+    parser = argparse.ArgumentParser(description='Concurrent port/service inventory scanner')
+    parser.add_argument('targets', nargs='+', help='IP addresses or CIDR ranges (e.g. 192.168.0.0/24)')
+    parser.add_argument('--ports', help='Comma separated ports or ranges (default: known device ports)')
+    parser.add_argument('--concurrency', type=int, default=CONCURRENCY)
+    parser.add_argument('--per-host', type=int, default=PER_HOST_CONCURRENCY)
+    parser.add_argument('--rate', type=float, default=PER_HOST_RATE, help='Connects per second per host')
+    parser.add_argument('--timeout', type=float, default=CONNECT_TIMEOUT)
+    parser.add_argument('--no-probe', action='store_true', help='Skip the HTTP probe on dynamic ports')
+    parser.add_argument('--json', action='store_true', help='Emit one JSON object per host')
+    args = parser.parse_args()
+
+    hosts = expand_targets(args.targets)
+    ports = parse_ports(args.ports) if args.ports else DEFAULT_PORTS
+    scanner = PortScanner(ports, args.concurrency, args.per_host, args.rate, args.timeout, not args.no_probe)
+
+    def on_result(result):
+        if args.json:
+            print(json.dumps(result), flush=True)
+        else:
+            for entry in result['ports']:
+                print(f"{result['ip']} Port {entry['port']} is OPEN ({entry['service']})")
+
+    if not args.json:
+        print(f"Scanning {len(hosts)} host(s), {len(ports)} port(s) each...")
+    started = time.monotonic()
+    await scanner.scan(hosts, on_result)
+    elapsed = round(time.monotonic() - started, 2)
+    if args.json:
+        print(json.dumps({'type': 'summary', 'hosts': len(hosts), 'ports': len(ports), 'elapsed': elapsed}), flush=True)
+    else:
+        print(f"Done in {elapsed}s")
 
 if __name__ == '__main__':
-    asyncio.run(main())
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        sys.exit(130)
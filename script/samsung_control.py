@@ -1,28 +1,75 @@
 import sys
 import json
 import os
+import socket
 import logging
-from samsungtvws import SamsungTVWS
+
+from credential_store import get_store
+from paths import data_path
+from samsung_probe import probe, remember_port
 
 # Suppress logs
 logging.basicConfig(level=logging.CRITICAL)
 
-TOKEN_FILE = os.path.join(os.path.dirname(__file__), '../samsung-tokens.json')
+CONTROL_FILE = data_path('bridge-control.json')
+
+# A running bridge answers locally; anything slower means it is gone or stuck.
+BRIDGE_CONNECT_TIMEOUT = 0.5
+BRIDGE_REPLY_TIMEOUT = 6.0
+
+def send_via_bridge(ip, key):
+    """Hand the key to a connected session in a running bridge.
+
+    Returns the session's reply, or None when no bridge (or no session for
+    this TV) is available and the caller should connect itself.
+    """
+    try:
+        with open(CONTROL_FILE, 'r') as f:
+            control = json.load(f)
+        sock = socket.create_connection(('127.0.0.1', control['port']), timeout=BRIDGE_CONNECT_TIMEOUT)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    request = {"token": control.get('token'), "device": f"samsung:{ip}", "command": "key", "value": key}
+    try:
+        with sock:
+            sock.settimeout(BRIDGE_REPLY_TIMEOUT)
+            sock.sendall((json.dumps(request) + '\n').encode())
+            line = sock.makefile('r').readline()
+        reply = json.loads(line)
+    except (OSError, ValueError):
+        return None
+    if reply.get('type') in ('unknown_device', 'unauthorized'):
+        return None
+    return reply
 
-def load_tokens():
-    if os.path.exists(TOKEN_FILE):
-        try:
-            with open(TOKEN_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def send_direct(ip, key):
+    """Cold path: probe (cached) and open a websocket of our own."""
+    info = probe(ip)
+    if not info.get('tizen'):
+        # If API is not accessible, it's likely a legacy TV (Orchestrator)
+        # Fail here so deviceManager falls back to samsung-remote
+        raise Exception("Not a Tizen TV (API unreachable)")
 
-def save_token(ip, token):
-    tokens = load_tokens()
-    tokens[ip] = token
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump(tokens, f)
+    from samsungtvws import SamsungTVWS
+
+    tokens = get_store('samsung')
+    token = tokens.get(ip)
+    port = info.get('port') or 8002
+    # Pairing needs time for the user to click Allow; a known token does not
+    tv = SamsungTVWS(host=ip, port=port, token=token, name='DelovaHome', timeout=10 if token else 30)
+
+    # Open connection explicitly
+    tv.open()
+
+    # Save token if we got a new one
+    if tv.token and tv.token != token:
+        tokens.put(ip, tv.token)
+    remember_port(ip, port)
+
+    # Send key
+    tv.send_key(key)
+    tv.close()
 
 def main():
     if len(sys.argv) < 3:
@@ -32,48 +79,15 @@ def main():
     ip = sys.argv[1]
     key = sys.argv[2]
 
-    tokens = load_tokens()
-    token = tokens.get(ip)
+    reply = send_via_bridge(ip, key)
+    if reply is not None and reply.get('status') == 'sent':
+        print(json.dumps({"status": "success", "key": key, "via": "bridge"}), flush=True)
+        return
+    # A dropped or failed key gets one more try over a connection of our own
 
     try:
-        # Check if it's actually a Tizen TV by querying the API
-        # This prevents false positives where port 8002 is open but not for control
-        try:
-            import requests
-            # Try HTTP (8001) and HTTPS (8002)
-            is_tizen = False
-            try:
-                requests.get(f'http://{ip}:8001/api/v2/', timeout=2)
-                is_tizen = True
-            except:
-                try:
-                    requests.get(f'https://{ip}:8002/api/v2/', timeout=2, verify=False)
-                    is_tizen = True
-                except:
-                    pass
-            
-            if not is_tizen:
-                # If API is not accessible, it's likely a legacy TV (Orchestrator)
-                # Fail here so deviceManager falls back to samsung-remote
-                raise Exception("Not a Tizen TV (API unreachable)")
-        except ImportError:
-            pass # requests not installed? ignore check
-
-        # Increase timeout for initial pairing
-        tv = SamsungTVWS(host=ip, port=8002, token=token, name='DelovaHome', timeout=30)
-        
-        # Open connection explicitly
-        tv.open()
-        
-        # Save token if we got a new one
-        if tv.token and tv.token != token:
-            save_token(ip, tv.token)
-            
-        # Send key
-        tv.send_key(key)
-        
+        send_direct(ip, key)
         print(json.dumps({"status": "success", "key": key}), flush=True)
-        
     except Exception as e:
         print(json.dumps({"error": str(e)}), flush=True)
         sys.exit(1)
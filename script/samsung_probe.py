@@ -0,0 +1,110 @@
+import json
+import os
+import socket
+import time
+import warnings
+
+from paths import data_path
+
+# Suppress urllib3/ssl warnings from the unverified HTTPS probe
+warnings.filterwarnings("ignore", module='urllib3')
+
+PROBE_CACHE_FILE = data_path('samsung-probe-cache.json')
+
+# A positive answer (Tizen API or legacy remote port) is re-checked daily.
+PROBE_TTL = 24 * 3600
+
+# Nothing answering usually means the TV is off, so that verdict is only
+# trusted briefly.
+UNREACHABLE_TTL = 300
+
+PROBE_TIMEOUT = 2
+
+# Pre-Tizen (Orsay) TVs only expose the old remote protocol on this port
+LEGACY_PORT = 55000
+
+
+def load_probe_cache():
+    if not os.path.exists(PROBE_CACHE_FILE):
+        return {}
+    try:
+        with open(PROBE_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_probe_result(ip, entry):
+    cache = load_probe_cache()
+    cache[ip] = entry
+    tmp = PROBE_CACHE_FILE + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(cache, f, indent=2)
+    os.replace(tmp, PROBE_CACHE_FILE)
+
+
+def cached_probe(ip):
+    """Return the cached probe entry for an IP while it is still fresh, else None."""
+    entry = load_probe_cache().get(ip)
+    if not entry:
+        return None
+    ttl = PROBE_TTL if entry.get('tizen') or entry.get('legacy') else UNREACHABLE_TTL
+    if time.time() - entry.get('probed_at', 0) > ttl:
+        return None
+    return entry
+
+
+def remember_port(ip, port):
+    """Record the websocket port a live session actually connected on."""
+    entry = load_probe_cache().get(ip) or {}
+    if entry.get('tizen') and entry.get('port') == port:
+        return
+    entry.update({'tizen': True, 'port': port, 'probed_at': time.time()})
+    save_probe_result(ip, entry)
+
+
+def probe(ip, use_cache=True):
+    """Find out whether a Samsung TV speaks the Tizen websocket API.
+
+    Queries ``/api/v2/`` over HTTP (8001) and HTTPS (8002) and caches the
+    verdict, the preferred websocket port and the model details per IP.
+    ``legacy`` is only set when the API is missing but the old remote port
+    answers, which tells a pre-Tizen set apart from one that is off.
+    """
+    if use_cache:
+        entry = cached_probe(ip)
+        if entry:
+            return entry
+
+    import requests
+
+    entry = {'tizen': False, 'port': None, 'probed_at': time.time()}
+    for url in (f'http://{ip}:8001/api/v2/', f'https://{ip}:8002/api/v2/'):
+        try:
+            resp = requests.get(url, timeout=PROBE_TIMEOUT, verify=False)
+        except Exception:
+            continue
+        entry['tizen'] = True
+        try:
+            device = resp.json().get('device', {})
+        except ValueError:
+            device = {}
+        # TokenAuthSupport TVs only accept remote control on the secure port
+        entry['port'] = 8002 if str(device.get('TokenAuthSupport', 'true')).lower() == 'true' else 8001
+        entry['model'] = device.get('modelName')
+        entry['name'] = device.get('name')
+        entry['os'] = device.get('OS')
+        break
+
+    if not entry['tizen']:
+        try:
+            socket.create_connection((ip, LEGACY_PORT), timeout=PROBE_TIMEOUT).close()
+            entry['legacy'] = True
+        except OSError:
+            entry['legacy'] = False
+
+    try:
+        save_probe_result(ip, entry)
+    except OSError:
+        pass
+    return entry
@@ -1,142 +1,396 @@
+import asyncio
 import sys
 import json
 import os
 import time
-import socket
-
-# Early print to debug startup
-print(json.dumps({"status": "debug", "message": "Service starting..."}), flush=True)
 
+SAMSUNGTVWS_IMPORT_ERROR = None
 try:
-    from samsungtvws import SamsungTVWS
+    from samsungtvws.async_remote import SamsungTVWSAsyncRemote
+    from samsungtvws.remote import SendRemoteKey
 except ImportError as e:
-    print(json.dumps({"error": f"Import failed: {e}", "type": "import_error"}), flush=True)
-    sys.exit(1)
+    SAMSUNGTVWS_IMPORT_ERROR = e
 
 import logging
 # Suppress logs
 logging.basicConfig(level=logging.CRITICAL)
 
-TOKEN_FILE = os.path.join(os.path.dirname(__file__), '../samsung-tokens.json')
+from bridge_host import run_single
+from ipc import log, write_message
+from key_hold import KeyHold
+from credential_store import get_store
+from samsung_probe import cached_probe, probe, remember_port
+from macros import handle_macro_command
+from metrics import SessionMetrics
+from supervisor import ConnectionLost, DeviceError, NotConnected, NotSupported, ReconnectSupervisor, classify
 
-def load_tokens():
-    if os.path.exists(TOKEN_FILE):
-        try:
-            with open(TOKEN_FILE, 'r') as f:
-                return json.load(f)
-        except:
-            return {}
-    return {}
+def load_token(ip):
+    return get_store('samsung').get(ip)
 
 def save_token(ip, token):
-    tokens = load_tokens()
-    tokens[ip] = token
-    with open(TOKEN_FILE, 'w') as f:
-        json.dump(tokens, f)
+    get_store('samsung').put(ip, token)
 
-def main():
-    if len(sys.argv) < 2:
-        print(json.dumps({"error": "Usage: python samsung_service.py <ip>"}), flush=True)
-        sys.exit(1)
+# A keypress older than this is dropped instead of being replayed late
+KEY_DEADLINE = 2.0
 
-    ip = sys.argv[1]
-    tv = None
-    cached_port = None
-    
-    def connect():
-        nonlocal tv, cached_port
-        tokens = load_tokens()
-        token = tokens.get(ip)
-        
-        print(json.dumps({"status": "debug", "message": f"Token loaded for {ip}: {token}"}), flush=True)
+# Steps of a sequence wait longer, since the rest of the sequence depends on them
+STEP_DEADLINE = 5.0
+
+# Keys are paced by the session host (see bridge_host.COALESCE) instead of
+# samsungtvws sleeping a full second after every key it sends.
+KEY_INTERVAL = 0.3
+
+# Connect timeouts: a paired TV starts at FAST_CONNECT_TIMEOUT per port and
+# then follows its measured connect latency; an unpaired TV needs time for
+# the user to accept the on-screen prompt.
+FAST_CONNECT_TIMEOUT = 5
+PAIRING_CONNECT_TIMEOUT = 20
+CONNECT_TIMEOUT_FLOOR = 2.0
+
+# State polling of the /api/v2/ endpoint: reachable TVs every POLL_INTERVAL,
+# unreachable ones back off exponentially up to POLL_MAX_INTERVAL.
+POLL_INTERVAL = 10.0
+POLL_MAX_INTERVAL = 120.0
+POLL_TIMEOUT = 2.0
+
+class SamsungStatePoller:
+    """Polls the REST API of every registered Samsung TV from one loop.
+
+    All TVs share a single aiohttp session, so keep-alive connections are
+    reused between rounds, and due TVs are polled concurrently. Each target
+    only hears a ``status`` message when its state actually changes.
+    """
+
+    def __init__(self):
+        self.targets = {}
+        self.http = None
+        self.task = None
+
+    def register(self, ip, emit, metrics=None):
+        self.targets[ip] = {'emit': emit, 'last': None, 'due': 0.0, 'interval': POLL_INTERVAL, 'url': None,
+                            'metrics': metrics or SessionMetrics()}
+        if self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def unregister(self, ip):
+        self.targets.pop(ip, None)
+        if not self.targets and self.task:
+            self.task.cancel()
+            self.task = None
+            if self.http:
+                await self.http.close()
+                self.http = None
+
+    async def run(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            for target in self.targets.values():
+                target['emit']({"status": "debug", "message": f"State polling disabled: {e}"})
+            self.task = None
+            return
+        if self.http is None:
+            self.http = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(ssl=False, limit=32),
+                timeout=aiohttp.ClientTimeout(total=POLL_TIMEOUT))
+        while True:
+            now = time.monotonic()
+            due = [ip for ip, t in self.targets.items() if t['due'] <= now]
+            if due:
+                await asyncio.gather(*(self.poll(ip) for ip in due), return_exceptions=True)
+            await asyncio.sleep(1.0)
+
+    async def fetch(self, target, ip):
+        urls = [f'http://{ip}:8001/api/v2/', f'https://{ip}:8002/api/v2/']
+        if target['url'] in urls:
+            urls.remove(target['url'])
+            urls.insert(0, target['url'])
+        for url in urls:
+            try:
+                async with self.http.get(url) as resp:
+                    data = await resp.json(content_type=None)
+                target['url'] = url
+                return data
+            except Exception:
+                continue
+        return None
+
+    async def poll(self, ip):
+        target = self.targets.get(ip)
+        if target is None:
+            return
+        started = time.monotonic()
+        data = await self.fetch(target, ip)
+        if data is None:
+            target['metrics'].count('status_fetch_failures')
+            status = {'on': False, 'power_state': 'unreachable'}
+            target['interval'] = min(target['interval'] * 2, POLL_MAX_INTERVAL)
+        else:
+            device = data.get('device') or {}
+            # Older Tizen firmware has no PowerState; answering at all means it is on
+            power = (device.get('PowerState') or 'on').lower()
+            status = {
+                'on': power == 'on',
+                'power_state': power,
+                'model': device.get('modelName'),
+                'name': device.get('name'),
+                'network_type': device.get('networkType'),
+            }
+            target['interval'] = POLL_INTERVAL
+            target['metrics'].observe('status_fetch', time.monotonic() - started)
+        target['due'] = time.monotonic() + target['interval']
+        if status != target['last']:
+            target['last'] = status
+            target['emit']({"type": "status", "data": status})
+
+_poller = None
+
+def get_poller():
+    """Process-wide poller shared by every Samsung session in the bridge."""
+    global _poller
+    if _poller is None:
+        _poller = SamsungStatePoller()
+    return _poller
+
+class SamsungSession:
+    """Persistent async websocket remote for one Samsung TV.
+
+    Keys go through an outbound queue drained by a single sender task, and
+    each key request completes once its key was sent or dropped. Reconnects
+    run in the background (see ReconnectSupervisor) and every key carries a
+    deadline; keys that expire while the TV is unreachable are dropped rather
+    than replayed late, and once the TV failed repeatedly they are dropped at
+    once until the next reconnect attempt is due. ``hold_start``/``hold_end``
+    send a key's Press and Release events through the same queue.
+    """
+
+    command_interval = KEY_INTERVAL
+    # Bursts of the same key arrive as one request with a repeat count
+    accepts_repeat = True
+
+    def __init__(self, ip, emit):
+        self.ip = ip
+        self.emit = emit
+        self.tv = None
+        # Start from the port the last probe or session found working
+        self.cached_port = (cached_probe(ip) or {}).get('port')
+        self.outbox = asyncio.Queue()
+        self.sender_task = None
+        self.closing = set()
+        # Only retries while keys are waiting; the poller covers state otherwise
+        self.metrics = SessionMetrics()
+        self.supervisor = ReconnectSupervisor(
+            self.connect, emit, persistent=False, metrics=self.metrics,
+            timeouts={'connect': (FAST_CONNECT_TIMEOUT, CONNECT_TIMEOUT_FLOOR, PAIRING_CONNECT_TIMEOUT)})
+        # The TV repeats a pressed key itself until it sees the release
+        self.hold = KeyHold(lambda key: self.send_key(key, KEY_DEADLINE, 'press'),
+                            lambda key: self.send_key(key, KEY_DEADLINE, 'release'))
+
+    async def start(self):
+        self.sender_task = asyncio.create_task(self.sender())
+        get_poller().register(self.ip, self.emit, self.metrics)
+        # Connect up front only for paired TVs; an unpaired one would show the
+        # Allow prompt just because the dashboard is watching its state.
+        self.supervisor.start(connect_now=bool(load_token(self.ip)))
+
+    async def close(self):
+        self.hold.close()
+        if self.sender_task:
+            self.sender_task.cancel()
+        for task in self.closing:
+            task.cancel()
+        await self.supervisor.close()
+        await get_poller().unregister(self.ip)
+        await self.disconnect()
+
+    async def disconnect(self):
+        self.supervisor.up.clear()
+        tv, self.tv = self.tv, None
+        if tv:
+            await self.close_remote(tv)
+
+    async def connect(self):
+        """One connect attempt over both ports. Returns True, or raises a typed error."""
+        token = load_token(self.ip)
+
+        self.emit({"status": "debug", "message": f"Token loaded for {self.ip}: {'yes' if token else 'no'}"})
 
         # If we found a working port before, prioritize it
         ports = [8002, 8001]
-        if cached_port == 8001:
+        if self.cached_port == 8001:
             ports = [8001, 8002]
 
-        print(json.dumps({"status": "debug", "message": f"Connecting to {ip}..."}), flush=True)
+        self.emit({"status": "debug", "message": f"Connecting to {self.ip}..."})
 
         for port in ports:
+            # A paired TV answers quickly on either port, so both get the
+            # measured timeout; pairing needs time for the user to click Allow.
+            t_out = self.supervisor.timeout('connect') if token else PAIRING_CONNECT_TIMEOUT
+            tv = SamsungTVWSAsyncRemote(host=self.ip, port=port, token=token, name='DelovaHome', timeout=t_out)
             try:
-                # Reduced timeout for snappier UI response, but enough for pairing
-                # If cached_port is set, we expect it to work instantly.
-                # If pairing (token invalid), we need more time for user to click Allow
-                t_out = 5 if cached_port == port else 20 
-                
-                # Try Port
-                tv = SamsungTVWS(host=ip, port=port, token=token, name='DelovaHome', timeout=t_out)
-                tv.open()
-                
-                print(json.dumps({"status": "debug", "message": f"Connected. Current token: {tv.token}"}), flush=True)
-
-                if tv.token:
-                    if tv.token != token:
-                        print(json.dumps({"status": "debug", "message": "Saving new token..."}), flush=True)
-                        save_token(ip, tv.token)
-
-                print(json.dumps({"status": "connected", "ip": ip, "port": port}), flush=True)
-                cached_port = port
-                return True
+                await self.supervisor.timed(tv.open(), 'connect', timeout=t_out + 1, record=bool(token))
             except Exception as e:
-                 # Only log detailed debug if we are struggling
-                 print(json.dumps({"status": "debug", "message": f"Port {port} failed: {e}"}), flush=True)
-                 pass
-        
-        print(json.dumps({"error": "Connection failed on both ports", "type": "connection_error"}), flush=True)
-        tv = None
-        return False
-
-    # Initial connection
-    connect()
-
-    # Read stdin
-    while True:
-        try:
-            line = sys.stdin.readline()
-            if not line:
-                break
-            
-            line = line.strip()
-            if not line:
+                # Only log detailed debug if we are struggling
+                self.emit({"status": "debug", "message": f"Port {port} failed: {e}"})
+                await self.close_remote(tv)
                 continue
 
+            self.emit({"status": "debug", "message": f"Connected. Token: {'yes' if tv.token else 'no'}"})
+            if tv.token and tv.token != token:
+                self.emit({"status": "debug", "message": "Saving new token..."})
+                save_token(self.ip, tv.token)
+
+            self.tv = tv
+            self.cached_port = port
+            self.emit({"status": "connected", "ip": self.ip, "port": port})
             try:
-                cmd_data = json.loads(line)
-            except:
+                remember_port(self.ip, port)
+            except OSError:
+                pass
+            return True
+
+        # Tell a pre-Tizen set (no websocket API at all) apart from one that is just off
+        try:
+            info = await asyncio.get_running_loop().run_in_executor(None, lambda: probe(self.ip, use_cache=False))
+        except Exception:
+            info = {}
+        if info.get('legacy'):
+            self.emit({"error": "legacy_detected", "type": "legacy_detected"})
+            raise NotSupported("Pre-Tizen TV without the websocket API")
+        # Reported once per outage by the supervisor's link events
+        raise NotConnected("Connection failed on both ports")
+
+    def link_lost(self):
+        # Detach the dead socket now so a reconnect that lands before the
+        # close task runs is never closed by mistake.
+        tv, self.tv = self.tv, None
+        if tv:
+            task = asyncio.create_task(self.close_remote(tv))
+            self.closing.add(task)
+            task.add_done_callback(self.closing.discard)
+        self.supervisor.link_lost()
+
+    async def close_remote(self, tv):
+        try:
+            await tv.close()
+        except Exception:
+            pass
+
+    async def deliver(self, key, deadline, action='click'):
+        """Send one key event (``click``, ``press`` or ``release``), reconnecting as needed.
+
+        Returns False if the deadline passed first.
+
+        Raises DeviceUnavailable at once while the TV's circuit is open.
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+
+            if self.supervisor.up.is_set() and not (self.tv and self.tv.is_alive()):
+                self.link_lost()
+            if not self.supervisor.up.is_set():
+                if not await self.supervisor.wait_up(remaining):
+                    continue
+                remaining = deadline - time.monotonic()
+
+            try:
+                await self.supervisor.timed(self.tv.send_command(getattr(SendRemoteKey, action)(key), key_press_delay=0),
+                                            timeout=min(remaining, self.supervisor.timeout()), label='key')
+                return True
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Force a background reconnect; the key is retried while its deadline allows
+                error = classify(e) or ConnectionLost(str(e))
+                self.emit(error.to_message())
+                self.link_lost()
+
+    async def sender(self):
+        while True:
+            key, deadline, result, action = await self.outbox.get()
+            if result.done():
+                # The request already gave up (timeout or shutdown)
+                continue
+            try:
+                sent = await self.deliver(key, deadline, action)
+            except DeviceError as e:
+                if not result.done():
+                    result.set_exception(e)
                 continue
+            if not result.done():
+                result.set_result(sent)
+
+    async def run_step(self, command, value):
+        """One step of a sequence or macro: ``key`` with a value, or a bare KEY_* name."""
+        key = value if command == 'key' else command
+        if not await self.deliver(key, time.monotonic() + STEP_DEADLINE):
+            raise TimeoutError(f"Could not send {key}")
+
+    async def handle(self, req):
+        command = req.get('command')
+
+        if await handle_macro_command(self.run_step, self.emit, req):
+            return
+
+        if await self.hold.handle(req):
+            return
+
+        if command == 'key':
+            # A coalesced burst goes out back to back; once one key is dropped the rest are stale too
+            deadline = float(req.get('deadline') or KEY_DEADLINE)
+            for _ in range(int(req.get('repeat') or 1)):
+                if not await self.send_key(req.get('value'), deadline, received=req.get('received')):
+                    break
+
+    async def send_key(self, key, deadline, action='click', received=None):
+        """Queue one key event behind the keys already waiting and report how it went.
+
+        ``deadline`` counts from ``received``, when the request reached the
+        bridge (see SessionHost), so time spent queued or paced counts too.
+        """
+        result = asyncio.get_running_loop().create_future()
+        self.outbox.put_nowait((key, (received or time.monotonic()) + deadline, result, action))
+        try:
+            sent = await result
+        except DeviceError as e:
+            self.metrics.count('dropped', e.type)
+            self.emit({"status": "dropped", "key": key, "reason": e.type,
+                       "retry_in": None if e.retry_in is None else round(e.retry_in, 1)})
+            return False
+        if sent:
+            msg = {"status": "sent", "key": key}
+            if action != 'click':
+                msg['action'] = action
+            self.emit(msg)
+        else:
+            self.metrics.count('dropped', 'expired')
+            self.emit({"status": "dropped", "key": key, "reason": "expired"})
+        return sent
+
+def create_session(ip, emit):
+    """Build a session for the bridge. Raises ImportError when samsungtvws is missing."""
+    if SAMSUNGTVWS_IMPORT_ERROR:
+        raise SAMSUNGTVWS_IMPORT_ERROR
+    return SamsungSession(ip, emit)
+
+def main():
+    if SAMSUNGTVWS_IMPORT_ERROR:
+        write_message({"error": f"Import failed: {SAMSUNGTVWS_IMPORT_ERROR}", "type": "import_error"})
+        sys.exit(1)
+
+    if len(sys.argv) < 2:
+        write_message({"error": "Usage: python samsung_service.py <ip>"})
+        sys.exit(1)
+
+    ip = sys.argv[1]
+    log('debug', 'Service starting...', ip=ip)
 
-            command = cmd_data.get('command')
-            
-            if command == 'key':
-                key = cmd_data.get('value')
-                
-                if not tv:
-                    if not connect():
-                        # Failed to connect. 
-                        # If it was flagged as legacy, or connection refused, report failure
-                        print(json.dumps({"status": "failed", "key": key, "reason": "connection_failed"}), flush=True)
-                        continue
-                
-                try:
-                    tv.send_key(key)
-                    print(json.dumps({"status": "sent", "key": key}), flush=True)
-                except Exception as e:
-                    print(json.dumps({"error": str(e), "type": "send_error"}), flush=True)
-                    tv = None # Force reconnect next time
-                    # Try immediate reconnect?
-                    if connect():
-                        try:
-                            tv.send_key(key)
-                            print(json.dumps({"status": "sent", "key": key}), flush=True)
-                        except:
-                            print(json.dumps({"status": "failed", "key": key}), flush=True)
-
-        except KeyboardInterrupt:
-            break
-        except Exception as e:
-            print(json.dumps({"error": f"Loop error: {e}"}), flush=True)
-            break
+    try:
+        asyncio.run(run_single(lambda emit: SamsungSession(ip, emit)))
+    except KeyboardInterrupt:
+        pass
 
 if __name__ == '__main__':
     main()
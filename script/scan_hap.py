@@ -1,29 +1,20 @@
 import asyncio
 import logging
 from aiohomekit.controller import Controller
-from zeroconf.asyncio import AsyncZeroconf, AsyncServiceBrowser
 
-# logging.basicConfig(level=logging.DEBUG)
+from discovery_registry import get_registry
 
-def on_service_state_change(zeroconf, service_type, name, state_change):
-    # Dummy handler
-    pass
+# logging.basicConfig(level=logging.DEBUG)
 
 async def main():
     try:
-        aio_zeroconf = AsyncZeroconf()
-        
-        # Start browsing for HomeKit services
-        browser = AsyncServiceBrowser(
-             aio_zeroconf.zeroconf, 
-             ["_hap._tcp.local.", "_hap._udp.local."], 
-             handlers=[on_service_state_change]
-        )
+        # The shared registry already browses _hap._tcp on its AsyncZeroconf instance
+        registry = await get_registry()
         
         # Give browser time to spin up
         await asyncio.sleep(2)
         
-        controller = Controller(async_zeroconf_instance=aio_zeroconf)
+        controller = Controller(async_zeroconf_instance=registry.aiozc)
         await controller.async_start()
         
         print(f"Controller properties: {dir(controller)}")
@@ -53,8 +44,8 @@ async def main():
     finally:
         if 'controller' in locals():
             await controller.async_stop()
-        if 'aio_zeroconf' in locals():
-            await aio_zeroconf.async_close()
+        if 'registry' in locals():
+            await registry.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
@@ -1,16 +1,23 @@
 import asyncio
 import sys
-from pyatv import scan
-from pyatv.const import Protocol
+
+from discovery_registry import get_registry
+
+# How long to listen for mDNS announcements before printing
+BROWSE_SECONDS = 3.0
 
 async def main():
     print("Scanning for devices...")
-    atvs = await scan(loop=asyncio.get_event_loop())
+    registry = await get_registry()
+    try:
+        await asyncio.sleep(BROWSE_SECONDS)
 
-    for atv in atvs:
-        print(f"Device: {atv.name} ({atv.address})")
-        for service in atv.services:
-            print(f"  - Protocol: {service.protocol}, Port: {service.port}")
+        for device in registry.records():
+            print(f"Device: {device['name']} ({', '.join(device['addresses'])})")
+            for service_type, service in device['services'].items():
+                print(f"  - Service: {service_type}, Port: {service['port']}")
+    finally:
+        await registry.close()
 
 if __name__ == '__main__':
     asyncio.run(main())
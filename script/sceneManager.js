@@ -323,6 +323,11 @@ class SceneManager extends EventEmitter {
                     } else {
                         console.warn(`[SceneManager] Check mappings: Device ID '${action.deviceId}' is unmapped or null.`);
                     }
+                } else if (action.type === 'group') {
+                    // { type: 'group', group: 'all_tvs', command: 'turn_off' }: every device at once
+                    const results = await deviceManager.controlGroup(action.group, action.command, action.value);
+                    const failed = Object.keys(results).filter(id => !results[id].ok);
+                    if (failed.length) console.warn(`[SceneManager] Group '${action.group}' failed on: ${failed.join(', ')}`);
                 } else if (action.type === 'system') {
                     await this.handleSystemAction(action);
                 } else if (action.type === 'delay') {
@@ -364,9 +369,7 @@ class SceneManager extends EventEmitter {
             d.state && d.state.on
         );
         console.log(`[SceneManager] Turning off ${lights.length} lights.`);
-        for (const l of lights) {
-            deviceManager.controlDevice(l.id, 'turn_off').catch(() => {});
-        }
+        await deviceManager.controlGroup(lights.map(l => l.id), 'turn_off');
     }
 
     getScenes() {
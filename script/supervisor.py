@@ -0,0 +1,295 @@
+import asyncio
+import random
+import time
+
+from flight_recorder import record as flight_record
+from metrics import SessionMetrics
+
+# Reconnect backoff bounds (seconds). Each delay is drawn with jitter so
+# sessions that lost their devices together do not retry in lockstep.
+BACKOFF_MIN = 1.0
+BACKOFF_MAX = 60.0
+
+# Consecutive failed connects before the circuit opens and commands fail fast
+FAILURE_THRESHOLD = 3
+
+# Adaptive timeouts per kind of operation: (default before any sample, floor, ceiling)
+TIMEOUTS = {
+    'connect': (10.0, 3.0, 20.0),
+    'command': (8.0, 3.0, 12.0),
+}
+
+
+class DeviceError(Exception):
+    """A device failure reported with a machine-readable ``type``.
+
+    Sessions raise these instead of formatting library messages, and the
+    session host turns them into ``{"error": ..., "type": ...}`` replies.
+    """
+
+    type = 'device_error'
+
+    def __init__(self, message, retry_in=None):
+        super().__init__(message)
+        self.retry_in = retry_in
+
+    def to_message(self):
+        msg = {'error': str(self), 'type': self.type}
+        if self.retry_in is not None:
+            msg['retry_in'] = round(self.retry_in, 1)
+        return msg
+
+
+class NotConnected(DeviceError):
+    type = 'not_connected'
+
+
+class DeviceUnavailable(DeviceError):
+    """The circuit is open: the device failed repeatedly and is not retried yet."""
+    type = 'unavailable'
+
+
+class ConnectionLost(DeviceError):
+    type = 'connection_lost'
+
+
+class DeviceTimeout(DeviceError):
+    type = 'timeout'
+
+
+class AuthRequired(DeviceError):
+    type = 'auth_required'
+
+
+class NotSupported(DeviceError):
+    type = 'not_supported'
+
+
+def classify(exc, mapping=()):
+    """Typed error for an exception, or None when it is not a device failure.
+
+    ``mapping`` holds ``(exception classes, DeviceError class)`` pairs for
+    library-specific exceptions and is checked before the generic ones.
+    """
+    if isinstance(exc, DeviceError):
+        return exc
+    for types, error in mapping:
+        if types and isinstance(exc, types):
+            return error(str(exc) or error.type)
+    if isinstance(exc, asyncio.TimeoutError):
+        return DeviceTimeout('Device did not answer in time')
+    if isinstance(exc, (ConnectionError, EOFError)):
+        return ConnectionLost(str(exc) or 'Connection lost')
+    return None
+
+
+class Backoff:
+    """Exponential backoff with jitter between ``minimum`` and ``maximum`` seconds."""
+
+    def __init__(self, minimum=BACKOFF_MIN, maximum=BACKOFF_MAX):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.attempt = 0
+
+    def next(self):
+        cap = min(self.maximum, self.minimum * 2 ** min(self.attempt, 16))
+        self.attempt += 1
+        return random.uniform(self.minimum, cap)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class LatencyEstimator:
+    """Smoothed latency and deviation for one kind of operation.
+
+    The timeout is the smoothed latency plus four deviations, the rule TCP
+    uses for its retransmission timer, clamped to ``[floor, ceiling]``.
+    """
+
+    def __init__(self, default, floor, ceiling):
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+        self.mean = None
+        self.deviation = None
+        self.samples = 0
+
+    def observe(self, seconds):
+        if self.mean is None:
+            self.mean = seconds
+            self.deviation = seconds / 2
+        else:
+            self.deviation = 0.75 * self.deviation + 0.25 * abs(self.mean - seconds)
+            self.mean = 0.875 * self.mean + 0.125 * seconds
+        self.samples += 1
+
+    def timeout(self):
+        if self.mean is None:
+            return self.default
+        return min(max(self.mean + 4 * self.deviation, self.floor), self.ceiling)
+
+
+class ReconnectSupervisor:
+    """Keeps one device link up from a background task.
+
+    ``connect`` is a coroutine function that returns True once the session is
+    connected; returning False or raising counts as a failed attempt. Failed
+    attempts are retried with jittered exponential backoff. After
+    ``failure_threshold`` failures in a row the circuit opens: ``wait_up``
+    fails fast with ``DeviceUnavailable`` until the next attempt is due,
+    instead of every command paying for its own failing connect.
+
+    With ``persistent`` the supervisor keeps retrying on its own; otherwise it
+    only retries while callers are waiting in ``wait_up`` and sleeps until the
+    next ``link_lost`` or ``wait_up`` call.
+
+    Connect times, device round trips, failed connects and reconnects are
+    recorded in ``metrics`` (the session's SessionMetrics).
+    """
+
+    def __init__(self, connect, emit, persistent=True, failure_threshold=FAILURE_THRESHOLD,
+                 backoff=None, timeouts=None, metrics=None):
+        self.connect = connect
+        self.emit = emit
+        self.metrics = metrics or SessionMetrics()
+        self.persistent = persistent
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff or Backoff()
+        self.latency = {kind: LatencyEstimator(*bounds) for kind, bounds in {**TIMEOUTS, **(timeouts or {})}.items()}
+        self.up = asyncio.Event()
+        self.wake = asyncio.Event()
+        self.failures = 0
+        self.open_until = 0.0
+        self.waiting = 0
+        self.last_error = None
+        self.lost = False
+        self.task = None
+
+    def start(self, connect_now=True):
+        self.task = asyncio.create_task(self.run())
+        if connect_now:
+            self.wake.set()
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self.task = None
+
+    @property
+    def is_open(self):
+        return self.open_until > time.monotonic()
+
+    def mark_up(self):
+        """Record a working link (also for connects made outside ``run``, e.g. after pairing)."""
+        if self.failures:
+            self.emit({"type": "link", "state": "up"})
+        if self.lost:
+            self.metrics.count('reconnects')
+            self.lost = False
+        self.failures = 0
+        self.open_until = 0.0
+        self.last_error = None
+        self.backoff.reset()
+        self.up.set()
+
+    def link_lost(self):
+        """The session noticed its link died; reconnect in the background."""
+        if self.up.is_set():
+            self.lost = True
+            self.metrics.count('link_lost')
+        self.up.clear()
+        self.wake.set()
+
+    def timeout(self, kind='command'):
+        return self.latency[kind].timeout()
+
+    async def timed(self, awaitable, kind='command', timeout=None, record=True, label=None):
+        """Await a device operation under the adaptive timeout for ``kind``.
+
+        Successful calls feed the latency estimate unless ``record`` is False
+        (used for calls that wait on a person, like pairing). Timeouts raise
+        ``DeviceTimeout`` and are not recorded: a device that is off says
+        nothing about how fast it answers when it is on. Every success is also
+        recorded in the ``rtt`` histogram under ``label`` (default: ``kind``).
+        """
+        estimator = self.latency[kind]
+        limit = estimator.timeout() if timeout is None else timeout
+        started = time.monotonic()
+        try:
+            result = await asyncio.wait_for(awaitable, timeout=limit)
+        except asyncio.TimeoutError:
+            self.metrics.count('timeouts', label or kind)
+            flight_record('device_call', {'operation': label or kind, 'timeout_s': round(limit, 2), 'ok': False})
+            raise DeviceTimeout(f'{kind.capitalize()} timed out after {limit:.1f}s')
+        except Exception as e:
+            flight_record('device_call', {'operation': label or kind, 'ok': False, 'error': str(e)[:120],
+                                          'elapsed_ms': round((time.monotonic() - started) * 1000, 1)})
+            raise
+        elapsed = time.monotonic() - started
+        if record:
+            estimator.observe(elapsed)
+        self.metrics.observe('rtt', elapsed, label or kind)
+        flight_record('device_call', {'operation': label or kind, 'ok': True, 'elapsed_ms': round(elapsed * 1000, 1)})
+        return result
+
+    async def wait_up(self, timeout):
+        """Wait up to ``timeout`` seconds for the link. Returns False if it did not come up.
+
+        Raises ``DeviceUnavailable`` at once while the circuit is open.
+        """
+        if self.up.is_set():
+            return True
+        remaining = self.open_until - time.monotonic()
+        if remaining > 0:
+            raise DeviceUnavailable(f'Device unreachable after {self.failures} attempts: {self.last_error or "no answer"}',
+                                    retry_in=remaining)
+        self.wake.set()
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self.up.wait(), timeout=max(timeout, 0))
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self.waiting -= 1
+
+    async def attempt(self):
+        started = time.monotonic()
+        try:
+            ok = bool(await self.connect())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.last_error = str(e)
+            ok = False
+        if ok:
+            self.metrics.observe('connect', time.monotonic() - started)
+        else:
+            self.metrics.count('connect_failures')
+        return ok
+
+    async def run(self):
+        while True:
+            await self.wake.wait()
+            self.wake.clear()
+            while not self.up.is_set():
+                if await self.attempt():
+                    self.mark_up()
+                    break
+                self.failures += 1
+                delay = self.backoff.next()
+                if self.failures == 1:
+                    self.emit({"type": "link", "state": "down", "error": self.last_error})
+                if self.failures >= self.failure_threshold:
+                    self.open_until = time.monotonic() + delay
+                    if self.failures == self.failure_threshold:
+                        self.emit({"type": "link", "state": "open", "failures": self.failures,
+                                   "retry_in": round(delay, 1), "error": self.last_error})
+                if not self.persistent and not self.waiting:
+                    break
+                await asyncio.sleep(delay)
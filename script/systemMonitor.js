@@ -1,9 +1,13 @@
 const os = require('os');
+const fs = require('fs');
 const { exec } = require('child_process');
 const mqttManager = require('./mqttManager');
 
 let isStarted = false;
 let updateInterval = null;
+// Prometheus text file written by the Python device bridge (see script/metrics.py)
+const BRIDGE_METRICS_FILE = process.env.DELOVA_BRIDGE_METRICS;
+
 let healthStatus = {
     status: 'ok', // ok, warning, critical
     issues: []
@@ -93,6 +97,9 @@ function start() {
                 charging: true
             };
 
+            const bridge = readBridgeMetrics();
+            if (bridge) payload.bridge = bridge;
+
             mqttManager.publish(`energy/devices/${deviceName}`, JSON.stringify(payload));
             // console.log(`[SystemMonitor] Reported: Power ${estimatedPower.toFixed(1)}W, CPU ${cpuPercent}%`);
         
@@ -112,6 +119,42 @@ function stop() {
     isStarted = false;
 }
 
+// Per-device totals from the bridge metrics file, or null when it is not enabled
+function readBridgeMetrics() {
+    if (!BRIDGE_METRICS_FILE) return null;
+    let text;
+    try {
+        text = fs.readFileSync(BRIDGE_METRICS_FILE, 'utf8');
+    } catch (e) {
+        return null;
+    }
+
+    const devices = {};
+    const device = (name) => devices[name] || (devices[name] = {
+        commands: 0, errors: 0, reconnects: 0, connect_failures: 0, command_seconds: 0
+    });
+    text.split('\n').forEach(line => {
+        const match = line.match(/^delova_bridge_(\w+)\{([^}]*)\} (\S+)$/);
+        if (!match) return;
+        const [, name, labels, value] = match;
+        const deviceLabel = labels.match(/device="([^"]*)"/);
+        if (!deviceLabel) return;
+        const stats = device(deviceLabel[1]);
+        const number = parseFloat(value);
+        if (name === 'commands_total') stats.commands += number;
+        else if (name === 'errors_total') stats.errors += number;
+        else if (name === 'reconnects_total') stats.reconnects += number;
+        else if (name === 'connect_failures_total') stats.connect_failures += number;
+        else if (name === 'command_seconds_sum') stats.command_seconds += number;
+    });
+
+    Object.values(devices).forEach(stats => {
+        stats.avg_command_ms = stats.commands ? Math.round(stats.command_seconds * 1000 / stats.commands) : null;
+        delete stats.command_seconds;
+    });
+    return devices;
+}
+
 function getCpuUsage() {
     return new Promise((resolve) => {
         const start = os.cpus();
@@ -190,4 +233,4 @@ function getDiskUsage() {
     });
 }
 
-module.exports = { start, stop };
+module.exports = { start, stop, readBridgeMetrics };
@@ -1617,6 +1617,35 @@ app.delete('/api/rooms/:id', (req, res) => {
   try{ roomsStore.deleteRoom(id); res.json({ ok:true }); }catch(e){ res.status(500).json({ ok:false }); }
 });
 
+// Device groups: named device lists that scenes and automations command at once
+app.get('/api/device-groups', (req, res) => {
+  res.json(deviceManager.getDeviceGroups());
+});
+
+app.put('/api/device-groups/:name', (req, res) => {
+  const { devices } = req.body || {};
+  if(!Array.isArray(devices)) return res.status(400).json({ ok:false, message:'Missing devices' });
+  try{ res.json({ ok:true, group: deviceManager.saveDeviceGroup(req.params.name, devices) }); }catch(e){ res.status(500).json({ ok:false }); }
+});
+
+app.delete('/api/device-groups/:name', (req, res) => {
+  try{ res.json({ ok: deviceManager.deleteDeviceGroup(req.params.name) }); }catch(e){ res.status(500).json({ ok:false }); }
+});
+
+app.post('/api/device-groups/:name/control', async (req, res) => {
+  const { command, value, concurrency, deadlineMs } = req.body || {};
+  if(!command) return res.status(400).json({ ok:false, message:'Missing command' });
+  try{
+    const results = await deviceManager.controlGroup(req.params.name, command, value, { concurrency, deadlineMs });
+    res.json({ ok:true, results });
+  }catch(e){ res.status(404).json({ ok:false, message: e.message }); }
+});
+
+// Bridge flight recorder: the recent command/device/event timeline of the Python bridge
+app.post('/api/bridge/flight-dump', async (req, res) => {
+  try{ res.json({ ok:true, ...(await deviceManager.dumpBridgeFlightRecorder()) }); }catch(e){ res.status(500).json({ ok:false, message: e.message }); }
+});
+
 app.get('/api/room-mapping', (req, res) => {
   try{ const map = roomsStore.getMap(); res.json(map); }catch(e){ res.status(500).json({}); }
 });
@@ -1998,6 +2027,30 @@ app.get('/api/camera/recordings', (req, res) => {
     }
 });
 
+// Now-playing artwork from the content-addressed cache written by the Python bridge
+app.get('/api/artwork/:key', (req, res) => {
+    const { key } = req.params;
+    if (!/^[0-9a-f]{32}$/.test(key)) return res.status(400).json({ error: 'Invalid artwork key' });
+
+    // Same directory as artwork_cache.py: paths.data_path(), which honours DELOVA_DATA_DIR
+    const artDir = path.join(path.resolve(process.env.DELOVA_DATA_DIR || __dirname), 'artwork-cache');
+    const size = req.query.size;
+    let file = null;
+    if (size === 'small' || size === 'medium') {
+        const thumb = path.join(artDir, `${key}_${size}.jpg`);
+        if (fs.existsSync(thumb)) file = thumb;
+    }
+    if (!file && fs.existsSync(artDir)) {
+        const original = fs.readdirSync(artDir).find(f => f.startsWith(`${key}.`) && !f.endsWith('.tmp'));
+        if (original) file = path.join(artDir, original);
+    }
+    if (!file) return res.status(404).json({ error: 'Artwork not found' });
+
+    // Keys are content hashes, so the bytes behind a URL never change
+    res.set('Cache-Control', 'public, max-age=31536000, immutable');
+    res.sendFile(file);
+});
+
 app.post('/api/devices/:id/command', async (req, res) => {
     const { id } = req.params;
     const { command, value } = req.body;